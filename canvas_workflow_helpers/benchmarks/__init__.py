@@ -0,0 +1,8 @@
+from .offline import captured_requests, offline_response
+from .replay import (format_report, load_protocols, percentile, read_events,
+                     replay_events)
+from .runner import (BENCHMARK_SETTINGS, DEFAULT_BASELINE, METRICS,
+                     MIN_DELTAS, PROTOCOLS_DIR, change_events,
+                     discover_protocols, find_regressions, format_results,
+                     load_baseline, measure, protocol_name, run_benchmarks,
+                     save_baseline, synthetic_patient)
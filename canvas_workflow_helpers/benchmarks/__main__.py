@@ -0,0 +1,61 @@
+"""
+Benchmark every protocol against synthetic patients and gate on regressions.
+
+    python -m canvas_workflow_helpers.benchmarks --update-baseline
+    python -m canvas_workflow_helpers.benchmarks --threshold 0.2
+
+Exits with status 1 when a protocol got slower or used more memory than its
+baseline allows, fails where it used to run, or has no baseline yet.
+"""
+import argparse
+import sys
+
+from pathlib import Path
+
+from canvas_workflow_helpers.synthetic import SIZES
+
+from .runner import (DEFAULT_BASELINE, PROTOCOLS_DIR, discover_protocols,
+                     find_regressions, format_results, load_baseline,
+                     run_benchmarks, save_baseline)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Benchmark compute_results of every protocol.')
+    parser.add_argument('--protocols',
+                        default='**/*.py',
+                        help='glob under the protocols directory')
+    parser.add_argument('--sizes',
+                        nargs='+',
+                        choices=sorted(SIZES),
+                        default=['small', 'medium', 'large'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.25,
+                        help='allowed relative growth, 0.25 is 25%%')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(discover_protocols(PROTOCOLS_DIR, args.protocols),
+                             sizes=args.sizes,
+                             repeat=args.repeat,
+                             seed=args.seed)
+    print(format_results(results))
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f'baseline written to {args.baseline}')
+        return 0
+
+    regressions = find_regressions(results, load_baseline(args.baseline),
+                                   args.threshold)
+    for name, size, metric, old, new in regressions:
+        print(f'REGRESSION {name} [{size}] {metric}: {old} -> {new}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
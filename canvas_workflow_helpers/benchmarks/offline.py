@@ -0,0 +1,39 @@
+"""
+Keep benchmarked protocols off the network.
+
+Protocols post webhooks and call FHIR through requests. While
+`captured_requests` is active every requests.Session.request call is
+recorded and, when offline, answered with an empty 200 JSON response
+instead of being sent.
+"""
+from contextlib import contextmanager
+from typing import List
+
+import requests
+
+
+def offline_response(method: str, url: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = b'{}'
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+@contextmanager
+def captured_requests(sent: List[str], offline: bool = True):
+    """ Count requests.Session.request calls, answering them when offline. """
+    original = requests.Session.request
+
+    def request(session, method, url, *args, **kwargs):
+        sent.append(f'{method.upper()} {url}')
+        if offline:
+            return offline_response(method, url)
+        return original(session, method, url, *args, **kwargs)
+
+    requests.Session.request = request
+    try:
+        yield
+    finally:
+        requests.Session.request = original
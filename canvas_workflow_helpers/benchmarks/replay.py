@@ -0,0 +1,233 @@
+"""
+Replay a recorded stream of change events against the protocols.
+
+Every line of the NDJSON input is one event:
+
+    {"change_type": "appointment",
+     "field_changes": {"model_name": "appointment", "fields": {...}, ...},
+     "patient": "patients/patient_00042"}
+
+`patient` is a patient dump directory (as written by
+canvas_workflow_helpers.synthetic), relative to the events file. Each event
+is dispatched to every protocol that would be recomputed for its change
+type, as ClinicalQualityMeasure.impacted_by_changes decides, either as fast
+as possible or at a fixed rate. The report has the events per second, the
+p50/p95/p99 latency of every protocol and the side effects they emitted:
+canvas updates, recommendations and HTTP requests (webhooks, FHIR calls).
+
+By default HTTP requests are not sent, they are counted and answered with
+an empty 200 response so a replay never reaches production services.
+
+    python -m canvas_workflow_helpers.benchmarks.replay events.ndjson \\
+        --protocols 'collective/*.py' --rate 50 --output replay.json
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.utils import load_local_patient
+
+from canvas_workflow_helpers.loader import load_protocol_class
+
+from .offline import captured_requests
+from .runner import PROTOCOLS_DIR, discover_protocols, protocol_name
+
+PERCENTILES = (50, 95, 99)
+
+
+def read_events(path: Path) -> Iterator[Dict]:
+    """ The events of an NDJSON file, with patient paths made absolute. """
+    path = Path(path)
+    with path.open('r') as fh:
+        for number, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError as error:
+                raise ValueError(f'{path}:{number}: {error}') from None
+            event['patient'] = str(path.parent / event['patient'])
+            yield event
+
+
+def load_protocols(paths: Iterable[Path],
+                   root: Path = PROTOCOLS_DIR) -> Tuple[Dict, Dict[str, str]]:
+    """ {name: protocol class} and {name: error} for the files that fail. """
+    protocols, errors = {}, {}
+    for path in paths:
+        name = protocol_name(path, root)
+        try:
+            protocols[name] = load_protocol_class(path)
+        except Exception as error:
+            errors[name] = repr(error)
+    return protocols, errors
+
+
+def impacted(protocol_class, change_type: Optional[str]) -> bool:
+    change_types = protocol_class._meta.compute_on_change_types
+    return not change_type or not change_types or change_type in change_types
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """ Nearest-rank percentile of a sorted list. """
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+class _PatientCache(object):
+    """ The last `size` patients loaded, so repeated snapshots load once. """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._patients: 'OrderedDict[str, Patient]' = OrderedDict()
+
+    def get(self, path: str) -> Patient:
+        patient = self._patients.pop(path, None)
+        if patient is None:
+            patient = load_local_patient(path)
+        self._patients[path] = patient
+        while len(self._patients) > self.size:
+            self._patients.popitem(last=False)
+        return patient
+
+
+def replay_events(events: Iterable[Dict],
+                  protocols: Dict[str, type],
+                  rate: Optional[float] = None,
+                  offline: bool = True,
+                  patient_cache_size: int = 128,
+                  clock: Callable[[], float] = time.perf_counter,
+                  sleep: Callable[[float], None] = time.sleep) -> Dict:
+    """
+    Evaluate every impacted protocol for every event. With `rate`, event
+    number n is not started before n / rate seconds into the replay.
+    Latencies cover constructing the protocol and compute_results, not
+    loading the patient.
+    """
+    patients = _PatientCache(patient_cache_size)
+    latencies: Dict[str, List[float]] = {name: [] for name in protocols}
+    stats = {
+        name: {
+            'evaluations': 0,
+            'errors': 0,
+            'updates': 0,
+            'recommendations': 0,
+            'requests': 0,
+        } for name in protocols
+    }
+    sent: List[str] = []
+    count = 0
+
+    with captured_requests(sent, offline):
+        started = clock()
+        for count, event in enumerate(events, 1):
+            if rate:
+                delay = started + (count - 1) / rate - clock()
+                if delay > 0:
+                    sleep(delay)
+
+            change_type = event.get('change_type')
+            patient = patients.get(event['patient'])
+            for name, protocol_class in protocols.items():
+                if not impacted(protocol_class, change_type):
+                    continue
+                requests_before = len(sent)
+                evaluation_started = clock()
+                try:
+                    protocol = protocol_class(
+                        patient=patient,
+                        change_types=[change_type] if change_type else None)
+                    protocol.field_changes = event.get('field_changes') or {}
+                    if event.get('settings'):
+                        protocol.set_settings(event['settings'])
+                    result = protocol.compute_results()
+                except Exception:
+                    stats[name]['errors'] += 1
+                    result, protocol = None, None
+                latencies[name].append(clock() - evaluation_started)
+                stats[name]['evaluations'] += 1
+                stats[name]['requests'] += len(sent) - requests_before
+                if result is not None:
+                    stats[name]['updates'] += len(protocol.canvas_updates or [])
+                    stats[name]['recommendations'] += len(result.recommendations)
+        elapsed = clock() - started
+
+    for name, values in latencies.items():
+        values.sort()
+        for percent in PERCENTILES:
+            stats[name][f'p{percent}'] = percentile(values, percent)
+
+    return {
+        'events': count,
+        'elapsed': elapsed,
+        'events_per_second': count / elapsed if elapsed > 0 else None,
+        'protocols': {
+            name: protocol_stats
+            for name, protocol_stats in stats.items()
+            if protocol_stats['evaluations']
+        },
+    }
+
+
+def _milliseconds(value: Optional[float]) -> str:
+    return '-' if value is None else f'{value * 1000:.2f}'
+
+
+def format_report(report: Dict) -> str:
+    lines = [
+        f"{report['events']} events in {report['elapsed']:.2f}s "
+        f"({report['events_per_second'] or 0:.1f} events/s)",
+        f"{'protocol':60} {'evals':>6} {'errors':>6} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'updates':>7} {'recs':>6} {'http':>6}",
+    ]
+    for name, stats in sorted(report['protocols'].items()):
+        lines.append(f"{name:60} {stats['evaluations']:>6} {stats['errors']:>6} "
+                     f"{_milliseconds(stats['p50']):>8} "
+                     f"{_milliseconds(stats['p95']):>8} "
+                     f"{_milliseconds(stats['p99']):>8} {stats['updates']:>7} "
+                     f"{stats['recommendations']:>6} {stats['requests']:>6}")
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Replay recorded change events against the protocols.')
+    parser.add_argument('events', type=Path, help='NDJSON file of events')
+    parser.add_argument('--protocols',
+                        default='**/*.py',
+                        help='glob under the protocols directory')
+    parser.add_argument('--rate',
+                        type=float,
+                        help='events per second, as fast as possible if unset')
+    parser.add_argument('--online',
+                        action='store_true',
+                        help='really send the HTTP requests protocols make')
+    parser.add_argument('--output', type=Path, help='write the report as JSON')
+    args = parser.parse_args(argv)
+
+    protocols, errors = load_protocols(
+        discover_protocols(PROTOCOLS_DIR, args.protocols))
+    for name, error in sorted(errors.items()):
+        print(f'SKIPPED {name}: {error}')
+
+    report = replay_events(read_events(args.events),
+                           protocols,
+                           rate=args.rate,
+                           offline=not args.online)
+    print(format_report(report))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, sort_keys=True) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
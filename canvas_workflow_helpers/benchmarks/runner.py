@@ -0,0 +1,249 @@
+import json
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.utils import (load_local_patient,
+                                       parse_class_from_python_source)
+
+from canvas_workflow_helpers.synthetic import SyntheticPatientGenerator
+
+from .offline import captured_requests
+
+PROTOCOLS_DIR = Path(__file__).parent.parent / 'protocols'
+DEFAULT_BASELINE = Path(__file__).parent / 'baselines.json'
+
+METRICS = ('wall_time', 'allocations', 'peak_memory')
+
+# what protocols calling FHIR or building URLs read from their settings;
+# requests are answered offline, so nothing is sent with them
+BENCHMARK_SETTINGS = {
+    'CLIENT_ID': 'benchmark-client-id',
+    'CLIENT_SECRET': 'benchmark-client-secret',
+    'INSTANCE_NAME': 'benchmark',
+}
+
+# differences smaller than this are noise whatever the relative change is
+MIN_DELTAS = {
+    'wall_time': 0.001,
+    'allocations': 100,
+    'peak_memory': 64 * 1024,
+}
+
+
+def discover_protocols(root: Path = PROTOCOLS_DIR,
+                       pattern: str = '**/*.py') -> List[Path]:
+    return sorted(path for path in root.glob(pattern)
+                  if path.name != '__init__.py')
+
+
+def protocol_name(path: Path, root: Path = PROTOCOLS_DIR) -> str:
+    try:
+        return path.resolve().relative_to(root.resolve()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def synthetic_patient(size: str, seed: int = 0) -> Patient:
+    """ One synthetic patient of the given size preset, loaded from disk. """
+    generator = SyntheticPatientGenerator.from_size(size, seed=seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path, = generator.write(directory, count=1)
+        return load_local_patient(path)
+
+
+def change_events(protocol_class,
+                  patient: Patient) -> List[Tuple[Optional[str], Dict]]:
+    """
+    (change type, field_changes) for every change type `protocol_class` is
+    computed on, with field_changes as Canvas sends them when a record of
+    that type is created: for the first such record of `patient` when it has
+    one. A protocol without change types gets a single (None, {}).
+    """
+    events = []
+    for change_type in protocol_class._meta.compute_on_change_types:
+        records = getattr(patient, f'{change_type}s', None)
+        records = getattr(records, 'records', records) or []
+        record = records[0] if records else {}
+        canvas_id = record.get('id', 1)
+        events.append((change_type, {
+            'model_name': change_type.replace('_', ''),
+            'created': True,
+            'canvas_id': canvas_id,
+            'external_id': record.get('externallyExposableId', str(canvas_id)),
+            'patient_key': patient.patient['key'],
+            'fields': {
+                _snake_case(field): [None, value]
+                for field, value in record.items()
+                if not isinstance(value, (dict, list))
+            },
+        }))
+    return events or [(None, {})]
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def _run(protocol_class, patient: Patient,
+         events: List[Tuple[Optional[str], Dict]]) -> List:
+    results = []
+    for change_type, field_changes in events:
+        protocol = protocol_class(
+            patient=patient,
+            change_types=[change_type] if change_type else None)
+        protocol.set_settings(BENCHMARK_SETTINGS)
+        protocol.field_changes = field_changes
+        results.append((protocol, protocol.compute_results()))
+    return results
+
+
+def measure(protocol_class,
+            patient: Patient,
+            repeat: int = 3,
+            offline: bool = True) -> Dict:
+    """
+    Run compute_results of `protocol_class` for `patient`, once for every
+    event of change_events and with BENCHMARK_SETTINGS as its settings.
+
+    `wall_time` is the median of `repeat` untraced runs in seconds. A last,
+    traced run gives `peak_memory`, the highest number of bytes allocated
+    above what was in use before the run, and `allocations`, the number of
+    memory blocks the run allocated that its protocols and results still
+    hold once it returned. `requests` is the number of HTTP requests of one
+    run; unless `offline` is False they are answered locally and never sent.
+    """
+    events = change_events(protocol_class, patient)
+    timings = []
+    sent: List[str] = []
+    with captured_requests(sent, offline):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _run(protocol_class, patient, events)
+            timings.append(time.perf_counter() - started)
+
+        del sent[:]
+        # a tracing session of its own: every block traced was allocated by
+        # this run, and the peak only covers it
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            results = _run(protocol_class, patient, events)
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        del results
+
+    return {
+        'wall_time': statistics.median(timings),
+        'allocations': len(snapshot.traces),
+        'peak_memory': peak - before,
+        'requests': len(sent),
+    }
+
+
+def run_benchmarks(protocols: Iterable[Path],
+                   sizes: Iterable[str] = ('small', 'medium', 'large'),
+                   repeat: int = 3,
+                   seed: int = 0,
+                   root: Path = PROTOCOLS_DIR) -> Dict[str, Dict[str, Dict]]:
+    """
+    Benchmark every protocol file against one synthetic patient per size.
+
+    Returns {protocol: {size: metrics}}. Protocols that cannot be loaded or
+    that raise for a patient get {'error': ...} instead of metrics, so one
+    broken protocol does not stop the suite.
+    """
+    patients = {size: synthetic_patient(size, seed) for size in sizes}
+    results: Dict[str, Dict[str, Dict]] = {}
+
+    for path in protocols:
+        name = protocol_name(path, root)
+        results[name] = {}
+        try:
+            protocol_class = parse_class_from_python_source(path.read_text())
+        except Exception as error:
+            for size in patients:
+                results[name][size] = {'error': f'load: {error!r}'}
+            continue
+
+        for size, patient in patients.items():
+            try:
+                results[name][size] = measure(protocol_class, patient, repeat)
+            except Exception as error:
+                results[name][size] = {'error': repr(error)}
+    return results
+
+
+def load_baseline(path: Path = DEFAULT_BASELINE) -> Dict[str, Dict[str, Dict]]:
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(results: Dict[str, Dict[str, Dict]],
+                  path: Path = DEFAULT_BASELINE) -> None:
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+
+
+def find_regressions(
+        results: Dict[str, Dict[str, Dict]],
+        baseline: Dict[str, Dict[str, Dict]],
+        threshold: float = 0.25,
+        min_deltas: Optional[Dict[str, float]] = None
+) -> List[Tuple[str, str, str, object, object]]:
+    """
+    Compare results with a baseline and return (protocol, size, metric,
+    baseline value, current value) for every metric that grew by more than
+    `threshold` (0.25 is 25%). A run that errored where the baseline has
+    metrics is reported as metric 'error' ('ok' -> the error), and a run
+    the baseline has nothing for as metric 'baseline' ('missing' -> 'ok' or
+    the error), so new protocols cannot slip past the gate. Runs that
+    errored in the baseline are not compared.
+    """
+    min_deltas = MIN_DELTAS if min_deltas is None else min_deltas
+    regressions = []
+    for name, sizes in sorted(results.items()):
+        for size, metrics in sorted(sizes.items()):
+            previous = baseline.get(name, {}).get(size)
+            if not previous:
+                regressions.append((name, size, 'baseline', 'missing',
+                                    metrics.get('error', 'ok')))
+                continue
+            if 'error' in previous:
+                continue
+            if 'error' in metrics:
+                regressions.append(
+                    (name, size, 'error', 'ok', metrics['error']))
+                continue
+            for metric in METRICS:
+                if metric not in metrics or metric not in previous:
+                    continue
+                old, new = previous[metric], metrics[metric]
+                if new - old <= min_deltas.get(metric, 0):
+                    continue
+                if new > old * (1 + threshold):
+                    regressions.append((name, size, metric, old, new))
+    return regressions
+
+
+def format_results(results: Dict[str, Dict[str, Dict]]) -> str:
+    lines = []
+    for name, sizes in sorted(results.items()):
+        for size, metrics in sizes.items():
+            if 'error' in metrics:
+                lines.append(f'{name:<70} {size:<7} error {metrics["error"]}')
+                continue
+            lines.append(f'{name:<70} {size:<7} '
+                         f'{metrics["wall_time"] * 1000:>10.2f} ms '
+                         f'{metrics["allocations"]:>10} blocks '
+                         f'{metrics["peak_memory"] / 1024:>10.1f} KiB')
+    return '\n'.join(lines)
@@ -0,0 +1,149 @@
+"""
+A frozen clock for one protocol evaluation.
+
+Protocols that call arrow.now() for every window they build get slightly
+different windows within one evaluation and cannot cache what they compute
+from them. An EvaluationClock freezes "now" once and hands out the same
+Timeframe objects for the common windows, so queries over them can be
+memoized for the evaluation (or replayed with the same clock later):
+
+    class TitrateGLP1(EvaluationClockMixin, ClinicalQualityMeasure):
+
+        def weight_loss_ratio_over_last_month(self):
+            return self.weight_loss_ratio_over_time(self.clock.last_month)
+
+        def weights_last_month(self):
+            return self.clock.within(self.patient.vital_signs,
+                                     self.clock.last_month)
+
+The mixin freezes the clock at the protocol's `now`. Protocols that still
+call arrow.now() / arrow.utcnow() can be evaluated under `clock.frozen()`,
+which makes those calls return the frozen time:
+
+    clock = EvaluationClock(arrow.get('2023-01-01'))
+    with clock.frozen():
+        result = VisitFrequencyForDiabetes(patient=patient, now=clock.now).compute_results()
+
+Timeframes handed out by the clock are shared, treat them as read-only.
+"""
+import threading
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+import arrow
+
+from canvas_workflow_kit.timeframe import Timeframe
+
+_frozen: Optional['EvaluationClock'] = None
+_freeze_lock = threading.Lock()
+
+
+class EvaluationClock(object):
+    """
+    "now" and the windows ending at it, computed once. `within` and `cached`
+    memoize values for the lifetime of the clock.
+    """
+
+    def __init__(self, now: Optional[arrow.Arrow] = None):
+        self.now = now if now is not None else arrow.utcnow()
+        self._shifts: Dict[Tuple, arrow.Arrow] = {}
+        self._windows: Dict[Tuple, Timeframe] = {}
+        self._cache: Dict[Hashable, Any] = {}
+        self._lock = threading.RLock()
+
+    def ago(self, **shift: int) -> arrow.Arrow:
+        """ now shifted back, e.g. ago(months=6); the same object every call. """
+        key = tuple(sorted(shift.items()))
+        with self._lock:
+            if key not in self._shifts:
+                self._shifts[key] = self.now.shift(
+                    **{unit: -amount for unit, amount in shift.items()})
+            return self._shifts[key]
+
+    def window(self, **shift: int) -> Timeframe:
+        """ The Timeframe from ago(**shift) to now. """
+        key = tuple(sorted(shift.items()))
+        with self._lock:
+            if key not in self._windows:
+                self._windows[key] = Timeframe(start=self.ago(**shift),
+                                               end=self.now)
+            return self._windows[key]
+
+    def week(self, weeks_back: int) -> Timeframe:
+        """ The week ending `weeks_back` weeks ago, week(0) being the last one. """
+        key = ('week', weeks_back)
+        with self._lock:
+            if key not in self._windows:
+                self._windows[key] = Timeframe(
+                    start=self.now.shift(weeks=-(weeks_back + 1)),
+                    end=self.now.shift(weeks=-weeks_back))
+            return self._windows[key]
+
+    @property
+    def last_two_weeks(self) -> Timeframe:
+        return self.window(weeks=2)
+
+    @property
+    def last_month(self) -> Timeframe:
+        return self.window(months=1)
+
+    @property
+    def last_six_months(self) -> Timeframe:
+        return self.window(months=6)
+
+    @property
+    def last_year(self) -> Timeframe:
+        return self.window(years=1)
+
+    def cached(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """ compute() once per key for this clock. """
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        value = compute()
+        with self._lock:
+            return self._cache.setdefault(key, value)
+
+    def within(self, recordset, timeframe: Timeframe):
+        """ recordset.within(timeframe), memoized per recordset and window. """
+        key = ('within', id(recordset), timeframe.start, timeframe.end)
+        # the recordset is kept with the value so its id is not reused
+        return self.cached(key, lambda: (recordset,
+                                         recordset.within(timeframe)))[1]
+
+    @contextmanager
+    def frozen(self) -> Iterator['EvaluationClock']:
+        """
+        Make arrow.now() and arrow.utcnow() return this clock's time. Only one
+        clock can be frozen at a time, since the patch is process wide.
+        """
+        global _frozen
+        with _freeze_lock:
+            if _frozen is not None:
+                raise RuntimeError('another EvaluationClock is already frozen')
+            _frozen = self
+            originals = arrow.now, arrow.utcnow
+            arrow.now = lambda tz=None: self.now.to(tz or 'local')
+            arrow.utcnow = lambda: self.now.to('UTC')
+        try:
+            yield self
+        finally:
+            with _freeze_lock:
+                arrow.now, arrow.utcnow = originals
+                _frozen = None
+
+
+class EvaluationClockMixin(object):
+    """
+    Put before ClinicalQualityMeasure in the bases of a protocol to get a
+    `clock` frozen at the protocol's `now`.
+    """
+
+    @property
+    def clock(self) -> EvaluationClock:
+        clock = self.__dict__.get('_evaluation_clock')
+        if clock is None:
+            clock = EvaluationClock(getattr(self, 'now', None))
+            self.__dict__['_evaluation_clock'] = clock
+        return clock
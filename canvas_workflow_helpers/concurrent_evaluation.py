@@ -0,0 +1,208 @@
+"""
+Evaluate many protocols for one patient concurrently.
+
+Most of the wall time of protocols that call FHIR or send webhooks is spent
+waiting on I/O, so they are evaluated in a thread pool. The concurrency
+contract is:
+
+- every evaluation gets its own protocol instance, constructed in the worker
+  thread, with its own copy of the settings and field_changes, so state a
+  protocol keeps on `self` (self.fhir, self.base_payload, ...) is never
+  shared;
+- the Patient is shared and must be treated as read-only. Protocols that
+  modify patient records are evaluated against a private deep copy when
+  listed in `copy_patient_for`;
+- all protocols of one `evaluate` call see the same `now`;
+- helpers that want to cache per worker thread use `thread_cache()`, a dict
+  private to the current thread and the current `evaluate` call;
+- outcomes come back in the order the protocols were given, whatever order
+  they finished in, and an exception in one protocol is recorded in its
+  outcome instead of stopping the others.
+
+    evaluator = ConcurrentEvaluator(max_workers=8)
+    report = evaluator.evaluate(patient, {
+        'migraine_workflow': MigraineWorkflow,
+        'messages_listener': MessagesListener,
+    }, settings=settings)
+    for update in report.updates:
+        ...
+    evaluator.shutdown()
+"""
+import copy
+import itertools
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.protocol import ProtocolResult
+
+_local = threading.local()
+
+
+class EvaluationContext(object):
+    """ What one protocol evaluation runs with, see `current_context()`. """
+
+    def __init__(self, name: str, patient: Patient, now: arrow.Arrow,
+                 run: int):
+        self.name = name
+        self.patient = patient
+        self.now = now
+        self.run = run
+        self.protocol = None
+
+
+class EvaluationOutcome(object):
+
+    def __init__(self,
+                 name: str,
+                 result: Optional[ProtocolResult] = None,
+                 updates: Optional[List[Dict]] = None,
+                 error: Optional[BaseException] = None,
+                 elapsed: float = 0.0,
+                 thread: str = ''):
+        self.name = name
+        self.result = result
+        self.updates = updates or []
+        self.error = error
+        self.elapsed = elapsed
+        self.thread = thread
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        status = self.result.status if self.result is not None else None
+        return (f'<EvaluationOutcome {self.name} status={status} '
+                f'error={self.error!r}>')
+
+
+class EvaluationReport(object):
+    """ The outcomes of one `evaluate` call, in the order of the protocols. """
+
+    def __init__(self, outcomes: List[EvaluationOutcome], elapsed: float):
+        self.outcomes = outcomes
+        self.elapsed = elapsed
+
+    @property
+    def results(self) -> Dict[str, ProtocolResult]:
+        return {
+            outcome.name: outcome.result
+            for outcome in self.outcomes
+            if outcome.result is not None
+        }
+
+    @property
+    def updates(self) -> List[Dict]:
+        """ The canvas updates of every protocol, in protocol order. """
+        return [update for outcome in self.outcomes for update in outcome.updates]
+
+    @property
+    def errors(self) -> Dict[str, BaseException]:
+        return {
+            outcome.name: outcome.error
+            for outcome in self.outcomes
+            if outcome.error is not None
+        }
+
+
+def current_context() -> Optional[EvaluationContext]:
+    """ The context of the evaluation running in this thread, if any. """
+    return getattr(_local, 'context', None)
+
+
+def thread_cache() -> Dict[Any, Any]:
+    """
+    A dict private to this thread and the current `evaluate` call; outside
+    of an evaluation, a dict private to this thread.
+    """
+    context = current_context()
+    run = context.run if context is not None else None
+    if getattr(_local, 'cache_run', object()) != run:
+        _local.cache_run = run
+        _local.cache = {}
+    return _local.cache
+
+
+class ConcurrentEvaluator(object):
+    """
+    A thread pool evaluating protocol classes for a patient. The pool is
+    kept between `evaluate` calls; call `shutdown` (or use the evaluator as
+    a context manager) when done.
+    """
+
+    _runs = itertools.count(1)
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='protocol-evaluation')
+
+    def __enter__(self) -> 'ConcurrentEvaluator':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def evaluate(self,
+                 patient: Patient,
+                 protocols: Dict[str, type],
+                 settings: Optional[Dict] = None,
+                 field_changes: Optional[Dict] = None,
+                 change_types: Optional[List[str]] = None,
+                 now: Optional[arrow.Arrow] = None,
+                 copy_patient_for: Iterable[str] = ()) -> EvaluationReport:
+        now = now or arrow.utcnow()
+        run = next(self._runs)
+        copy_patient_for = set(copy_patient_for)
+        started = time.perf_counter()
+
+        futures = [
+            self._executor.submit(
+                self._evaluate_one,
+                EvaluationContext(
+                    name,
+                    copy.deepcopy(patient) if name in copy_patient_for else patient,
+                    now, run), protocol_class, settings, field_changes,
+                change_types) for name, protocol_class in protocols.items()
+        ]
+        outcomes = [future.result() for future in futures]
+        return EvaluationReport(outcomes, time.perf_counter() - started)
+
+    @staticmethod
+    def _evaluate_one(context: EvaluationContext, protocol_class,
+                      settings: Optional[Dict], field_changes: Optional[Dict],
+                      change_types: Optional[List[str]]) -> EvaluationOutcome:
+        _local.context = context
+        thread = threading.current_thread().name
+        started = time.perf_counter()
+        try:
+            protocol = protocol_class(patient=context.patient,
+                                      now=context.now,
+                                      change_types=change_types)
+            context.protocol = protocol
+            protocol.field_changes = copy.deepcopy(field_changes or {})
+            if settings:
+                protocol.set_settings(copy.deepcopy(settings))
+            # not_relevant without computing when not impacted by change_types
+            result = protocol.results()
+            return EvaluationOutcome(context.name,
+                                     result=result,
+                                     updates=list(protocol.canvas_updates or []),
+                                     elapsed=time.perf_counter() - started,
+                                     thread=thread)
+        except Exception as error:
+            return EvaluationOutcome(context.name,
+                                     error=error,
+                                     elapsed=time.perf_counter() - started,
+                                     thread=thread)
+        finally:
+            _local.context = None
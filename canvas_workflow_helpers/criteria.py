@@ -0,0 +1,194 @@
+"""
+Declarative patient criteria evaluated in a single pass per recordset.
+
+Instead of chaining find(ValueSet).filter(...) once per question, a protocol
+declares its predicates up front:
+
+    CRITERIA = (Criteria()
+                .add('has_t2diabetes', 'conditions', Diabetes, clinicalStatus='active')
+                .add('has_heart_failure', 'conditions', HeartFailure, clinicalStatus='active')
+                .add('on_glp1', 'medications', GLP1, status='active')
+                .add('recent_a1c', 'lab_reports', Hba1CLaboratoryTest, timeframe=True))
+
+    results = CRITERIA.evaluate(self.patient, self.timeframe)
+    if results.has('has_t2diabetes') and not results.has('on_glp1'):
+        ...
+
+The codes of every value set are merged into one reverse index, (system,
+code) -> predicates, so each record of a recordset is looked at once no
+matter how many predicates use that recordset.
+"""
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.patient_recordset import (SYSTEM_CODE_MAPPING,
+                                                   PatientPeriodRecordSet,
+                                                   PatientRecordSet)
+from canvas_workflow_kit.timeframe import Timeframe
+
+
+class Criterion(object):
+    """
+    One predicate: records of `recordset` (a Patient attribute such as
+    'conditions') whose codes are in `value_set`, that pass `filters` (the
+    keyword arguments of PatientRecordSet.filter) and, if `timeframe` is set,
+    fall in it. `timeframe=True` uses the timeframe given to evaluate.
+    """
+
+    def __init__(self,
+                 name: str,
+                 recordset: str,
+                 value_set=None,
+                 timeframe: Union[Timeframe, bool, None] = None,
+                 **filters):
+        self.name = name
+        self.recordset = recordset
+        self.value_set = value_set
+        self.timeframe = timeframe
+        self.filters = filters
+
+
+class CriteriaResults(dict):
+    """ Predicate name -> recordset of the matching records. """
+
+    def has(self, name: str) -> bool:
+        return bool(self[name])
+
+
+class Criteria(object):
+
+    def __init__(self):
+        self._criteria: List[Criterion] = []
+        self._reverse_index: Optional[Dict[str, Dict[Tuple[str, str],
+                                                     List[int]]]] = None
+
+    def __len__(self):
+        return len(self._criteria)
+
+    def add(self,
+            name: str,
+            recordset: str,
+            value_set=None,
+            timeframe: Union[Timeframe, bool, None] = None,
+            **filters) -> 'Criteria':
+        if any(criterion.name == name for criterion in self._criteria):
+            raise ValueError(f'criterion {name!r} is already defined')
+        self._criteria.append(
+            Criterion(name, recordset, value_set, timeframe, **filters))
+        self._reverse_index = None
+        return self
+
+    def reverse_index(self) -> Dict[str, Dict[Tuple[str, str], List[int]]]:
+        """
+        recordset -> (system, code) -> positions of the criteria whose value
+        set holds that code. Built once, when first needed.
+        """
+        if self._reverse_index is None:
+            index: Dict[str, Dict[Tuple[str, str], List[int]]] = defaultdict(
+                lambda: defaultdict(list))
+            for position, criterion in enumerate(self._criteria):
+                if criterion.value_set is None:
+                    continue
+                for system, codes in criterion.value_set.values.items():
+                    for code in codes:
+                        index[criterion.recordset][(system, code)].append(
+                            position)
+            self._reverse_index = {
+                recordset: dict(codes) for recordset, codes in index.items()
+            }
+        return self._reverse_index
+
+    def evaluate(self,
+                 patient: Patient,
+                 timeframe: Optional[Timeframe] = None) -> CriteriaResults:
+        by_recordset: Dict[str, List[int]] = defaultdict(list)
+        for position, criterion in enumerate(self._criteria):
+            by_recordset[criterion.recordset].append(position)
+
+        reverse_index = self.reverse_index()
+        results = CriteriaResults()
+        for name, positions in by_recordset.items():
+            recordset = getattr(patient, name)
+            matches = self._scan(recordset, positions,
+                                 reverse_index.get(name, {}), timeframe)
+            for position in positions:
+                results[self._criteria[position].name] = recordset.__class__(
+                    matches[position])
+        return results
+
+    def _scan(self, recordset: PatientRecordSet, positions: List[int],
+              code_index: Dict[Tuple[str, str], List[int]],
+              timeframe: Optional[Timeframe]) -> Dict[int, List[dict]]:
+        if code_index and not recordset.VALID_SYSTEMS:
+            raise ValueError('Invalid call to find() on non-coded patient data.')
+
+        checks = {
+            position: self._checks(self._criteria[position], recordset,
+                                   timeframe) for position in positions
+        }
+        uncoded = [
+            position for position in positions
+            if self._criteria[position].value_set is None
+        ]
+        valid_systems = set(recordset.VALID_SYSTEMS or [])
+
+        matches: Dict[int, List[dict]] = {position: [] for position in positions}
+        for item in recordset.records:
+            candidates = dict.fromkeys(uncoded)
+            if code_index:
+                for coding in recordset.item_to_codes(item):
+                    for system in SYSTEM_CODE_MAPPING.get(coding['system'], []):
+                        if system in valid_systems:
+                            candidates.update(
+                                dict.fromkeys(
+                                    code_index.get((system, coding['code']),
+                                                   ())))
+            for position in candidates:
+                if all(check(item) for check in checks[position]):
+                    matches[position].append(item)
+        return matches
+
+    @staticmethod
+    def _checks(criterion: Criterion, recordset: PatientRecordSet,
+                timeframe: Optional[Timeframe]) -> List[Callable[[dict], bool]]:
+        checks = []
+        for key, value in criterion.filters.items():
+            filter_fn = recordset._parse_shorthand_filter(key)
+            checks.append(lambda item, fn=filter_fn, v=value: fn(item, v))
+
+        window = timeframe if criterion.timeframe is True else criterion.timeframe
+        if criterion.timeframe is True and timeframe is None:
+            raise ValueError(
+                f'criterion {criterion.name!r} needs the evaluation timeframe')
+        if window:
+            checks.append(_timeframe_check(recordset, window))
+        return checks
+
+
+def _timeframe_check(recordset: PatientRecordSet,
+                     timeframe: Timeframe) -> Callable[[dict], bool]:
+    """ The test .within() or .intersects() would apply to a record. """
+    if isinstance(recordset, PatientPeriodRecordSet):
+
+        def in_period(item):
+            return any(
+                arrow.get(period['from']) <= timeframe.end and
+                (period['to'] is None or
+                 timeframe.start <= arrow.get(period['to']))
+                for period in item['periods'])
+
+        return in_period
+
+    date_field = getattr(recordset, 'DATE_FIELD', None)
+    if not date_field:
+        raise ValueError(
+            f'{type(recordset).__name__} has no dates to compare to a timeframe')
+
+    def in_window(item):
+        return bool(item[date_field]) and (timeframe.start <= arrow.get(
+            item[date_field]) <= timeframe.end)
+
+    return in_window
@@ -0,0 +1,7 @@
+from .cache import CachedFumageHelper, CacheStats, FhirResponseCache
+from .bundle import (BATCH, TRANSACTION, BundleEntry, BundleError,
+                     FhirUnitOfWork)
+from .coalesce import (DEFAULT_LOCAL_FILTERS, CoalescerStats,
+                       FhirRequestCoalescer, date_filter, reference_filter,
+                       token_filter)
+from .pagination import iter_pages, iter_search, next_page_url, search_first
@@ -0,0 +1,193 @@
+import uuid
+
+from typing import List, Optional
+
+import requests
+
+from requests import RequestException
+
+from canvas_workflow_kit.fhir import FHIRHelper
+
+BATCH = 'batch'
+TRANSACTION = 'transaction'
+
+
+class BundleEntry(object):
+    """
+    One write queued on a FhirUnitOfWork. After the unit of work is flushed,
+    `status`, `location`, `etag` and `resource` hold what the server
+    returned for this entry.
+    """
+
+    def __init__(self, method: str, resource_type: str, payload: dict,
+                 resource_id: Optional[str] = None):
+        self.method = method
+        self.resource_type = resource_type
+        self.resource_id = resource_id
+        self.payload = payload
+        self.full_url = f'urn:uuid:{uuid.uuid4()}'
+
+        self.status: Optional[str] = None
+        self.location: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.resource: Optional[dict] = None
+        self.outcome: Optional[dict] = None
+
+    @property
+    def reference(self) -> str:
+        """
+        A reference other entries of the same transaction can use to point at
+        this resource before it has a server assigned id.
+        """
+        if self.resource_id:
+            return f'{self.resource_type}/{self.resource_id}'
+        return self.full_url
+
+    @property
+    def status_code(self) -> Optional[int]:
+        if not self.status:
+            return None
+        return int(self.status.split(' ')[0])
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code is not None and 200 <= self.status_code < 300
+
+    def as_bundle_entry(self) -> dict:
+        url = self.resource_type
+        if self.resource_id:
+            url = f'{self.resource_type}/{self.resource_id}'
+
+        entry = {
+            'resource': self.payload,
+            'request': {
+                'method': self.method,
+                'url': url,
+            },
+        }
+        if self.method == 'POST':
+            entry['fullUrl'] = self.full_url
+        return entry
+
+    def set_result(self, result: dict) -> None:
+        response = result.get('response', {})
+        self.status = response.get('status')
+        self.location = response.get('location')
+        self.etag = response.get('etag')
+        self.outcome = response.get('outcome')
+        self.resource = result.get('resource')
+
+
+class BundleError(RequestException):
+    """
+    A Bundle the server did not answer entry by entry. `entries` are the
+    writes it held; they are no longer queued on the unit of work.
+    """
+
+    def __init__(self, message: str, entries: List[BundleEntry], **kwargs):
+        super().__init__(message, **kwargs)
+        self.entries = entries
+
+
+class FhirUnitOfWork(object):
+    """
+    Collects creates and updates made during compute_results and sends them
+    to the FHIR server as a single batch or transaction Bundle.
+
+    A transaction is applied all-or-nothing; a batch applies each entry on
+    its own and reports a status per entry. Either way every queued
+    BundleEntry is filled in with its result once `flush` returns.
+
+        with FhirUnitOfWork(fhir) as work:
+            work.update('CareTeam', patient_key, care_team)
+            task = work.create('Task', task_payload)
+        task.location
+    """
+
+    def __init__(self, fhir: FHIRHelper, bundle_type: str = TRANSACTION):
+        if bundle_type not in (BATCH, TRANSACTION):
+            raise ValueError(f'Unsupported bundle type "{bundle_type}"')
+
+        self.fhir = fhir
+        self.bundle_type = bundle_type
+        self.entries: List[BundleEntry] = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def create(self, resource_type: str, payload: dict) -> BundleEntry:
+        return self._add(BundleEntry('POST', resource_type, payload))
+
+    def update(self, resource_type: str, resource_id: str,
+               payload: dict) -> BundleEntry:
+        return self._add(
+            BundleEntry('PUT', resource_type, payload, resource_id))
+
+    def as_bundle(self) -> dict:
+        return {
+            'resourceType': 'Bundle',
+            'type': self.bundle_type,
+            'entry': [entry.as_bundle_entry() for entry in self.entries],
+        }
+
+    def flush(self) -> List[BundleEntry]:
+        """
+        Send every queued write in one request and return the entries, in the
+        order they were queued, with their results set.
+
+        The queue is emptied whatever the outcome, so a later flush never
+        posts the same writes twice. When the server rejects the Bundle, or
+        answers with a different number of entries, a BundleError carrying
+        the entries is raised; re-queue them explicitly to retry.
+        """
+        if not self.entries:
+            return []
+
+        if not self.fhir.token:
+            self.fhir.get_fhir_api_token()
+
+        bundle = self.as_bundle()
+        entries, self.entries = self.entries, []
+        response = requests.post(self.fhir.base_fhir_url,
+                                 json=bundle,
+                                 headers=self.fhir.headers)
+
+        if response.status_code != 200:
+            raise BundleError(
+                f'FHIR {self.bundle_type} Bundle failed: {response.text} and '
+                f"fumage_correlation_id: {response.headers.get('fumage-correlation-id')}",
+                entries,
+                response=response)
+
+        # keep a CachedFumageHelper consistent with the writes just made
+        invalidate = getattr(self.fhir, 'invalidate', None)
+        if invalidate:
+            for entry in entries:
+                invalidate(entry.resource_type, entry.resource_id)
+
+        results = response.json().get('entry', [])
+        if len(results) != len(entries):
+            raise BundleError(
+                f'FHIR {self.bundle_type} Bundle returned {len(results)} '
+                f'entries for {len(entries)} requests',
+                entries,
+                response=response)
+
+        for entry, result in zip(entries, results):
+            entry.set_result(result)
+        return entries
+
+    def requeue(self, entries: List[BundleEntry]) -> None:
+        """ Queue entries again, e.g. those of a BundleError, to retry them. """
+        self.entries.extend(entries)
+
+    def _add(self, entry: BundleEntry) -> BundleEntry:
+        self.entries.append(entry)
+        return entry
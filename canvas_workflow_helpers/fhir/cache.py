@@ -0,0 +1,230 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+
+from canvas_workflow_kit.fhir import FHIRHelper
+
+
+class CacheStats(object):
+    """
+    Counters describing how a FhirResponseCache has been used.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class CacheEntry(object):
+
+    def __init__(self, response: requests.Response, expires_at: float):
+        self.response = response
+        self.expires_at = expires_at
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.response.headers.get('ETag')
+
+
+class FhirResponseCache(object):
+    """
+    A bounded LRU cache of successful FHIR read and search responses.
+
+    Keys are (kind, resource type, id or query, base FHIR URL), so one cache
+    can be shared by helpers talking to different Canvas instances.
+
+    Each resource type can have its own time to live (in seconds); anything
+    not listed in `ttls` uses `default_ttl`. Expired entries are kept until
+    evicted so they can be revalidated with If-None-Match when the server
+    returned an ETag.
+    """
+
+    def __init__(self,
+                 max_entries: int = 512,
+                 default_ttl: float = 60,
+                 ttls: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.clock = clock
+        self.stats = CacheStats()
+
+        self._entries: 'OrderedDict[Tuple, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl_for(self, resource_type: str) -> float:
+        return self.ttls.get(resource_type, self.default_ttl)
+
+    def get(self, key: Tuple) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.expires_at > self.clock()
+
+    def put(self, key: Tuple, response: requests.Response) -> CacheEntry:
+        entry = CacheEntry(response, self.clock() + self.ttl_for(key[1]))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.increment('evictions')
+        return entry
+
+    def touch(self, key: Tuple, entry: CacheEntry) -> None:
+        """ Mark an entry as fresh again after a successful revalidation. """
+        with self._lock:
+            entry.expires_at = self.clock() + self.ttl_for(key[1])
+
+    def invalidate(self,
+                   resource_type: str,
+                   resource_id: Optional[str] = None,
+                   base_fhir_url: Optional[str] = None) -> int:
+        """
+        Drop every cached search for `resource_type`, and the cached read of
+        `resource_id` when one is given, of one instance when `base_fhir_url`
+        is given. Returns the number of entries removed.
+        """
+        with self._lock:
+            stale = [
+                key for key in self._entries if key[1] == resource_type and (
+                    key[0] == 'search' or key[2] == resource_id) and (
+                        base_fhir_url is None or key[3] == base_fhir_url)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.stats.increment('invalidations', len(stale))
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedFumageHelper(object):
+    """
+    Read-through cache around a FumageHelper (or any FHIRHelper).
+
+    `read` and `search` are answered from the cache while the entry is fresh.
+    Once it expires, an entry with an ETag is revalidated with If-None-Match
+    and a 304 reuses the cached response. `create` and `update` are passed
+    straight through and invalidate the affected cache entries, so a protocol
+    always sees its own writes. Revalidations go through the wrapped helper's
+    `session` when it has one, with its headers.
+
+        fhir = CachedFumageHelper(FumageHelper(self.settings), cache=CACHE)
+    """
+
+    def __init__(self,
+                 fhir: FHIRHelper,
+                 cache: Optional[FhirResponseCache] = None):
+        self.fhir = fhir
+        self.cache = cache if cache is not None else FhirResponseCache()
+
+    def __getattr__(self, name):
+        # token, headers, base_fhir_url, ... come from the wrapped helper
+        if name == 'fhir':
+            raise AttributeError(name)
+        return getattr(self.fhir, name)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.cache.stats
+
+    def invalidate(self,
+                   resource_type: str,
+                   resource_id: Optional[str] = None) -> int:
+        return self.cache.invalidate(resource_type, resource_id,
+                                     self.fhir.base_fhir_url)
+
+    def read(self, resource_type: str,
+             resource_id: str) -> requests.Response:
+        key = ('read', resource_type, resource_id, self.fhir.base_fhir_url)
+        url = f'{self.fhir.base_fhir_url}/{resource_type}/{resource_id}'
+        return self._cached_get(
+            key, url, lambda: self.fhir.read(resource_type, resource_id))
+
+    def search(self,
+               resource_type: str,
+               search_params: Optional[dict] = None) -> requests.Response:
+        params = urlencode(sorted((search_params or {}).items()), doseq=True)
+        key = ('search', resource_type, params, self.fhir.base_fhir_url)
+        url = f'{self.fhir.base_fhir_url}/{resource_type}?{params}'
+        return self._cached_get(
+            key, url, lambda: self.fhir.search(resource_type, search_params))
+
+    def create(self, resource_type: str,
+               payload: dict) -> requests.Response:
+        response = self.fhir.create(resource_type, payload)
+        self.invalidate(resource_type)
+        return response
+
+    def update(self, resource_type: str, resource_id: str,
+               payload: dict) -> requests.Response:
+        response = self.fhir.update(resource_type, resource_id, payload)
+        self.invalidate(resource_type, resource_id)
+        return response
+
+    def _cached_get(self, key: Tuple, url: str,
+                    fetch: Callable[[], requests.Response]) -> requests.Response:
+        entry = self.cache.get(key)
+
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.stats.increment('hits')
+            return entry.response
+
+        if entry is not None and entry.etag:
+            response = self._conditional_get(url, entry.etag)
+            if response.status_code == 304:
+                self.cache.touch(key, entry)
+                self.cache.stats.increment('revalidations')
+                self.cache.stats.increment('hits')
+                return entry.response
+        else:
+            response = fetch()
+
+        self.cache.stats.increment('misses')
+        if response.status_code == 200:
+            self.cache.put(key, response)
+        return response
+
+    def _conditional_get(self, url: str, etag: str) -> requests.Response:
+        if not self.fhir.token:
+            self.fhir.get_fhir_api_token()
+        # through the wrapped helper's session when it keeps one, with its
+        # (possibly just refreshed) headers
+        transport = getattr(self.fhir, 'session', None) or requests
+        return transport.get(url,
+                             headers={
+                                 **self.fhir.headers, 'If-None-Match': etag
+                             })
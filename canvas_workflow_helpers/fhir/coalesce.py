@@ -0,0 +1,263 @@
+import json
+
+from typing import Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+import arrow
+import requests
+
+from canvas_workflow_kit.fhir import FHIRHelper
+
+DATE_PREFIXES = ('eq', 'ne', 'lt', 'gt', 'le', 'ge')
+DATE_FRAMES = {4: 'year', 7: 'month', 10: 'day'}
+
+LocalFilter = Callable[[dict, str], bool]
+
+
+def reference_filter(field: str) -> LocalFilter:
+    """
+    Match a reference search parameter (`Questionnaire/123` or just `123`)
+    against `resource[field]`.
+    """
+
+    def matches(resource: dict, value: str) -> bool:
+        actual = resource.get(field)
+        if isinstance(actual, dict):
+            actual = actual.get('reference')
+        if not actual:
+            return False
+        return actual == value or actual.split('/')[-1] == value.split('/')[-1]
+
+    return matches
+
+
+def token_filter(field: str) -> LocalFilter:
+    """
+    Match a simple code valued token parameter, e.g. `status=requested`.
+    A comma separated value matches any of its codes.
+    """
+
+    def matches(resource: dict, value: str) -> bool:
+        return resource.get(field) in value.split(',')
+
+    return matches
+
+
+def _searched_range(searched: str,
+                   actual: arrow.Arrow) -> Tuple[arrow.Arrow, arrow.Arrow]:
+    """
+    The instants covered by a searched date. A date without a time (2023,
+    2023-01, 2023-01-05) is that period in the resource's own offset, a
+    datetime is that second, in UTC when it has no offset.
+    """
+    frame = DATE_FRAMES.get(len(searched))
+    if frame:
+        start = arrow.get(searched).replace(tzinfo=actual.tzinfo)
+        return start.span(frame)
+    return arrow.get(searched).span('second')
+
+
+def date_filter(field: str) -> LocalFilter:
+    """
+    Match a date search parameter with an optional FHIR prefix
+    (`eq2023-01-05`, `ge2023-01`, `le2023-01-05T22:00:00-05:00`, ...). The
+    searched value is turned into a range of instants that the resource
+    value is compared with.
+    """
+
+    def matches(resource: dict, value: str) -> bool:
+        actual = resource.get(field)
+        if not actual:
+            return False
+
+        prefix = value[:2] if value[:2] in DATE_PREFIXES else 'eq'
+        searched = value[2:] if value[:2] in DATE_PREFIXES else value
+        actual = arrow.get(actual)
+        start, end = _searched_range(searched, actual)
+
+        return {
+            'eq': start <= actual <= end,
+            'ne': not start <= actual <= end,
+            'lt': actual < start,
+            'gt': actual > end,
+            'le': actual <= end,
+            'ge': actual >= start,
+        }[prefix]
+
+    return matches
+
+
+DEFAULT_LOCAL_FILTERS: Dict[str, Dict[str, LocalFilter]] = {
+    'QuestionnaireResponse': {
+        'questionnaire': reference_filter('questionnaire'),
+        'authored': date_filter('authored'),
+        'status': token_filter('status'),
+    },
+}
+
+
+class CoalescerStats(object):
+    """
+    `saved` counts the requests answered from an earlier response, without a
+    network call of their own. `fallbacks` counts widened searches whose
+    Bundle could not be used, so the exact search had to be sent as well.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.network_calls = 0
+        self.saved = 0
+        self.fallbacks = 0
+
+
+class FhirRequestCoalescer(object):
+    """
+    Collapses the FHIR reads and searches made during one evaluation.
+
+    Identical requests are sent once. Searches are also widened: parameters
+    the coalescer knows how to evaluate locally (see DEFAULT_LOCAL_FILTERS)
+    are stripped before the request is sent, so searches that only differ in
+    those parameters share one network call and are filtered from the
+    cached Bundle. A Bundle with a `next` link is incomplete and is never used
+    to answer a narrower search; searches that would share it are sent
+    exactly from then on.
+
+    Create a new coalescer for every compute_results call; it does not expire
+    anything.
+
+        self.fhir = FhirRequestCoalescer(FumageHelper(self.settings))
+    """
+
+    def __init__(self,
+                 fhir: FHIRHelper,
+                 local_filters: Optional[Dict[str, Dict[str,
+                                                        LocalFilter]]] = None):
+        self.fhir = fhir
+        self.local_filters = (DEFAULT_LOCAL_FILTERS
+                              if local_filters is None else local_filters)
+        self.stats = CoalescerStats()
+        self._responses: Dict[Tuple, requests.Response] = {}
+        # widened searches whose Bundle was incomplete or failed
+        self._not_widened: Set[Tuple] = set()
+
+    def __getattr__(self, name):
+        if name == 'fhir':
+            raise AttributeError(name)
+        return getattr(self.fhir, name)
+
+    def read(self, resource_type: str,
+             resource_id: str) -> requests.Response:
+        self.stats.requests += 1
+        return self._fetch(('read', resource_type, resource_id),
+                           lambda: self.fhir.read(resource_type, resource_id))
+
+    def search(self,
+               resource_type: str,
+               search_params: Optional[dict] = None) -> requests.Response:
+        self.stats.requests += 1
+        search_params = search_params or {}
+
+        exact_key = ('search', resource_type, self._key(search_params))
+        if exact_key in self._responses:
+            self.stats.saved += 1
+            return self._responses[exact_key]
+
+        filters = self.local_filters.get(resource_type, {})
+        local = {
+            k: v
+            for k, v in search_params.items()
+            if k in filters and isinstance(v, str)
+        }
+        if not local:
+            return self._fetch(
+                exact_key,
+                lambda: self.fhir.search(resource_type, search_params))
+
+        server = {k: v for k, v in search_params.items() if k not in local}
+        wide_key = ('search', resource_type, self._key(server))
+        if wide_key in self._not_widened:
+            return self._fetch(
+                exact_key,
+                lambda: self.fhir.search(resource_type, search_params))
+
+        if wide_key in self._responses:
+            self.stats.saved += 1
+            response = self._responses[wide_key]
+        else:
+            self.stats.network_calls += 1
+            response = self.fhir.search(resource_type, server)
+            if response.status_code != 200 or self._has_next_page(response):
+                # the wide result cannot answer this search, ask for it directly
+                self._not_widened.add(wide_key)
+                self.stats.fallbacks += 1
+                return self._fetch(
+                    exact_key,
+                    lambda: self.fhir.search(resource_type, search_params))
+            self._responses[wide_key] = response
+
+        narrowed = self._filter_bundle(response, local, filters)
+        self._responses[exact_key] = narrowed
+        return narrowed
+
+    def create(self, resource_type: str,
+               payload: dict) -> requests.Response:
+        response = self.fhir.create(resource_type, payload)
+        self.invalidate(resource_type)
+        return response
+
+    def update(self, resource_type: str, resource_id: str,
+               payload: dict) -> requests.Response:
+        response = self.fhir.update(resource_type, resource_id, payload)
+        self.invalidate(resource_type, resource_id)
+        return response
+
+    def invalidate(self,
+                   resource_type: str,
+                   resource_id: Optional[str] = None) -> None:
+        for key in list(self._responses):
+            if key[1] == resource_type and (key[0] == 'search' or
+                                            key[2] == resource_id):
+                del self._responses[key]
+        self._not_widened = {
+            key for key in self._not_widened if key[1] != resource_type
+        }
+
+    def _fetch(self, key: Tuple,
+               fetch: Callable[[], requests.Response]) -> requests.Response:
+        if key in self._responses:
+            self.stats.saved += 1
+            return self._responses[key]
+
+        self.stats.network_calls += 1
+        response = fetch()
+        if response.status_code == 200:
+            self._responses[key] = response
+        return response
+
+    @staticmethod
+    def _key(search_params: dict) -> str:
+        return urlencode(sorted(search_params.items()), doseq=True)
+
+    @staticmethod
+    def _has_next_page(response: requests.Response) -> bool:
+        return any(link.get('relation') == 'next'
+                   for link in response.json().get('link', []))
+
+    @staticmethod
+    def _filter_bundle(response: requests.Response, local: dict,
+                       filters: Dict[str, LocalFilter]) -> requests.Response:
+        bundle = response.json()
+        entries = [
+            entry for entry in bundle.get('entry', []) if all(
+                filters[param](entry.get('resource', {}), value)
+                for param, value in local.items())
+        ]
+
+        narrowed = requests.Response()
+        narrowed.status_code = response.status_code
+        narrowed.headers.update(response.headers)
+        narrowed._content = json.dumps({
+            **bundle, 'total': len(entries),
+            'entry': entries
+        }).encode()
+        return narrowed
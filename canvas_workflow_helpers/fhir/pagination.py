@@ -0,0 +1,99 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+import requests
+
+from requests import RequestException
+
+from canvas_workflow_kit.fhir import FHIRHelper
+
+
+def next_page_url(bundle: dict) -> Optional[str]:
+    for link in bundle.get('link', []):
+        if link.get('relation') == 'next':
+            return link.get('url')
+    return None
+
+
+def _checked_json(response: requests.Response, description: str) -> dict:
+    if response.status_code != 200:
+        raise RequestException(
+            f'FHIR {description} could not be fetched: {response.text} and '
+            f"fumage_correlation_id: {response.headers.get('fumage-correlation-id')}"
+        )
+    return response.json()
+
+
+def iter_pages(fhir: FHIRHelper,
+               resource_type: str,
+               search_params: Optional[dict] = None,
+               prefetch: bool = False) -> Iterator[dict]:
+    """
+    Yield every Bundle page of a FHIR search, following `next` links only as
+    the caller asks for more.
+
+    With `prefetch`, the following page is requested on a background thread
+    while the caller works through the current one. Closing the generator
+    early drops any page still being fetched.
+    """
+    bundle = _checked_json(fhir.search(resource_type, search_params),
+                           f'{resource_type} search')
+
+    def fetch(url: str) -> dict:
+        return _checked_json(requests.get(url, headers=fhir.headers),
+                             f'{resource_type} page')
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    pending: Optional[Future] = None
+    try:
+        while True:
+            url = next_page_url(bundle)
+            if executor and url:
+                pending = executor.submit(fetch, url)
+
+            yield bundle
+
+            if not url:
+                return
+            bundle = pending.result() if pending else fetch(url)
+            pending = None
+    finally:
+        if pending:
+            pending.cancel()
+        if executor:
+            executor.shutdown(wait=False)
+
+
+def iter_search(fhir: FHIRHelper,
+                resource_type: str,
+                search_params: Optional[dict] = None,
+                prefetch: bool = False) -> Iterator[dict]:
+    """
+    Yield the resources matched by a FHIR search across all of its pages,
+    one page in memory at a time.
+
+        for task in iter_search(fhir, 'Task', {'patient': f'Patient/{key}'}):
+            ...
+    """
+    for bundle in iter_pages(fhir, resource_type, search_params, prefetch):
+        for entry in bundle.get('entry', []):
+            yield entry['resource']
+
+
+def search_first(fhir: FHIRHelper,
+                 resource_type: str,
+                 search_params: Optional[dict] = None,
+                 predicate: Callable[[dict], bool] = lambda resource: True,
+                 prefetch: bool = False) -> Optional[dict]:
+    """
+    Return the first resource matching `predicate`, without fetching the
+    pages that follow it.
+    """
+    resources = iter_search(fhir, resource_type, search_params, prefetch)
+    try:
+        for resource in resources:
+            if predicate(resource):
+                return resource
+        return None
+    finally:
+        resources.close()
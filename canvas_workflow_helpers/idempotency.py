@@ -0,0 +1,176 @@
+import abc
+import hashlib
+import json
+import threading
+import time
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from canvas_workflow_helpers.snapshots import connect_sqlite
+
+
+def fingerprint(payload: Any) -> str:
+    """
+    A stable hash of a side effect's payload. Dicts are hashed with sorted
+    keys, so the same content always has the same fingerprint. JSON strings
+    (as passed to send_notification) are parsed first.
+    """
+    if isinstance(payload, (str, bytes)):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            pass
+    canonical = json.dumps(payload,
+                           sort_keys=True,
+                           separators=(',', ':'),
+                           default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def idempotency_key(protocol: str, patient_key: str, payload: Any) -> str:
+    return f'{protocol}:{patient_key}:{fingerprint(payload)}'
+
+
+def succeeded(result: Any) -> bool:
+    """ False for an error response (as send_notification returns), else True. """
+    return not isinstance(result, requests.Response) or result.ok
+
+
+class IdempotencyStore(abc.ABC):
+    """
+    Remembers which side effects (webhooks, task creates, ...) were already
+    performed for a protocol and patient.
+
+    `claim` returns True the first time it is called for a payload and False
+    for every identical call until the entry expires, so a recomputed
+    protocol can skip repeating the side effect. Subclasses implement
+    `_claim`, `_release` and `purge_expired`.
+    """
+
+    def __init__(self,
+                 default_ttl: float = 24 * 60 * 60,
+                 clock: Callable[[], float] = time.time):
+        self.default_ttl = default_ttl
+        self.clock = clock
+
+    def claim(self,
+              protocol: str,
+              patient_key: str,
+              payload: Any,
+              ttl: Optional[float] = None) -> bool:
+        key = idempotency_key(protocol, patient_key, payload)
+        ttl = self.default_ttl if ttl is None else ttl
+        return self._claim(key, self.clock(), self.clock() + ttl)
+
+    def release(self, protocol: str, patient_key: str, payload: Any) -> None:
+        """ Forget a claim, e.g. because the side effect failed. """
+        self._release(idempotency_key(protocol, patient_key, payload))
+
+    def once(self,
+             protocol: str,
+             patient_key: str,
+             payload: Any,
+             action: Callable[[], Any],
+             ttl: Optional[float] = None,
+             check: Callable[[Any], bool] = succeeded) -> Tuple[bool, Any]:
+        """
+        Run `action` unless this side effect was already performed. Returns
+        whether it ran and what it returned. If `action` raises, or `check`
+        finds that what it returned is a failure (by default an error
+        response), the claim is released so the next evaluation tries again.
+        """
+        if not self.claim(protocol, patient_key, payload, ttl):
+            return False, None
+        try:
+            result = action()
+        except Exception:
+            self.release(protocol, patient_key, payload)
+            raise
+        if not check(result):
+            self.release(protocol, patient_key, payload)
+        return True, result
+
+    @abc.abstractmethod
+    def purge_expired(self) -> int:
+        """ Delete the expired claims, returning how many there were. """
+
+    @abc.abstractmethod
+    def _claim(self, key: str, now: float, expires_at: float) -> bool:
+        """ Claim `key` unless a claim expiring after `now` exists. """
+
+    @abc.abstractmethod
+    def _release(self, key: str) -> None:
+        """ Delete the claim of `key`, if any. """
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """ Process local store, useful for tests and single process runs. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._expires_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _claim(self, key: str, now: float, expires_at: float) -> bool:
+        with self._lock:
+            if self._expires_at.get(key, 0) > now:
+                return False
+            self._expires_at[key] = expires_at
+            return True
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._expires_at.pop(key, None)
+
+    def purge_expired(self) -> int:
+        now = self.clock()
+        with self._lock:
+            expired = [k for k, v in self._expires_at.items() if v <= now]
+            for key in expired:
+                del self._expires_at[key]
+        return len(expired)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency store backed by a SQLite file, shared by every process that
+    points at the same path. Lookups go through the primary key index.
+
+        STORE = SQLiteIdempotencyStore('/var/lib/protocols/idempotency.db')
+        if STORE.claim('NoShowHandler', patient_key, task_payload):
+            self.set_updates([task_payload])
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._connection = connect_sqlite(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS idempotency_keys '
+                                 '(key TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+
+    def _claim(self, key: str, now: float, expires_at: float) -> bool:
+        with self._lock:
+            # an expired row is replaced, a live one is left alone
+            cursor = self._connection.execute(
+                'INSERT INTO idempotency_keys (key, expires_at) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at '
+                'WHERE idempotency_keys.expires_at <= ?',
+                (key, expires_at, now))
+            return cursor.rowcount == 1
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                'DELETE FROM idempotency_keys WHERE key = ?', (key, ))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                'DELETE FROM idempotency_keys WHERE expires_at <= ?',
+                (self.clock(), ))
+            return cursor.rowcount
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,223 @@
+"""
+Incremental recomputation of protocol facts driven by field_changes.
+
+A protocol declares its derived facts and the models (or model fields)
+each depends on. The facts of the last evaluation are kept per patient in
+a FactSnapshotStore; on the next evaluation only the facts whose
+dependencies match the incoming field_changes are recomputed, the others
+are read back from the snapshot.
+
+    class VisitFrequency(IncrementalFactsMixin, ClinicalQualityMeasure):
+        fact_store = SQLiteFactSnapshotStore('/var/lib/protocols/facts.db')
+
+        @fact('condition')
+        def has_diabetes(self) -> bool:
+            ...
+
+        @fact('appointment.state', 'appointment.start_time')
+        def last_appointment(self) -> Optional[str]:
+            ...
+
+        def compute_results(self):
+            if self.has_diabetes():
+                ...
+            self.save_facts()
+
+A dependency is a model name ('condition') or 'model.field'. A field
+dependency matches when that field changed or the record was created. With
+no field_changes (a report or bulk recompute), no snapshot or a new protocol
+version every fact is recomputed. Fact values must be JSON serializable.
+
+Facts that depend on the time of the evaluation (anything computed over
+"the last 6 months", "overdue", ...) go stale without any change to the
+patient. Give them a `max_age` in seconds: the snapshot records, for
+every fact, the `now` of the evaluation that computed it (kept as is while
+the fact is reused), and such a fact is recomputed once the current `now`
+is more than `max_age` after it (or before it).
+
+        @fact('appointment', max_age=24 * 60 * 60)
+        def visits_last_six_months(self) -> int:
+            ...
+"""
+import functools
+import inspect
+import time
+
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from canvas_workflow_helpers.snapshots import (MemorySnapshotStore,
+                                               SnapshotStore,
+                                               SQLiteSnapshotStore)
+
+
+def fact(*depends_on: str, max_age: Optional[float] = None):
+    """
+    Declare a method as a fact depending on models / model fields, and with
+    `max_age`, on the time of the evaluation.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(self):
+            return self._fact_value(name, func)
+
+        wrapper.__fact_dependencies__ = tuple(depends_on)
+        wrapper.__fact_max_age__ = max_age
+        wrapper.__fact_function__ = func
+        return wrapper
+
+    return decorator
+
+
+def depends_on_change(dependencies: Tuple[str, ...],
+                      field_changes: Optional[dict]) -> bool:
+    """ Whether a fact with these dependencies is affected by a change. """
+    if not field_changes or not field_changes.get('model_name'):
+        return True
+    model_name = field_changes['model_name']
+    fields = field_changes.get('fields')
+    for dependency in dependencies:
+        model, _, field = dependency.partition('.')
+        if model not in (model_name, '*'):
+            continue
+        if not field or field_changes.get('created') or fields is None:
+            return True
+        if field in fields:
+            return True
+    return False
+
+
+class FactSnapshotStore(SnapshotStore):
+    """ Keeps the facts of the last evaluation per protocol and patient. """
+
+
+class MemoryFactSnapshotStore(MemorySnapshotStore, FactSnapshotStore):
+    pass
+
+
+class SQLiteFactSnapshotStore(SQLiteSnapshotStore, FactSnapshotStore):
+    table = 'fact_snapshots'
+
+
+class IncrementalFactsMixin(object):
+    """
+    Put before ClinicalQualityMeasure in the bases of a protocol that
+    declares @fact methods. Without a `fact_store` every fact is computed
+    once per evaluation, as if the protocol did not use this mixin.
+
+    `recomputed_facts` and `reused_facts` tell which facts were computed in
+    this evaluation and which came from the snapshot.
+    """
+
+    fact_store: Optional[FactSnapshotStore] = None
+
+    @classmethod
+    def _fact_functions(cls) -> Dict[str, Callable]:
+        functions = {}
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if inspect.isfunction(value) and hasattr(
+                        value, '__fact_dependencies__'):
+                    functions[name] = value
+        return functions
+
+    @classmethod
+    def fact_dependencies(cls) -> Dict[str, Tuple[str, ...]]:
+        return {
+            name: function.__fact_dependencies__
+            for name, function in cls._fact_functions().items()
+        }
+
+    @classmethod
+    def fact_max_ages(cls) -> Dict[str, float]:
+        """ The facts declared with a max_age, and that age in seconds. """
+        return {
+            name: function.__fact_max_age__
+            for name, function in cls._fact_functions().items()
+            if function.__fact_max_age__ is not None
+        }
+
+    def facts(self) -> Dict[str, Any]:
+        """ Every declared fact, computing the ones not known yet. """
+        return {name: getattr(self, name)() for name in self.fact_dependencies()}
+
+    def save_facts(self) -> None:
+        """ Store the facts of this evaluation for the next one. """
+        if self.fact_store is None:
+            return
+        self.fact_store.put(
+            type(self).__name__, self._fact_patient_key(), {
+                'version': self._fact_version(),
+                'facts': self.facts(),
+                'computed_at': dict(self._fact_state()['computed_at']),
+            })
+
+    @property
+    def recomputed_facts(self) -> Set[str]:
+        return set(self._fact_state()['recomputed'])
+
+    @property
+    def reused_facts(self) -> Set[str]:
+        return set(self._fact_state()['reused'])
+
+    def _fact_patient_key(self) -> str:
+        return (self.patient.patient or {}).get('key', '')
+
+    def _fact_version(self) -> str:
+        meta = getattr(self, '_meta', None)
+        return str(getattr(meta, 'version', ''))
+
+    def _fact_now(self) -> float:
+        now = getattr(self, 'now', None)
+        return now.timestamp() if now is not None else time.time()
+
+    def _fact_state(self) -> dict:
+        state = self.__dict__.get('_incremental_facts')
+        if state is not None:
+            return state
+
+        previous, computed_at = {}, {}
+        if self.fact_store is not None:
+            snapshot = self.fact_store.get(type(self).__name__,
+                                           self._fact_patient_key())
+            if snapshot and snapshot.get('version') == self._fact_version():
+                previous = snapshot.get('facts', {})
+                computed_at = snapshot.get('computed_at', {})
+
+        field_changes = getattr(self, 'field_changes', None)
+        now = self._fact_now()
+        max_ages = self.fact_max_ages()
+        reusable = {
+            name
+            for name, dependencies in self.fact_dependencies().items()
+            if name in previous and
+            not depends_on_change(dependencies, field_changes) and
+            (name not in max_ages or
+             (name in computed_at and
+              0 <= now - computed_at[name] <= max_ages[name]))
+        }
+        state = {
+            'values': {name: previous[name] for name in reusable},
+            # a reused fact keeps the time it was computed at
+            'computed_at': {
+                name: computed_at.get(name, now) for name in reusable
+            },
+            'recomputed': set(),
+            'reused': set(),
+        }
+        self.__dict__['_incremental_facts'] = state
+        return state
+
+    def _fact_value(self, name: str, func: Callable) -> Any:
+        state = self._fact_state()
+        if name in state['values']:
+            if name not in state['recomputed']:
+                state['reused'].add(name)
+            return state['values'][name]
+        value = func(self)
+        state['values'][name] = value
+        state['computed_at'][name] = self._fact_now()
+        state['recomputed'].add(name)
+        return value
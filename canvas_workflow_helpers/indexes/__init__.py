@@ -0,0 +1,7 @@
+from .appointments import AppointmentTimeline
+from .base import PatientIndex
+from .labs import (LabResultClassifier, LabResultIndex, LabSeries,
+                   parse_reference_range, parse_value)
+from .medications import MedicationClassifier, MedicationClassIndex
+from .tasks import (FHIR_TASK_STATUS, OpenTaskIndex, staff_key,
+                    task_from_create_payload)
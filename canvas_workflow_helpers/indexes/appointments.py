@@ -0,0 +1,144 @@
+import bisect
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+
+from .base import PatientIndex
+
+
+class AppointmentTimeline(PatientIndex):
+    """
+    Appointments of a patient indexed once, for lookups that otherwise loop
+    over every appointment and its state history:
+
+    - appointment by id or externallyExposableId, and by the id of any of
+      its state events (a NoteStateChangeEvent)
+    - upcoming appointment notes by id
+    - appointments sorted by startTime, searched with bisect
+    - for every state, when each appointment entered it
+
+        timeline = AppointmentTimeline.for_patient(self.patient)
+        appointment = timeline.by_state_event(event_id)
+        checked_in = [timeline.transition_time(a, 'CVD')
+                      for a in timeline.in_states('LKD', 'CVD')]
+    """
+
+    def __init__(self, patient: Patient):
+        super().__init__(patient)
+        self._by_id: Dict[str, dict] = {}
+        self._by_state_event: Dict[str, dict] = {}
+        self._by_current_state: Dict[str, List[dict]] = defaultdict(list)
+        # state -> [(entered at, appointment)] sorted by time
+        self._transitions: Dict[str, List[Tuple[arrow.Arrow,
+                                                dict]]] = defaultdict(list)
+        # appointment id -> state -> first time it entered the state
+        self._entered: Dict[str, Dict[str, arrow.Arrow]] = {}
+        self._count = 0
+        self._start_times: List[arrow.Arrow] = []
+        self._by_start: List[dict] = []
+        self._upcoming_notes: Dict[str, dict] = {}
+
+        starts = []
+        for appointment in patient.appointments.records or []:
+            self._count += 1
+            for key in (appointment.get('id'),
+                        appointment.get('externallyExposableId')):
+                if key is not None:
+                    self._by_id[str(key)] = appointment
+
+            state = (appointment.get('state') or {}).get('state')
+            if state:
+                self._by_current_state[state].append(appointment)
+
+            entered: Dict[str, arrow.Arrow] = {}
+            for event in appointment.get('stateHistory') or []:
+                if event.get('id') is not None:
+                    self._by_state_event[str(event['id'])] = appointment
+                if event.get('state') and event.get('created'):
+                    created = arrow.get(event['created'])
+                    self._transitions[event['state']].append(
+                        (created, appointment))
+                    if event['state'] not in entered:
+                        entered[event['state']] = created
+            key = self._key(appointment)
+            if key is not None:
+                self._entered[key] = entered
+
+            if appointment.get('startTime'):
+                starts.append((arrow.get(appointment['startTime']),
+                               appointment))
+
+        starts.sort(key=lambda start: start[0])
+        self._start_times = [start for start, _ in starts]
+        self._by_start = [appointment for _, appointment in starts]
+        for transitions in self._transitions.values():
+            transitions.sort(key=lambda transition: transition[0])
+
+        for note in patient.upcoming_appointment_notes.records or []:
+            if note.get('id') is not None:
+                self._upcoming_notes[str(note['id'])] = note
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _key(appointment) -> Optional[str]:
+        if not isinstance(appointment, dict):
+            return str(appointment)
+        for key in (appointment.get('id'),
+                    appointment.get('externallyExposableId')):
+            if key is not None:
+                return str(key)
+        return None
+
+    def get(self, appointment_id) -> Optional[dict]:
+        return self._by_id.get(str(appointment_id))
+
+    def by_state_event(self, event_id) -> Optional[dict]:
+        """ The appointment one of whose stateHistory entries has this id. """
+        return self._by_state_event.get(str(event_id))
+
+    def upcoming_note(self, note_id) -> Optional[dict]:
+        return self._upcoming_notes.get(str(note_id))
+
+    def in_states(self, *states: str) -> List[dict]:
+        """ Appointments whose current state is one of `states`. """
+        return [
+            appointment for state in states
+            for appointment in self._by_current_state.get(state, [])
+        ]
+
+    def sorted_by_start(self) -> List[dict]:
+        return list(self._by_start)
+
+    def between(self, start: arrow.Arrow, end: arrow.Arrow) -> List[dict]:
+        """ Appointments starting in [start, end], earliest first. """
+        low = bisect.bisect_left(self._start_times, start)
+        high = bisect.bisect_right(self._start_times, end)
+        return self._by_start[low:high]
+
+    def last_before(self, moment: arrow.Arrow) -> Optional[dict]:
+        position = bisect.bisect_left(self._start_times, moment)
+        return self._by_start[position - 1] if position else None
+
+    def next_after(self, moment: arrow.Arrow) -> Optional[dict]:
+        position = bisect.bisect_right(self._start_times, moment)
+        if position < len(self._by_start):
+            return self._by_start[position]
+        return None
+
+    def transition_time(self, appointment: Union[dict, int, str],
+                        state: str) -> Optional[arrow.Arrow]:
+        """
+        When `appointment` (a record, or its id) first entered `state`, if it
+        ever did.
+        """
+        return self._entered.get(self._key(appointment), {}).get(state)
+
+    def transitions(self, state: str) -> List[Tuple[arrow.Arrow, dict]]:
+        """ Every (time, appointment) that entered `state`, oldest first. """
+        return list(self._transitions.get(state, []))
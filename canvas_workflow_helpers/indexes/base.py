@@ -0,0 +1,42 @@
+import threading
+import weakref
+
+from canvas_workflow_kit.patient import Patient
+
+_REGISTRY_LOCK = threading.Lock()
+
+
+class PatientIndex(object):
+    """
+    Base class for lookup structures derived from a loaded Patient.
+
+    `for_patient` builds the index the first time it is asked for a patient
+    object and hands back the same instance afterwards, so every protocol
+    evaluated against that patient shares one build. The index goes away
+    with the patient.
+    """
+
+    def __init__(self, patient: Patient):
+        self.patient = patient
+
+    @classmethod
+    def for_patient(cls, patient: Patient) -> 'PatientIndex':
+        with _REGISTRY_LOCK:
+            registry = cls.__dict__.get('_registry')
+            if registry is None:
+                registry = weakref.WeakKeyDictionary()
+                cls._registry = registry
+
+            index = registry.get(patient)
+            if index is None:
+                index = cls(patient)
+                registry[patient] = index
+            return index
+
+    @classmethod
+    def discard(cls, patient: Patient) -> None:
+        """ Forget the index built for `patient`, e.g. after it was reloaded. """
+        with _REGISTRY_LOCK:
+            registry = cls.__dict__.get('_registry')
+            if registry is not None:
+                registry.pop(patient, None)
@@ -0,0 +1,369 @@
+import math
+import re
+import threading
+import weakref
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.patient_recordset import (SYSTEM_CODE_MAPPING,
+                                                   LabReportRecordSet)
+from canvas_workflow_kit.timeframe import Timeframe
+
+# (from unit, to unit) -> (scale, offset): to = from * scale + offset; the
+# inverse of each is added by with_inverses
+UNIT_CONVERSIONS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ('g/L', 'mg/dL'): (100.0, 0.0),
+    ('mg/L', 'mg/dL'): (0.1, 0.0),
+    ('g/dL', 'mg/dL'): (1000.0, 0.0),
+    ('ug/dL', 'mcg/dL'): (1.0, 0.0),
+    ('mU/L', 'mIU/L'): (1.0, 0.0),
+    ('uIU/mL', 'mIU/L'): (1.0, 0.0),
+    # HbA1c, IFCC to NGSP
+    ('mmol/mol', '%'): (0.09148, 2.152),
+}
+
+# conversions that depend on the analyte (a molar mass), per test name
+GLUCOSE_CONVERSIONS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ('mmol/L', 'mg/dL'): (18.016, 0.0),
+}
+TEST_CONVERSIONS: Dict[str, Dict[Tuple[str, str], Tuple[float, float]]] = {
+    'glucose': GLUCOSE_CONVERSIONS,
+}
+
+# spellings seen in lab feeds -> the unit used in the conversion tables
+_UNIT_ALIASES = {
+    alias.lower(): unit
+    for conversions in (UNIT_CONVERSIONS, *TEST_CONVERSIONS.values())
+    for unit in {unit for pair in conversions for unit in pair}
+    for alias in (unit, unit.replace('u', 'µ'), unit.replace('u', 'μ'))
+}
+
+_RANGE = re.compile(
+    r'^\s*(?P<low>[-+]?\d*\.?\d+)\s*(?:-|–|to)\s*(?P<high>[-+]?\d*\.?\d+)\s*$')
+_BOUND = re.compile(r'^\s*(?P<op>[<>]=?)\s*(?P<value>[-+]?\d*\.?\d+)\s*$')
+
+
+def with_inverses(
+    conversions: Dict[Tuple[str, str], Tuple[float, float]]
+) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """ `conversions` and, where missing, the conversion back of each. """
+    inverted = {(to, source): (1 / scale, -offset / scale)
+                for (source, to), (scale, offset) in conversions.items()
+                if scale}
+    return {**inverted, **conversions}
+
+
+def parse_value(value) -> Optional[float]:
+    """ A lab value as a float, None when it is not a plain number. """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        text = str(value or '').strip().rstrip('%').replace(',', '')
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+
+def normalize_unit(unit: Optional[str]) -> str:
+    unit = (unit or '').strip()
+    return _UNIT_ALIASES.get(unit.lower(), unit)
+
+
+def parse_reference_range(
+        reference: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """ '4.0-5.6' -> (4.0, 5.6), '<100' -> (None, 100.0), else (None, None). """
+    reference = reference or ''
+    match = _RANGE.match(reference)
+    if match:
+        return float(match['low']), float(match['high'])
+    match = _BOUND.match(reference)
+    if match:
+        bound = float(match['value'])
+        return (None, bound) if match['op'].startswith('<') else (bound, None)
+    return None, None
+
+
+class LabSeries(object):
+    """
+    The numeric results of one lab test, ordered by the instant they were
+    taken. Timestamps and values are kept in parallel arrays of doubles, and
+    the positions sorted by value answer threshold queries with bisection.
+    Every value is in the series unit: the configured one, else the unit of
+    the oldest report that has one. Reports whose date or value cannot be
+    parsed, or whose unit cannot be converted to the series unit, are in
+    `unparseable` as (report, reason) instead.
+    """
+
+    def __init__(self, name: str, unit: Optional[str] = None):
+        self.name = name
+        self.unit = normalize_unit(unit) if unit else None
+        self.timestamps = array('d')
+        self.values = array('d')
+        self.units: List[str] = []
+        self.reference_ranges: List[Tuple[Optional[float], Optional[float]]] = []
+        self.reports: List[dict] = []
+        self.unparseable: List[Tuple[dict, str]] = []
+        self._by_value: Optional[Tuple[array, array]] = None
+
+    @classmethod
+    def _build(cls, name: str, unit: Optional[str], reports: List[dict],
+               conversions: Dict) -> 'LabSeries':
+        series = cls(name, unit)
+        dated = []
+        for report in reports:
+            try:
+                dated.append((arrow.get(report['originalDate']).timestamp(),
+                              report))
+            except (KeyError, TypeError, ValueError):
+                series.unparseable.append((report, 'date'))
+        # the dates do not all have the same offset, order by instant
+        dated.sort(key=lambda entry: entry[0])
+        for timestamp, report in dated:
+            series._add(timestamp, report, conversions)
+        return series
+
+    def _add(self, timestamp: float, report: dict, conversions: Dict) -> None:
+        value = parse_value(report.get('value'))
+        if value is None:
+            self.unparseable.append((report, 'value'))
+            return
+
+        unit = normalize_unit(report.get('units'))
+        low, high = parse_reference_range(report.get('referenceRange'))
+        if self.unit is None and unit:
+            self.unit = unit
+        if unit and unit != self.unit:
+            if (unit, self.unit) not in conversions:
+                self.unparseable.append((report, 'unit'))
+                return
+            scale, offset = conversions[(unit, self.unit)]
+            value = value * scale + offset
+            low = low * scale + offset if low is not None else None
+            high = high * scale + offset if high is not None else None
+
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+        self.units.append(self.unit or '')
+        self.reference_ranges.append((low, high))
+        self.reports.append(report)
+        self._by_value = None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __bool__(self) -> bool:
+        return bool(self.values)
+
+    def _span(self, timeframe: Optional[Timeframe]) -> Tuple[int, int]:
+        if timeframe is None:
+            return 0, len(self.values)
+        return (bisect_left(self.timestamps, timeframe.start.timestamp()),
+                bisect_right(self.timestamps, timeframe.end.timestamp()))
+
+    def last_value(self) -> Optional[float]:
+        return self.values[-1] if self.values else None
+
+    def last_date(self) -> Optional[arrow.Arrow]:
+        return arrow.get(self.timestamps[-1]) if self.timestamps else None
+
+    def last_report(self) -> Optional[dict]:
+        return self.reports[-1] if self.reports else None
+
+    def within(self, timeframe: Timeframe) -> List[float]:
+        start, end = self._span(timeframe)
+        return list(self.values[start:end])
+
+    def _value_order(self) -> Tuple[array, array]:
+        """ The values in ascending order and the position of each. """
+        by_value = self._by_value
+        if by_value is None:
+            values = self.values
+            order = sorted(range(len(values)), key=values.__getitem__)
+            by_value = (array('d', (values[p] for p in order)),
+                        array('l', order))
+            self._by_value = by_value
+        return by_value
+
+    def _value_span(self,
+                    at_most: Optional[float] = None,
+                    at_least: Optional[float] = None,
+                    below: Optional[float] = None,
+                    above: Optional[float] = None) -> Tuple[int, int]:
+        """ The slice of _value_order passing every bound. """
+        values, _ = self._value_order()
+        low, high = 0, len(values)
+        if at_least is not None:
+            low = max(low, bisect_left(values, at_least))
+        if above is not None:
+            low = max(low, bisect_right(values, above))
+        if at_most is not None:
+            high = min(high, bisect_right(values, at_most))
+        if below is not None:
+            high = min(high, bisect_left(values, below))
+        return low, max(low, high)
+
+    def positions(self,
+                  timeframe: Optional[Timeframe] = None,
+                  at_most: Optional[float] = None,
+                  at_least: Optional[float] = None,
+                  below: Optional[float] = None,
+                  above: Optional[float] = None) -> Iterator[int]:
+        """ Positions of the values within `timeframe` passing every bound. """
+        start, end = self._span(timeframe)
+        if at_most is None and at_least is None and below is None and (
+                above is None):
+            return iter(range(start, end))
+        low, high = self._value_span(at_most, at_least, below, above)
+        matches = self._value_order()[1][low:high]
+        if timeframe is not None:
+            matches = filter(range(start, end).__contains__, matches)
+        return iter(sorted(matches))
+
+    def count(self, timeframe: Optional[Timeframe] = None, **bounds) -> int:
+        """ e.g. count(week, at_most=55) for hypoglycemic episodes. """
+        if timeframe is None:
+            low, high = self._value_span(**bounds)
+            return high - low
+        return sum(1 for _ in self.positions(timeframe, **bounds))
+
+    def matching(self, timeframe: Optional[Timeframe] = None,
+                 **bounds) -> LabReportRecordSet:
+        """ The reports `count` counts, as a recordset. """
+        return LabReportRecordSet(
+            [self.reports[p] for p in self.positions(timeframe, **bounds)])
+
+    def out_of_range(self, timeframe: Optional[Timeframe] = None) -> List[int]:
+        """ Positions of the values outside their report's reference range. """
+        start, end = self._span(timeframe)
+        return [
+            position for position in range(start, end)
+            if self._out_of_range(position)
+        ]
+
+    def _out_of_range(self, position: int) -> bool:
+        low, high = self.reference_ranges[position]
+        value = self.values[position]
+        return ((low is not None and value < low) or
+                (high is not None and value > high))
+
+
+class LabResultIndex(object):
+    """
+    A LabSeries per test of a LabResultClassifier, built in one pass over
+    patient.lab_reports.
+    """
+
+    def __init__(self,
+                 patient: Patient,
+                 reverse_index: Dict[Tuple[str, str], Set[str]],
+                 units: Dict[str, str],
+                 conversions: Dict,
+                 test_conversions: Optional[Dict[str, Dict]] = None):
+        self.patient = patient
+        test_conversions = test_conversions or {}
+        reports: Dict[str, List[dict]] = {
+            name: [] for names in reverse_index.values() for name in names
+        }
+
+        lab_reports = patient.lab_reports
+        for report in lab_reports.records:
+            names: Set[str] = set()
+            for coding in lab_reports.item_to_codes(report):
+                for system in SYSTEM_CODE_MAPPING.get(coding['system'], []):
+                    if system in LabReportRecordSet.VALID_SYSTEMS:
+                        names |= reverse_index.get((system, coding['code']),
+                                                   set())
+            for name in names:
+                reports[name].append(report)
+
+        self._series = {
+            name: LabSeries._build(name, units.get(name), name_reports, {
+                **conversions,
+                **test_conversions.get(name, {})
+            }) for name, name_reports in reports.items()
+        }
+
+    def series(self, name: str) -> LabSeries:
+        return self._series.get(name) or LabSeries(name)
+
+    def last_value(self, name: str) -> Optional[float]:
+        return self.series(name).last_value()
+
+    def unparseable(self) -> Dict[str, List[Tuple[dict, str]]]:
+        """ Per test, the reports that could not be used and why. """
+        return {
+            name: list(series.unparseable)
+            for name, series in self._series.items()
+            if series.unparseable
+        }
+
+
+class LabResultClassifier(object):
+    """
+    Maps lab reports to tests given as value sets, the way
+    MedicationClassifier maps medications to drug classes.
+
+        LABS = LabResultClassifier({
+            'a1c': Hba1CLaboratoryTest,
+            'glucose': GlucoseTest,
+        }, units={'a1c': '%'})
+
+        labs = LABS.for_patient(self.patient)
+        last_a1c = labs.last_value('a1c')
+        if labs.series('glucose').count(last_week, at_most=55):
+            ...
+
+    Values in another unit than the test's (the one given in `units`, else
+    the unit of its oldest report) are converted with `conversions` ((from,
+    to) -> (scale, offset)) and the conversions of `test_conversions` for
+    that test name, e.g. mmol/L to mg/dL for 'glucose', each usable in both
+    directions; reports in a unit that cannot be converted are reported as
+    unparseable.
+    """
+
+    def __init__(self,
+                 tests: Dict[str, object],
+                 units: Optional[Dict[str, str]] = None,
+                 conversions: Optional[Dict] = None,
+                 test_conversions: Optional[Dict[str, Dict]] = None):
+        self.tests = dict(tests)
+        self.units = dict(units or {})
+        self.conversions = with_inverses(
+            UNIT_CONVERSIONS if conversions is None else conversions)
+        self.test_conversions = {
+            name: with_inverses(name_conversions)
+            for name, name_conversions in (
+                TEST_CONVERSIONS if test_conversions is None else
+                test_conversions).items()
+        }
+        self._reverse_index: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        for name, value_set in self.tests.items():
+            for system, codes in value_set.values.items():
+                for code in codes:
+                    self._reverse_index[(system, code)].add(name)
+        self._lock = threading.Lock()
+        self._registry = weakref.WeakKeyDictionary()
+
+    def for_patient(self, patient: Patient) -> LabResultIndex:
+        with self._lock:
+            index = self._registry.get(patient)
+            if index is None:
+                index = LabResultIndex(patient, self._reverse_index,
+                                       self.units, self.conversions,
+                                       self.test_conversions)
+                self._registry[patient] = index
+            return index
+
+    def discard(self, patient: Patient) -> None:
+        with self._lock:
+            self._registry.pop(patient, None)
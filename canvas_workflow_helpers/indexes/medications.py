@@ -0,0 +1,124 @@
+import threading
+import weakref
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.patient_recordset import (SYSTEM_CODE_MAPPING,
+                                                   MedicationRecordSet)
+
+# one medication's time on a drug class: start, end (None while ongoing)
+Period = Tuple[arrow.Arrow, Optional[arrow.Arrow]]
+
+
+class MedicationClassIndex(object):
+    """
+    Every medication of a patient, active or historical, grouped under each
+    drug class its RXNORM or FDB codes belong to. Built by
+    MedicationClassifier.for_patient in one pass over patient.medications.
+    """
+
+    def __init__(self, patient: Patient,
+                 reverse_index: Dict[Tuple[str, str], Set[str]]):
+        self.patient = patient
+        self._by_class: Dict[str, List[dict]] = defaultdict(list)
+        self._classes_by_id: Dict[object, Set[str]] = {}
+
+        medications = patient.medications
+        for medication in medications.records:
+            classes: Set[str] = set()
+            for coding in medications.item_to_codes(medication):
+                for system in SYSTEM_CODE_MAPPING.get(coding['system'], []):
+                    if system in MedicationRecordSet.VALID_SYSTEMS:
+                        classes |= reverse_index.get((system, coding['code']),
+                                                     set())
+            for name in classes:
+                self._by_class[name].append(medication)
+            self._classes_by_id[medication.get('id')] = classes
+
+    def classes_of(self, medication: dict) -> Set[str]:
+        return set(self._classes_by_id.get(medication.get('id'), set()))
+
+    def medications(self,
+                    name: str,
+                    active_only: bool = False) -> MedicationRecordSet:
+        """
+        Medications of the class, as .find(ValueSet) would return them, or
+        as .find(ValueSet).filter(status='active') with `active_only`.
+        """
+        records = self._by_class.get(name, [])
+        if active_only:
+            records = [r for r in records if r.get('status') == 'active']
+        return MedicationRecordSet(list(records))
+
+    def has(self, name: str, active_only: bool = True) -> bool:
+        return bool(self.medications(name, active_only))
+
+    def periods(self, name: str) -> List[Period]:
+        """ Every period of every medication of the class, by start date. """
+        periods = [(arrow.get(period['from']),
+                    arrow.get(period['to']) if period.get('to') else None)
+                   for medication in self._by_class.get(name, [])
+                   for period in medication.get('periods') or []
+                   if period.get('from')]
+        return sorted(periods, key=lambda period: period[0])
+
+    def start(self, name: str) -> Optional[arrow.Arrow]:
+        """ When the patient first started a medication of the class. """
+        periods = self.periods(name)
+        return periods[0][0] if periods else None
+
+    def end(self, name: str) -> Optional[arrow.Arrow]:
+        """
+        When the patient stopped the class: the last end date, or None if a
+        medication of the class is still ongoing (or there is none).
+        """
+        periods = self.periods(name)
+        if not periods or any(end is None for _, end in periods):
+            return None
+        return max(end for _, end in periods)
+
+
+class MedicationClassifier(object):
+    """
+    Maps medications to drug classes given as value sets.
+
+    The codes of all classes go into one (system, code) -> classes index, so
+    classifying a patient is one pass over their medications whatever the
+    number of classes; the result is cached per patient object.
+
+        DRUG_CLASSES = MedicationClassifier({
+            'glp1': GLP1Agonists,
+            'insulin': Insulin,
+            'sulfonylureas': Sulfonylureas,
+        })
+
+        classes = DRUG_CLASSES.for_patient(self.patient)
+        if classes.has('insulin') or classes.has('sulfonylureas'):
+            ...
+    """
+
+    def __init__(self, classes: Dict[str, object]):
+        self.classes = dict(classes)
+        self._reverse_index: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        for name, value_set in self.classes.items():
+            for system, codes in value_set.values.items():
+                for code in codes:
+                    self._reverse_index[(system, code)].add(name)
+        self._lock = threading.Lock()
+        self._registry = weakref.WeakKeyDictionary()
+
+    def for_patient(self, patient: Patient) -> MedicationClassIndex:
+        with self._lock:
+            index = self._registry.get(patient)
+            if index is None:
+                index = MedicationClassIndex(patient, self._reverse_index)
+                self._registry[patient] = index
+            return index
+
+    def discard(self, patient: Patient) -> None:
+        with self._lock:
+            self._registry.pop(patient, None)
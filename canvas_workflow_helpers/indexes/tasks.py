@@ -0,0 +1,180 @@
+import threading
+
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from canvas_workflow_kit.patient import Patient
+
+from .base import PatientIndex
+
+# FHIR Task statuses and the Canvas task status they are stored as
+FHIR_TASK_STATUS = {
+    'requested': 'OPEN',
+    'completed': 'COMPLETED',
+    'cancelled': 'CLOSED',
+}
+
+
+def staff_key(assignee, keys_by_name: Optional[Dict[str, str]] = None) -> str:
+    """
+    The staff key of an assignee given as a staff key, a FHIR reference
+    ('Practitioner/<key>') or, when `keys_by_name` knows it, a display name
+    as patient.tasks has it.
+    """
+    assignee = assignee or ''
+    if assignee.startswith('Practitioner/'):
+        return assignee[len('Practitioner/'):]
+    return (keys_by_name or {}).get(assignee, assignee)
+
+
+def task_from_create_payload(payload: dict) -> dict:
+    """
+    Describe a task the way patient.tasks does, from either a
+    create_task_payload message or a FHIR Task resource.
+    """
+    if payload.get('resourceType') == 'Task':
+        labels = [
+            i.get('valueString') for i in payload.get('input', [])
+            if i.get('type', {}).get('text') == 'label'
+        ]
+        owner = (payload.get('owner') or {}).get('reference')
+        return {
+            'id': payload.get('id'),
+            'title': payload.get('description'),
+            'status': FHIR_TASK_STATUS.get(payload.get('status'),
+                                           payload.get('status')),
+            'assignee': staff_key(owner),
+            'labels': labels,
+        }
+
+    integration = payload.get('integration_payload', payload)
+    assignee = integration.get('assignee', {}).get('identifier', {})
+    return {
+        'id': integration.get('id'),
+        'title': integration.get('title'),
+        'status': integration.get('status', 'OPEN'),
+        'assignee': assignee.get('key', ''),
+        'team': integration.get('team_identifier', ''),
+        'labels': integration.get('labels') or [],
+    }
+
+
+class OpenTaskIndex(PatientIndex):
+    """
+    Tasks of a patient bucketed by (title, status), built once from
+    patient.tasks.
+
+    Existence checks by title, optionally narrowed by label and assignee, no
+    longer need a FHIR search or a scan over every task. Assignees are
+    compared by staff key: patient.tasks names them, so the names of the
+    patient's care team (and any given to `register_staff`) are mapped to
+    their keys, and FHIR references are reduced to theirs. Tasks this process
+    creates or updates are recorded with `record_create` and
+    `record_update`, so the index stays current until the patient is
+    reloaded.
+
+        tasks = OpenTaskIndex.for_patient(self.patient)
+        if not tasks.exists('Review New Intake'):
+            ...
+    """
+
+    def __init__(self, patient: Patient):
+        super().__init__(patient)
+        # reentrant, so upsert can hold it across its check and create
+        self._lock = threading.RLock()
+        self._buckets: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self._by_id: Dict[str, dict] = {}
+        self._staff_keys: Dict[str, str] = {}
+
+        for membership in patient.patient.get('careTeamMemberships') or []:
+            staff = membership.get('staff') or {}
+            name = ' '.join(
+                filter(None, [staff.get('firstName'),
+                              staff.get('lastName')]))
+            if name and staff.get('key'):
+                self._staff_keys[name] = staff['key']
+
+        for task in patient.tasks:
+            self._add(task)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def find(self,
+             title: str,
+             status: str = 'OPEN',
+             label: Optional[str] = None,
+             assignee: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            bucket = list(self._buckets.get((title, status), []))
+            keys_by_name = dict(self._staff_keys)
+        if assignee is not None:
+            assignee = staff_key(assignee, keys_by_name)
+        return [
+            task for task in bucket
+            if (label is None or label in (task.get('labels') or [])) and (
+                assignee is None or
+                staff_key(task.get('assignee'), keys_by_name) == assignee)
+        ]
+
+    def exists(self,
+               title: str,
+               status: str = 'OPEN',
+               label: Optional[str] = None,
+               assignee: Optional[str] = None) -> bool:
+        return bool(self.find(title, status, label, assignee))
+
+    def register_staff(self, keys_by_name: Dict[str, str]) -> None:
+        """ Map more staff display names to their keys. """
+        with self._lock:
+            self._staff_keys.update(keys_by_name)
+
+    def get(self, task_id) -> Optional[dict]:
+        return self._by_id.get(str(task_id))
+
+    def record_create(self, payload: dict) -> dict:
+        """ Add a task this process just created (SDK payload or FHIR Task). """
+        task = task_from_create_payload(payload)
+        with self._lock:
+            self._add(task)
+        return task
+
+    def record_update(self, task_id, **fields) -> Optional[dict]:
+        """ Apply changed fields (status, title, ...) to a known task. """
+        with self._lock:
+            task = self._by_id.get(str(task_id))
+            if task is None:
+                return None
+            self._remove(task)
+            task = {**task, **fields}
+            self._add(task)
+            return task
+
+    def upsert(self,
+               payload: dict,
+               create: Callable[[dict], object],
+               label: Optional[str] = None,
+               assignee: Optional[str] = None) -> bool:
+        """
+        Call `create(payload)` unless an open task with the payload's title
+        (and the given label / assignee) already exists. Returns whether the
+        task was created. The index stays locked until the task is recorded,
+        so threads upserting the same task create it once.
+        """
+        task = task_from_create_payload(payload)
+        with self._lock:
+            if self.exists(task['title'], task['status'], label, assignee):
+                return False
+            create(payload)
+            self.record_create(payload)
+        return True
+
+    def _add(self, task: dict) -> None:
+        self._buckets[(task.get('title'), task.get('status'))].append(task)
+        for key in (task.get('id'), task.get('externallyExposableId')):
+            if key is not None:
+                self._by_id[str(key)] = task
+
+    def _remove(self, task: dict) -> None:
+        bucket = self._buckets.get((task.get('title'), task.get('status')), [])
+        bucket[:] = [other for other in bucket if other is not task]
@@ -0,0 +1,160 @@
+"""
+Cached replacement for canvas_workflow_kit.utils.parse_class_from_python_source.
+
+Protocol classes are keyed by the sha256 of their source. Within a process a
+source is compiled and executed once and the same class object is returned
+afterwards. With WORKFLOW_HELPERS_BYTECODE_CACHE set to a directory, the
+compiled bytecode is also kept there so the next process skips compiling.
+Bytecode read back from that directory is executed, so it is only used when
+the directory belongs to the current user and nobody else can write to it.
+
+    Protocol = load_protocol_class(Path('protocols/appointment_updater.py'))
+"""
+import hashlib
+import importlib.util
+import inspect
+import marshal
+import os
+import tempfile
+import threading
+
+from pathlib import Path
+from types import CodeType
+from typing import Dict, Optional, Union
+
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure
+
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def private_directory(path: Union[str, Path]) -> Optional[Path]:
+    """
+    `path`, created with mode 0700 if missing, or None when it is not a
+    directory owned by the current user that only its owner can write to.
+    """
+    path = Path(path)
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        stat = path.lstat()
+    except OSError:
+        return None
+    if not path.is_dir() or path.is_symlink():
+        return None
+    if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+        return None
+    if stat.st_mode & 0o022:
+        return None
+    return path
+
+
+class ProtocolClassCache(object):
+    """
+    Compiled protocol classes by source hash. `compiles` counts sources
+    that had to be compiled, `hits` classes served from memory and
+    `disk_hits` bytecode read back from `cache_dir`. With `cache_dir` None,
+    or a directory that is not private to the current user, nothing is read
+    from or written to disk.
+    """
+
+    def __init__(self, cache_dir: Optional[Union[str, Path]] = None):
+        self.cache_dir = private_directory(cache_dir) if cache_dir else None
+        self.compiles = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self._classes: Dict[str, type] = {}
+        self._lock = threading.Lock()
+
+    def load(self, source: str) -> type:
+        """
+        Return the ClinicalQualityMeasure defined in `source`, raising
+        SyntaxError like parse_class_from_python_source when there is not
+        exactly one.
+        """
+        digest = source_hash(source)
+        with self._lock:
+            cls = self._classes.get(digest)
+            if cls is not None:
+                self.hits += 1
+                return cls
+
+            cls = self._class_from_code(self._code(source, digest))
+            self._classes[digest] = cls
+            return cls
+
+    def load_path(self, path: Union[str, Path]) -> type:
+        return self.load(Path(path).read_text())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._classes.clear()
+
+    def _code(self, source: str, digest: str) -> CodeType:
+        disk_path = None
+        if self.cache_dir:
+            disk_path = self.cache_dir / f'{digest}.bytecode'
+            code = self._read(disk_path)
+            if code is not None:
+                self.disk_hits += 1
+                return code
+
+        # same file name exec() would give the source
+        code = compile(source, '<string>', 'exec')
+        self.compiles += 1
+        if disk_path:
+            self._write(disk_path, code)
+        return code
+
+    @staticmethod
+    def _read(disk_path: Path) -> Optional[CodeType]:
+        try:
+            data = disk_path.read_bytes()
+        except OSError:
+            return None
+        magic = importlib.util.MAGIC_NUMBER
+        if not data.startswith(magic):
+            return None
+        try:
+            return marshal.loads(data[len(magic):])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _write(disk_path: Path, code: CodeType) -> None:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=disk_path.parent)
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+            os.replace(tmp_path, disk_path)
+        except OSError:
+            # the disk cache is only an optimization
+            pass
+
+    @staticmethod
+    def _class_from_code(code: CodeType) -> type:
+        spec = importlib.util.spec_from_loader('helper', loader=None)
+        helper = importlib.util.module_from_spec(spec)
+        exec(code, helper.__dict__)
+
+        clinical_quality_measures = [
+            cls for _, cls in inspect.getmembers(helper, inspect.isclass)
+            if cls.__module__ == 'helper' and
+            issubclass(cls, ClinicalQualityMeasure)
+        ]
+        if len(clinical_quality_measures) == 0:
+            raise SyntaxError('No clinical quality measures found.')
+        elif len(clinical_quality_measures) > 1:
+            raise SyntaxError('More than one clinical quality measures found.')
+        return clinical_quality_measures[0]
+
+
+PROTOCOL_CLASSES = ProtocolClassCache(
+    os.environ.get('WORKFLOW_HELPERS_BYTECODE_CACHE'))
+
+
+def load_protocol_class(source: Union[str, Path]) -> type:
+    """ Protocol class from source text or a path, through PROTOCOL_CLASSES. """
+    if isinstance(source, Path):
+        return PROTOCOL_CLASSES.load_path(source)
+    return PROTOCOL_CLASSES.load(source)
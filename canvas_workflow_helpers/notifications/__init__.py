@@ -0,0 +1,4 @@
+from .dispatcher import (RETRY_STATUS_CODES, DispatcherStats, Notification,
+                         NotificationDispatcher)
+from .batching import (NDJSON_CONTENT_TYPE, BatchingNotificationSender,
+                       decode_batch)
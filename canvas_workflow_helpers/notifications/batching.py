@@ -0,0 +1,194 @@
+import gzip
+import json
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import requests
+
+from .dispatcher import RETRY_STATUS_CODES
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+class Batch(object):
+
+    def __init__(self, url: str, headers: dict, created_at: float):
+        self.url = url
+        self.headers = headers
+        self.created_at = created_at
+        self.lines: List[str] = []
+
+    def body(self, compress: bool) -> bytes:
+        body = ('\n'.join(self.lines) + '\n').encode()
+        return gzip.compress(body) if compress else body
+
+    def request_headers(self, compress: bool) -> dict:
+        headers = {**self.headers, 'Content-Type': NDJSON_CONTENT_TYPE}
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+        return headers
+
+
+class BatchingNotificationSender(object):
+    """
+    Opt-in replacement for send_notification that groups payloads per
+    destination and posts them as one (gzip compressed) NDJSON request.
+
+    A batch is sent once it holds `max_batch_size` payloads or its oldest
+    payload has waited `max_wait` seconds. Every batch is sent by a single
+    background thread in the order the batches were closed, and payloads keep
+    their order inside a batch, so notifications about a patient reach the
+    receiver in the order they were sent. Connection errors and retryable
+    status codes are retried with exponential backoff before the next batch
+    is sent; batches still failing after `max_retries`, or failing with any
+    other error, are kept in `failed_batches`.
+
+        SENDER = BatchingNotificationSender(max_batch_size=200, max_wait=2)
+        SENDER.send(url, json.dumps(payload), {'Content-Type': 'application/json'})
+    """
+
+    def __init__(self,
+                 max_batch_size: int = 100,
+                 max_wait: float = 1.0,
+                 compress: bool = True,
+                 timeout: float = 10,
+                 max_retries: int = 3,
+                 backoff: float = 0.5,
+                 post: Optional[Callable[..., requests.Response]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.compress = compress
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.clock = clock
+        self.batches_sent = 0
+        self.retries = 0
+        self.payloads_sent = 0
+        self.failed_batches: List[Tuple[Batch, object]] = []
+
+        self._post = post or requests.Session().post
+        self._open: 'OrderedDict[Tuple, Batch]' = OrderedDict()
+        self._ready: List[Batch] = []
+        self._in_flight = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name='notification-batcher',
+                                        daemon=True)
+        self._thread.start()
+
+    def send(self, url: str, payload={}, headers={}) -> bool:
+        line = payload if isinstance(payload, str) else json.dumps(payload)
+        extra_headers = {
+            k: v for k, v in headers.items() if k.lower() != 'content-type'
+        }
+        key = (url, tuple(sorted(extra_headers.items())))
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('BatchingNotificationSender is closed')
+
+            batch = self._open.get(key)
+            if batch is None:
+                batch = Batch(url, extra_headers, self.clock())
+                self._open[key] = batch
+            batch.lines.append(line.replace('\n', ' '))
+
+            if len(batch.lines) >= self.max_batch_size:
+                self._ready.append(self._open.pop(key))
+            self._condition.notify_all()
+        return True
+
+    def flush(self) -> None:
+        """ Send every open batch now and wait until all were posted. """
+        with self._condition:
+            self._close_batches(force=True)
+            self._condition.notify_all()
+            while self._ready or self._in_flight:
+                self._condition.wait()
+
+    def close(self) -> None:
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _close_batches(self, force: bool = False) -> None:
+        now = self.clock()
+        for key in list(self._open):
+            if force or now - self._open[key].created_at >= self.max_wait:
+                self._ready.append(self._open.pop(key))
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready and not self._closed:
+                    self._close_batches()
+                    if self._ready:
+                        break
+                    self._condition.wait(timeout=self._next_deadline())
+                if self._closed and not self._ready:
+                    return
+                batch = self._ready.pop(0)
+                self._in_flight += 1
+
+            try:
+                self._deliver(batch)
+            except Exception as error:
+                self.failed_batches.append((batch, error))
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    def _next_deadline(self) -> Optional[float]:
+        if not self._open:
+            return None
+        oldest = min(batch.created_at for batch in self._open.values())
+        return max(0.0, oldest + self.max_wait - self.clock())
+
+    def _deliver(self, batch: Batch) -> None:
+        body = batch.body(self.compress)
+        headers = batch.request_headers(self.compress)
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                outcome = self._post(batch.url,
+                                     data=body,
+                                     headers=headers,
+                                     timeout=self.timeout)
+                retry = outcome.status_code in RETRY_STATUS_CODES
+            except requests.RequestException as error:
+                outcome = error
+                retry = True
+            except Exception as error:
+                # not worth retrying, but the sender thread must survive it
+                outcome = error
+                retry = False
+
+            if not retry or attempts > self.max_retries:
+                break
+            # later batches wait, so a patient's notifications stay in order
+            self.retries += 1
+            time.sleep(self.backoff * 2**(attempts - 1))
+
+        if isinstance(outcome, Exception) or not outcome.ok:
+            self.failed_batches.append((batch, outcome))
+            return
+
+        self.batches_sent += 1
+        self.payloads_sent += len(batch.lines)
+
+
+def decode_batch(body: bytes, compressed: bool = True) -> List[dict]:
+    """ Parse a body sent by BatchingNotificationSender back into payloads. """
+    if compressed:
+        body = gzip.decompress(body)
+    return [json.loads(line) for line in body.decode().splitlines() if line]
@@ -0,0 +1,200 @@
+import queue
+import threading
+import time
+
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class DispatcherStats(object):
+    """
+    Counters for a NotificationDispatcher. `rejected` counts notifications
+    dropped because the queue was full; `max_queue_depth` is the highest
+    number of notifications that were waiting at once.
+    """
+
+    def __init__(self):
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def observe_depth(self, depth: int) -> None:
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'enqueued': self.enqueued,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'max_queue_depth': self.max_queue_depth,
+        }
+
+
+class Notification(object):
+
+    def __init__(self, url: str, payload, headers: dict):
+        self.url = url
+        self.payload = payload
+        self.headers = headers
+        self.attempts = 0
+        self.response: Optional[requests.Response] = None
+        self.error: Optional[Exception] = None
+
+
+class NotificationDispatcher(object):
+    """
+    Delivers outbound notifications from a pool of background workers so
+    compute_results does not wait on the receiving server.
+
+    `send` takes the same arguments as canvas_workflow_kit.utils
+    send_notification but only puts the notification on a bounded queue.
+    Each worker keeps its own requests.Session, so connections to the same
+    host are kept alive between deliveries. Connection errors and retryable
+    status codes are retried with exponential backoff.
+
+    When the queue is full `send` waits up to `enqueue_timeout` seconds and
+    then drops the notification, counting it in `stats.rejected`. Sending
+    after `close` raises a RuntimeError.
+
+        DISPATCHER = NotificationDispatcher(workers=4)
+        DISPATCHER.send(url, json.dumps(payload), {'Content-Type': 'application/json'})
+    """
+
+    def __init__(self,
+                 workers: int = 4,
+                 max_queue_size: int = 1000,
+                 max_retries: int = 3,
+                 backoff: float = 0.5,
+                 timeout: float = 10,
+                 enqueue_timeout: float = 0,
+                 on_failure: Optional[Callable[[Notification], None]] = None,
+                 session_factory: Callable[[], requests.Session] = requests.
+                 Session):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.enqueue_timeout = enqueue_timeout
+        self.on_failure = on_failure
+        self.session_factory = session_factory
+        self.stats = DispatcherStats()
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+        self._queue: 'queue.Queue[Optional[Notification]]' = queue.Queue(
+            maxsize=max_queue_size)
+        self._workers: List[threading.Thread] = []
+        for index in range(workers):
+            worker = threading.Thread(target=self._work,
+                                      name=f'notification-dispatcher-{index}',
+                                      daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def send(self, url: str, payload={}, headers={}) -> bool:
+        """
+        Queue a notification. Returns False if it was dropped because the
+        queue stayed full.
+        """
+        notification = Notification(url, payload, headers)
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError('the NotificationDispatcher is closed')
+            try:
+                self._queue.put(notification,
+                                block=self.enqueue_timeout > 0,
+                                timeout=self.enqueue_timeout or None)
+            except queue.Full:
+                self.stats.increment('rejected')
+                return False
+
+        self.stats.increment('enqueued')
+        self.stats.observe_depth(self._queue.qsize())
+        return True
+
+    def flush(self) -> None:
+        """ Block until every queued notification was delivered or failed. """
+        self._queue.join()
+
+    def close(self) -> None:
+        """ Deliver what is queued, then stop the workers. """
+        with self._close_lock:
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _work(self) -> None:
+        session = self.session_factory()
+        try:
+            while True:
+                notification = self._queue.get()
+                try:
+                    if notification is None:
+                        return
+                    self._deliver(session, notification)
+                except Exception as error:
+                    # e.g. raised by on_failure; the worker keeps going
+                    notification.error = notification.error or error
+                finally:
+                    self._queue.task_done()
+        finally:
+            session.close()
+
+    def _deliver(self, session: requests.Session,
+                 notification: Notification) -> None:
+        while True:
+            notification.attempts += 1
+            try:
+                notification.response = session.post(
+                    notification.url,
+                    data=notification.payload,
+                    headers=notification.headers,
+                    timeout=self.timeout)
+                notification.error = None
+                retry = notification.response.status_code in RETRY_STATUS_CODES
+            except requests.RequestException as error:
+                notification.error = error
+                retry = True
+            except Exception as error:
+                notification.error = error
+                self._fail(notification)
+                return
+
+            if not retry:
+                if notification.response.ok:
+                    self.stats.increment('delivered')
+                else:
+                    self._fail(notification)
+                return
+
+            if notification.attempts > self.max_retries:
+                self._fail(notification)
+                return
+
+            self.stats.increment('retries')
+            time.sleep(self.backoff * 2**(notification.attempts - 1))
+
+    def _fail(self, notification: Notification) -> None:
+        self.stats.increment('failed')
+        if self.on_failure:
+            self.on_failure(notification)
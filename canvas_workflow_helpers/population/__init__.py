@@ -0,0 +1,8 @@
+from .diabetes_visits import (INTERVALS, WORKLIST_FIELDS, build_worklist,
+                              control_level, worklist_entry, write_worklist)
+from .dumps import patient_directories, read_records
+from .group_membership import (CareTeamMemberRule, MembershipRule,
+                               OptOutConsentRule, desired_membership,
+                               group_updates, reconcile, rules_from_config)
+from .hcc_gaps import (gaps_by_hcc, hcc_index, iter_hcc_gaps,
+                       patient_hcc_gaps, write_gap_report)
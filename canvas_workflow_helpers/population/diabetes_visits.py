@@ -0,0 +1,252 @@
+"""
+Panel-wide worklist of diabetic patients whose next visit is overdue.
+
+Applies the rules of the collective VisitFrequencyForDiabetes protocol to a
+directory of patient dumps (the tests/mock_data layout) in one batch: for
+every diabetic patient with a past visit, the recommended interval follows
+from the last A1c and recent hypoglycemia, and the patient is on the
+worklist when there is no upcoming appointment inside that interval.
+
+Only the files the rules need are read, and a patient without an active
+diabetes diagnosis is dropped after conditions.json, so large panels are
+processed in seconds. Patients are spread over worker processes.
+
+    python -m canvas_workflow_helpers.population.diabetes_visits /data/patients \\
+        --output worklist.csv --workers 8
+"""
+import argparse
+import csv
+import multiprocessing
+
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import arrow
+
+from canvas_workflow_helpers.value_sets.v2021 import (Diabetes,
+                                                      EndStageRenalDisease,
+                                                      Hba1CLaboratoryTest)
+
+from .dumps import patient_directories, read_records
+
+URL_ICD10 = 'ICD-10'
+
+DIABETES_CODES = frozenset(Diabetes.ICD10CM)
+# EndStageHeartFailure | MetastaticMalignancy | EndStageRenalDisease, as in
+# the protocol; condition codes carry no dots
+LIMITED_LIFE_EXPECTANCY_CODES = frozenset(
+    {'I5084'} | {
+        code.replace('.', '') for code in {
+            'C77.0', 'C77.1', 'C77.2', 'C77.3', 'C77.4', 'C77.5', 'C77.8',
+            'C77.9', 'C78.00', 'C78.01', 'C78.02', 'C78.1', 'C78.2',
+            'C78.30', 'C78.39', 'C78.4', 'C78.5', 'C78.6', 'C78.7',
+            'C78.80', 'C78.89', 'C79.00', 'C79.01', 'C79.02', 'C79.10',
+            'C79.11', 'C79.19', 'C79.2', 'C79.31', 'C79.32', 'C79.40',
+            'C79.49', 'C79.51', 'C79.52', 'C79.60', 'C79.61', 'C79.62',
+            'C79.63', 'C79.70', 'C79.71', 'C79.72', 'C79.81', 'C79.82',
+            'C79.89', 'C79.9'
+        }
+    } | set(EndStageRenalDisease.ICD10CM))
+A1C_CODES = frozenset(Hba1CLaboratoryTest.LOINC)
+GLUCOSE_CODES = frozenset({'2349-9', '1558-6'})
+
+VERY_POORLY_CONTROLLED = 'very_poorly_controlled'
+POORLY_CONTROLLED = 'poorly_controlled'
+WELL_CONTROLLED = 'well_controlled'
+UNKNOWN = 'unknown'
+
+INTERVALS = {
+    VERY_POORLY_CONTROLLED: timedelta(days=30),
+    POORLY_CONTROLLED: timedelta(days=90),
+    WELL_CONTROLLED: timedelta(days=180),
+    UNKNOWN: timedelta(days=180),
+}
+
+WORKLIST_FIELDS = [
+    'patient_key',
+    'first_name',
+    'last_name',
+    'control_level',
+    'last_a1c',
+    'last_appointment',
+    'next_appointment',
+    'recommended_interval_days',
+    'due_date',
+    'days_overdue',
+]
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _age(birth_date: Optional[str], now: arrow.Arrow) -> int:
+    if not birth_date:
+        return 0
+    born = arrow.get(birth_date)
+    return now.year - born.year - ((now.month, now.day) < (born.month, born.day))
+
+
+def control_level(last_a1c: Optional[float], reduced_life_expectancy: bool,
+                  max_weekly_hypoglycemia: int) -> str:
+    """ DiabeticVisitFrequency.diabetes_control_level for given facts. """
+    if not last_a1c:
+        return UNKNOWN
+    very_poor, poor, well = (10, 8, 8) if reduced_life_expectancy else (9, 7, 7)
+    if last_a1c > very_poor and max_weekly_hypoglycemia >= 3:
+        return VERY_POORLY_CONTROLLED
+    if last_a1c > poor and max_weekly_hypoglycemia >= 1:
+        return POORLY_CONTROLLED
+    if last_a1c < well and max_weekly_hypoglycemia == 0:
+        return WELL_CONTROLLED
+    return UNKNOWN
+
+
+def patient_facts(directory: Path, now: arrow.Arrow) -> Optional[Dict]:
+    """
+    What the rules need to know about one patient, or None when the patient
+    has no active diabetes diagnosis or no past appointment.
+    """
+    directory = Path(directory)
+    has_diabetes = False
+    reduced_life_expectancy = False
+    for condition in read_records(directory, 'conditions'):
+        if condition.get('clinicalStatus') != 'active':
+            continue
+        for coding in condition.get('coding') or []:
+            if coding.get('system') != URL_ICD10:
+                continue
+            has_diabetes |= coding.get('code') in DIABETES_CODES
+            reduced_life_expectancy |= (coding.get('code')
+                                        in LIMITED_LIFE_EXPECTANCY_CODES)
+    if not has_diabetes:
+        return None
+
+    # the first check-in of every checked in or locked appointment
+    checked_in = []
+    for appointment in read_records(directory, 'appointments'):
+        if (appointment.get('state') or {}).get('state') not in ('LKD', 'CVD'):
+            continue
+        for event in appointment.get('stateHistory') or []:
+            if event.get('state') == 'CVD':
+                checked_in.append(arrow.get(event['created']))
+                break
+    if not checked_in:
+        return None
+
+    upcoming = [
+        start for start in (arrow.get(appointment['startTime'])
+                            for appointment in read_records(
+                                directory, 'upcoming_appointments')
+                            if appointment.get('startTime')) if start > now
+    ]
+
+    last_a1c_date, last_a1c = None, None
+    weekly_hypoglycemia = [0, 0, 0, 0]
+    for report in read_records(directory, 'lab_reports'):
+        if not report.get('originalDate'):
+            continue
+        # compared as instants, the dates do not all have the same offset
+        taken = arrow.get(report['originalDate'])
+        codes = {code.get('code') for code in report.get('loincCodes') or []}
+        if codes & A1C_CODES and (last_a1c_date is None or
+                                  taken >= last_a1c_date):
+            last_a1c_date, last_a1c = taken, report.get('value')
+        if codes & GLUCOSE_CODES:
+            value = _float(report.get('value'))
+            if value is None or value > 55:
+                continue
+            for week in range(4):
+                if (now.shift(weeks=-(week + 1)) <= taken <=
+                        now.shift(weeks=-week)):
+                    weekly_hypoglycemia[week] += 1
+
+    patient = read_records(directory, 'patient')
+    patient = patient if isinstance(patient, dict) else {}
+    reduced_life_expectancy |= _age(patient.get('birthDate'), now) >= 80
+
+    return {
+        'patient_key': patient.get('key') or directory.name,
+        'first_name': patient.get('firstName', ''),
+        'last_name': patient.get('lastName', ''),
+        'last_appointment': max(checked_in),
+        'next_appointment': min(upcoming) if upcoming else None,
+        'last_a1c': _float(last_a1c),
+        'control_level': control_level(_float(last_a1c),
+                                       reduced_life_expectancy,
+                                       max(weekly_hypoglycemia)),
+    }
+
+
+def worklist_entry(directory: Path, now: arrow.Arrow) -> Optional[Dict]:
+    """ The worklist row of a patient, None when the patient is on track. """
+    facts = patient_facts(directory, now)
+    if facts is None:
+        return None
+
+    interval = INTERVALS[facts['control_level']]
+    last, upcoming = facts['last_appointment'], facts['next_appointment']
+    if upcoming is not None and upcoming - last < interval:
+        return None
+
+    due = last + interval
+    return {
+        **facts,
+        'last_appointment': last.isoformat(),
+        'next_appointment': upcoming.isoformat() if upcoming else None,
+        'recommended_interval_days': interval.days,
+        'due_date': due.isoformat(),
+        'days_overdue': ((upcoming or now) - due).days,
+    }
+
+
+def _entry_for(args) -> Optional[Dict]:
+    directory, now = args
+    return worklist_entry(directory, now)
+
+
+def build_worklist(directories: Iterable[Path],
+                   now: Optional[arrow.Arrow] = None,
+                   workers: int = 1) -> List[Dict]:
+    """ Worklist rows, earliest due date (most overdue) first. """
+    now = now or arrow.utcnow()
+    jobs = [(Path(directory), now) for directory in directories]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            entries = pool.map(_entry_for, jobs, chunksize=64)
+    else:
+        entries = [_entry_for(job) for job in jobs]
+    rows = [entry for entry in entries if entry is not None]
+    return sorted(rows, key=lambda row: (row['due_date'], row['patient_key']))
+
+
+def write_worklist(rows: List[Dict], path) -> None:
+    with open(path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=WORKLIST_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: row.get(field) for field in WORKLIST_FIELDS})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write the overdue diabetes visit worklist of a panel.')
+    parser.add_argument('directory')
+    parser.add_argument('--output', default='diabetes_visit_worklist.csv')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--now', help='evaluate as of this date')
+    args = parser.parse_args(argv)
+
+    rows = build_worklist(patient_directories(args.directory),
+                          now=arrow.get(args.now) if args.now else None,
+                          workers=args.workers)
+    write_worklist(rows, args.output)
+    print(f'{len(rows)} patients written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+"""
+Reading patient dump directories (the tests/mock_data layout, as written by
+canvas_workflow_helpers.synthetic): one directory per patient with one JSON
+file per record type.
+"""
+import json
+
+from pathlib import Path
+from typing import List, Union
+
+
+def patient_directories(root: Union[str, Path]) -> List[Path]:
+    """ The patient directories under `root`, sorted. """
+    return sorted(path.parent for path in Path(root).glob('*/patient.json'))
+
+
+def read_records(directory: Union[str, Path], name: str) -> list:
+    """ The content of `name`.json in a patient directory, [] if missing. """
+    path = Path(directory) / f'{name}.json'
+    if not path.exists():
+        return []
+    with path.open('r') as fh:
+        return json.load(fh) or []
@@ -0,0 +1,228 @@
+"""
+Bulk reconciliation of patient group membership.
+
+PatientGrouping and PatientGroupingByCareTeamMember send one
+ensure_patient_in_group / ensure_patient_not_in_group update per patient
+and evaluation, whether or not the membership changed. After a consent or
+care-team policy change this reconciler rebalances whole groups instead:
+it applies the same rules to a directory of patient dumps (the
+tests/mock_data layout), compares the desired membership with the current
+one and returns only the additions and removals, batched into as few group
+updates as possible.
+
+    rules = [
+        OptOutConsentRule('00000000-0000-0000-0000-000000000000', 'A0001'),
+        CareTeamMemberRule('173e8abd-7de1-4324-b5c3-4a02089213a1',
+                           'e766816672f34a5b866771c773e38f3c', 'Psycho'),
+    ]
+    desired, evaluated = desired_membership(patient_directories(root), rules)
+    changes = reconcile(desired, current, evaluated)
+    updates = group_updates(changes)
+
+Current members that are not in the evaluated dumps are left alone.
+
+    python -m canvas_workflow_helpers.population.group_membership /data/patients \\
+        --rules rules.json --current members.json --output updates.json
+"""
+import abc
+import argparse
+import json
+import multiprocessing
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from canvas_workflow_kit.internal.integration_messages import (
+    ensure_patient_in_group, ensure_patient_not_in_group)
+
+from .dumps import patient_directories, read_records
+
+
+class MembershipRule(abc.ABC):
+    """
+    Whether a patient belongs to `group`. `files` are the dump files the
+    rule reads; subclasses implement `is_member`.
+    """
+
+    files: Tuple[str, ...] = ('patient', )
+
+    def __init__(self, group: str):
+        self.group = group
+
+    @abc.abstractmethod
+    def is_member(self, records: Dict[str, list]) -> bool:
+        """ Whether the patient whose `files` are in `records` is a member. """
+
+
+class OptOutConsentRule(MembershipRule):
+    """ PatientGrouping: a member unless the opt-out consent was rejected. """
+
+    files = ('patient', 'consents')
+
+    def __init__(self, group: str, consent_code: str):
+        super().__init__(group)
+        self.consent_code = consent_code
+
+    def is_member(self, records: Dict[str, list]) -> bool:
+        for consent in records['consents']:
+            if (consent.get('category') or {}).get('code') == self.consent_code:
+                return consent.get('state') != 'rejected'
+        return True
+
+
+class CareTeamMemberRule(MembershipRule):
+    """ PatientGroupingByCareTeamMember: a member with the staff in that role. """
+
+    def __init__(self, group: str, staff_key: str, role_code: str):
+        super().__init__(group)
+        self.staff_key = staff_key
+        self.role_code = role_code
+
+    def is_member(self, records: Dict[str, list]) -> bool:
+        patient = records['patient'] if isinstance(records['patient'],
+                                                   dict) else {}
+        return any(
+            (membership.get('staff') or {}).get('key') == self.staff_key and
+            (membership.get('role') or {}).get('code') == self.role_code
+            for membership in patient.get('careTeamMemberships') or [])
+
+
+RULE_TYPES = {
+    'opt_out_consent': OptOutConsentRule,
+    'care_team_member': CareTeamMemberRule,
+}
+
+
+def rules_from_config(config: List[Dict]) -> List[MembershipRule]:
+    """ Rules from dicts like {"type": "opt_out_consent", "group": ..., ...}. """
+    rules = []
+    for entry in config:
+        entry = dict(entry)
+        kind = entry.pop('type')
+        if kind not in RULE_TYPES:
+            raise ValueError(f'Unknown membership rule "{kind}"')
+        rules.append(RULE_TYPES[kind](**entry))
+    return rules
+
+
+def patient_groups(directory: Path,
+                   rules: List[MembershipRule]) -> Tuple[Optional[str], Set[str]]:
+    """ The patient key and the groups of the rules the patient belongs to. """
+    directory = Path(directory)
+    records = {
+        name: read_records(directory, name)
+        for name in {name for rule in rules for name in rule.files}
+    }
+    patient = records.get('patient')
+    if not isinstance(patient, dict) or not patient.get('key'):
+        return None, set()
+    return patient['key'], {
+        rule.group for rule in rules if rule.is_member(records)
+    }
+
+
+def _groups_for(args) -> Tuple[Optional[str], Set[str]]:
+    directory, rules = args
+    return patient_groups(directory, rules)
+
+
+def desired_membership(
+        directories: Iterable[Path],
+        rules: List[MembershipRule],
+        workers: int = 1) -> Tuple[Dict[str, Set[str]], Set[str]]:
+    """
+    The patients each group should have, and the keys of every patient that
+    was evaluated.
+    """
+    jobs = [(Path(directory), rules) for directory in directories]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            entries = pool.map(_groups_for, jobs, chunksize=64)
+    else:
+        entries = [_groups_for(job) for job in jobs]
+
+    desired = {rule.group: set() for rule in rules}
+    evaluated = set()
+    for patient_key, groups in entries:
+        if patient_key is None:
+            continue
+        evaluated.add(patient_key)
+        for group in groups:
+            desired[group].add(patient_key)
+    return desired, evaluated
+
+
+def reconcile(desired: Dict[str, Set[str]], current: Dict[str, Iterable[str]],
+              evaluated: Set[str]) -> Dict[str, Tuple[List[str], List[str]]]:
+    """
+    The sorted patient keys to add to and remove from each group. Groups
+    without changes are left out.
+    """
+    changes = {}
+    for group in sorted(desired):
+        members = set(current.get(group, ())) & evaluated
+        add = sorted(desired[group] - members)
+        remove = sorted(members - desired[group])
+        if add or remove:
+            changes[group] = (add, remove)
+    return changes
+
+
+def group_updates(changes: Dict[str, Tuple[List[str], List[str]]],
+                  batch_size: int = 500) -> List[Dict]:
+    """
+    Group integration messages with up to `batch_size` entries each, in the
+    format of ensure_patient_in_group / ensure_patient_not_in_group.
+    """
+    updates = []
+    for group, (add, remove) in changes.items():
+        entries = [
+            entry for patient_key in add for entry in ensure_patient_in_group(
+                patient_key, group)['integration_payload']['members']['entries']
+        ] + [
+            entry for patient_key in remove
+            for entry in ensure_patient_not_in_group(
+                patient_key, group)['integration_payload']['members']['entries']
+        ]
+        for start in range(0, len(entries), batch_size):
+            update = ensure_patient_in_group('', group)
+            update['integration_payload']['members']['entries'] = (
+                entries[start:start + batch_size])
+            updates.append(update)
+    return updates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Reconcile group membership for a panel of patients.')
+    parser.add_argument('directory')
+    parser.add_argument('--rules', required=True,
+                        help='JSON list of membership rules')
+    parser.add_argument('--current',
+                        help='JSON object of group id to current member keys')
+    parser.add_argument('--output', default='group_updates.json')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args(argv)
+
+    with open(args.rules) as fh:
+        rules = rules_from_config(json.load(fh))
+    current = {}
+    if args.current:
+        with open(args.current) as fh:
+            current = json.load(fh)
+
+    desired, evaluated = desired_membership(
+        patient_directories(args.directory), rules, workers=args.workers)
+    changes = reconcile(desired, current, evaluated)
+    updates = group_updates(changes, batch_size=args.batch_size)
+    with open(args.output, 'w') as fh:
+        json.dump(updates, fh, indent=2)
+
+    for group, (add, remove) in changes.items():
+        print(f'{group}: +{len(add)} -{len(remove)}')
+    print(f'{len(updates)} updates written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Panel-wide report of HCC conditions overdue for reassessment.
+
+Applies the rules of SemiAnnualReassessment (assessment_care_modeling/
+hcc_reassessment.py) to a directory of patient dumps: an active HCC
+condition is overdue when it was last assessed (or noted) before the start
+of the one year timeframe, and the patient is reported unless a Patient
+Re-Assessment questionnaire was filled out after the most recent of those
+dates.
+
+The ICD-10 to HCC index is built once from HCCConditions, before the worker
+processes are started, so a condition is matched with one dict lookup
+instead of a value set scan. Patients are streamed through the workers and
+their rows written as they come in, so memory does not grow with the panel.
+
+    python -m canvas_workflow_helpers.population.hcc_gaps /data/patients \\
+        --patients hcc_gaps.csv --hccs hcc_gaps_by_hcc.csv --workers 8
+"""
+import argparse
+import csv
+import functools
+import multiprocessing
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import arrow
+
+from canvas_workflow_kit.value_set.hcc2018 import HCCConditions
+
+from .diabetes_visits import URL_ICD10
+from .dumps import patient_directories, read_records
+
+REASSESSMENT_CODE = 'Patient Re-Assessment'
+URL_INTERNAL = 'INTERNAL'
+
+PATIENT_FIELDS = [
+    'patient_key',
+    'condition_id',
+    'icd10',
+    'description',
+    'hcc',
+    'raf',
+    'last_assessed',
+    'days_overdue',
+]
+
+HCC_FIELDS = [
+    'hcc',
+    'patient_count',
+    'condition_count',
+    'patient_keys',
+]
+
+
+@functools.lru_cache(maxsize=None)
+def hcc_index() -> Dict[str, Dict]:
+    """ ICD-10 code (without dots) -> HCC label, code description and RAF. """
+    return {
+        code: {
+            'hcc': HCCConditions.label_hdcc_for(code),
+            'description': HCCConditions.label_idc10_for(code),
+            'raf': HCCConditions.raf_for(code),
+        } for code in HCCConditions.ICD10CM
+    }
+
+
+def _last_assessed(condition: Dict) -> arrow.Arrow:
+    assessed = (condition.get('lastTimestamps') or {}).get('assessed')
+    return arrow.get(assessed or condition['noteTimestamp'])
+
+
+def _reassessed_since(interviews: List[Dict], since: arrow.Arrow) -> bool:
+    for interview in interviews:
+        if not interview.get('noteTimestamp') or not interview.get('created'):
+            continue
+        codings = [
+            coding for name in ('results', 'questionnaires', 'questions',
+                                'responses')
+            for coding in interview.get(name) or []
+        ]
+        if any(coding.get('codeSystem') == URL_INTERNAL and
+               coding.get('code') == REASSESSMENT_CODE
+               for coding in codings) and arrow.get(interview['created']) >= since:
+            return True
+    return False
+
+
+def patient_hcc_gaps(directory: Path,
+                     now: arrow.Arrow) -> Tuple[Optional[str], List[Dict]]:
+    """ The patient key and one row per overdue HCC condition. """
+    directory = Path(directory)
+    index = hcc_index()
+    start = now.shift(years=-1)
+
+    overdue = []
+    for condition in read_records(directory, 'conditions'):
+        if condition.get('clinicalStatus') != 'active':
+            continue
+        codes = [
+            coding['code']
+            for coding in condition.get('coding') or []
+            if coding.get('system') == URL_ICD10
+        ]
+        # like the protocol, the condition is reported with its first code
+        if not any(code in index for code in codes):
+            continue
+        last_assessed = _last_assessed(condition)
+        if last_assessed < start:
+            overdue.append((condition, codes[0], last_assessed))
+    if not overdue:
+        return None, []
+
+    if _reassessed_since(read_records(directory, 'interviews'),
+                         max(last_assessed for _, _, last_assessed in overdue)):
+        return None, []
+
+    patient = read_records(directory, 'patient')
+    patient = patient if isinstance(patient, dict) else {}
+    patient_key = patient.get('key') or directory.name
+    empty = {'hcc': '', 'description': '', 'raf': 0}
+    return patient_key, [{
+        'patient_key': patient_key,
+        'condition_id': condition.get('id'),
+        'icd10': code,
+        **index.get(code, empty),
+        'last_assessed': last_assessed.isoformat(),
+        'days_overdue': (now - last_assessed.shift(years=1)).days,
+    } for condition, code, last_assessed in overdue]
+
+
+def _gaps_for(args) -> Tuple[Optional[str], List[Dict]]:
+    directory, now = args
+    return patient_hcc_gaps(directory, now)
+
+
+def iter_hcc_gaps(directories: Iterable[Path],
+                  now: Optional[arrow.Arrow] = None,
+                  workers: int = 1) -> Iterator[Dict]:
+    """ The overdue condition rows of every patient, in directory order. """
+    now = now or arrow.utcnow()
+    hcc_index()  # built once here, inherited by the worker processes
+    jobs = ((Path(directory), now) for directory in directories)
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            for _, rows in pool.imap(_gaps_for, jobs, chunksize=64):
+                yield from rows
+    else:
+        for job in jobs:
+            yield from _gaps_for(job)[1]
+
+
+def gaps_by_hcc(rows: Iterable[Dict]) -> List[Dict]:
+    """ One row per HCC with its overdue patients, most patients first. """
+    hccs: Dict[str, Dict] = {}
+    for row in rows:
+        entry = hccs.setdefault(row['hcc'], {
+            'hcc': row['hcc'],
+            'condition_count': 0,
+            'patient_keys': {}
+        })
+        entry['condition_count'] += 1
+        entry['patient_keys'][row['patient_key']] = None
+    return sorted(({
+        **entry,
+        'patient_count': len(entry['patient_keys']),
+        'patient_keys': list(entry['patient_keys']),
+    } for entry in hccs.values()),
+                  key=lambda entry: (-entry['patient_count'], entry['hcc']))
+
+
+def write_gap_report(rows: Iterable[Dict], patients_path,
+                     hccs_path=None) -> int:
+    """
+    Write the per-patient rows as they are produced, then the per-HCC
+    summary. Returns the number of overdue conditions.
+    """
+    by_hcc = []
+    count = 0
+    with open(patients_path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=PATIENT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({field: row.get(field) for field in PATIENT_FIELDS})
+            by_hcc.append({'hcc': row['hcc'], 'patient_key': row['patient_key']})
+            count += 1
+
+    if hccs_path:
+        with open(hccs_path, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=HCC_FIELDS)
+            writer.writeheader()
+            for entry in gaps_by_hcc(by_hcc):
+                writer.writerow({
+                    **entry, 'patient_keys': ' '.join(entry['patient_keys'])
+                })
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write the HCC conditions overdue for reassessment.')
+    parser.add_argument('directory')
+    parser.add_argument('--patients', default='hcc_gaps.csv')
+    parser.add_argument('--hccs', default='hcc_gaps_by_hcc.csv')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--now', help='evaluate as of this date')
+    args = parser.parse_args(argv)
+
+    rows = iter_hcc_gaps(patient_directories(args.directory),
+                         now=arrow.get(args.now) if args.now else None,
+                         workers=args.workers)
+    count = write_gap_report(rows, args.patients, args.hccs)
+    print(f'{count} overdue conditions written to {args.patients}')
+
+
+if __name__ == '__main__':
+    main()
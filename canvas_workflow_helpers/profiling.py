@@ -0,0 +1,257 @@
+"""
+Opt-in timing spans for protocols.
+
+Nothing is recorded unless a Profiler is active. While one is, every call
+to a method of a ProfiledProtocolMixin subclass (or a function decorated
+with `profiled`), every recordset query (find, filter, within, ...) and
+every HTTP request (FHIR calls, send_notification) becomes a span nested
+under the call that made it.
+
+    class DiabetesCare(ProfiledProtocolMixin, ClinicalQualityMeasure):
+        ...
+
+    with Profiler() as profiler:
+        DiabetesCare(patient=patient).compute_results()
+    print(profiler.summary())
+    profiler.write_folded('diabetes_care.folded')  # flamegraph.pl / speedscope
+"""
+import functools
+import inspect
+import re
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from canvas_workflow_kit.patient_recordset import (InterviewRecordSet,
+                                                   PatientEventRecordSet,
+                                                   PatientPeriodRecordSet,
+                                                   PatientRecordSet)
+
+# recordset methods timed while a profiler is active
+RECORDSET_QUERIES = {
+    PatientRecordSet: ['filter', 'exclude', 'find', 'find_code', 'find_class'],
+    PatientEventRecordSet: [
+        'within', 'before', 'after', 'first', 'last', 'last_value'
+    ],
+    PatientPeriodRecordSet: ['intersects', 'starts_before'],
+    InterviewRecordSet: ['find_question_response'],
+}
+
+_active: Optional['Profiler'] = None
+_install_lock = threading.Lock()
+_originals: List[Tuple[type, str, Callable]] = []
+
+
+class Profiler(object):
+    """
+    Collects nested timing spans. Only one profiler can be active at a time;
+    spans of every thread are recorded, each thread with its own stack.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # stack of span names -> time spent in that stack, without children
+        self._self_times: Dict[Tuple[str, ...], float] = defaultdict(float)
+        # span name -> [calls, inclusive time, self time]
+        self._totals: Dict[str, List[float]] = defaultdict(
+            lambda: [0, 0.0, 0.0])
+
+    def __enter__(self) -> 'Profiler':
+        global _active
+        with _install_lock:
+            if _active is not None:
+                raise RuntimeError('another Profiler is already active')
+            _active = self
+            _install_patches()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active
+        with _install_lock:
+            _remove_patches()
+            _active = None
+
+    @contextmanager
+    def span(self, name: str):
+        stack = self._stack()
+        # frame: name, start, time spent in child spans
+        frame = [name, self.clock(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = self.clock() - frame[1]
+            path = tuple(f[0] for f in stack) + (name, )
+            with self._lock:
+                self._self_times[path] += elapsed - frame[2]
+                totals = self._totals[name]
+                totals[0] += 1
+                totals[1] += elapsed
+                totals[2] += elapsed - frame[2]
+            if stack:
+                stack[-1][2] += elapsed
+
+    def folded(self) -> List[str]:
+        """
+        Stacks in the collapsed format read by flamegraph.pl and speedscope:
+        one `outer;inner;leaf <microseconds>` line per distinct stack.
+        """
+        with self._lock:
+            items = sorted(self._self_times.items())
+        return [
+            f"{';'.join(path)} {round(seconds * 1000000)}"
+            for path, seconds in items
+        ]
+
+    def write_folded(self, path: str) -> None:
+        with open(path, 'w') as fh:
+            fh.write('\n'.join(self.folded()) + '\n')
+
+    def rows(self) -> List[Tuple[str, int, float, float]]:
+        """ (name, calls, inclusive seconds, self seconds), slowest first. """
+        with self._lock:
+            rows = [(name, int(calls), total, own)
+                    for name, (calls, total, own) in self._totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def summary(self) -> str:
+        lines = [f"{'span':<60} {'calls':>7} {'total ms':>10} {'self ms':>10}"]
+        for name, calls, total, own in self.rows():
+            lines.append(
+                f'{name:<60} {calls:>7} {total * 1000:>10.2f} {own * 1000:>10.2f}'
+            )
+        return '\n'.join(lines)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+
+def active_profiler() -> Optional[Profiler]:
+    return _active
+
+
+def profiled(func: Callable = None, name: Optional[str] = None):
+    """
+    Record calls of `func` as spans while a profiler is active. When none is
+    active the wrapper only checks a module global before calling through.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name)
+
+    span_name = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return func(*args, **kwargs)
+        with profiler.span(span_name):
+            return func(*args, **kwargs)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class ProfiledProtocolMixin(object):
+    """
+    Put before ClinicalQualityMeasure in the bases of a protocol to time
+    compute_results, in_denominator, in_numerator and every other method the
+    protocol defines.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('__') or not inspect.isfunction(value):
+                continue
+            if getattr(value, '__profiled__', False):
+                continue
+            setattr(cls, attr, profiled(value,
+                                        name=f'{cls.__name__}.{attr}'))
+
+
+def profile_evaluation(protocol) -> Tuple[object, Profiler]:
+    """ Run protocol.compute_results() under a new profiler. """
+    with Profiler() as profiler:
+        with profiler.span(f'{type(protocol).__name__}.evaluation'):
+            result = protocol.compute_results()
+    return result, profiler
+
+
+def _recordset_wrapper(method: Callable, attr: str) -> Callable:
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        with profiler.span(f'{type(self).__name__}.{attr}'):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+# a FHIR resource type (Patient, QuestionnaireResponse, ...) in a URL path
+_RESOURCE_TYPE = re.compile(r'^[A-Z][A-Za-z]+$')
+# path segments that identify a record rather than an endpoint
+_IDENTIFIER = re.compile(r'^(?=.*\d)[-0-9A-Fa-f]{8,}$|^\d+$')
+
+
+def request_span_name(method: str, url: str) -> str:
+    """
+    The span name of an HTTP request, without the IDs in its URL so calls to
+    one endpoint add up: 'HTTP GET Patient' for FHIR requests, the host and
+    path with IDs replaced by {id} otherwise.
+    """
+    parts = urlsplit(str(url))
+    segments = [segment for segment in parts.path.split('/') if segment]
+    method = str(method).upper()
+    for segment in segments:
+        if _RESOURCE_TYPE.match(segment):
+            return f'HTTP {method} {segment}'
+    path = '/'.join('{id}' if _IDENTIFIER.match(segment) else segment
+                    for segment in segments)
+    return f'HTTP {method} {parts.netloc}/{path}'
+
+
+def _request_wrapper(request: Callable) -> Callable:
+
+    @functools.wraps(request)
+    def wrapper(self, method, url, *args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return request(self, method, url, *args, **kwargs)
+        with profiler.span(request_span_name(method, url)):
+            return request(self, method, url, *args, **kwargs)
+
+    return wrapper
+
+
+def _install_patches() -> None:
+    for cls, attrs in RECORDSET_QUERIES.items():
+        for attr in attrs:
+            original = vars(cls)[attr]
+            _originals.append((cls, attr, original))
+            setattr(cls, attr, _recordset_wrapper(original, attr))
+
+    original = requests.Session.request
+    _originals.append((requests.Session, 'request', original))
+    requests.Session.request = _request_wrapper(original)
+
+
+def _remove_patches() -> None:
+    while _originals:
+        cls, attr, original = _originals.pop()
+        setattr(cls, attr, original)
@@ -4,6 +4,7 @@ import json
 
 from canvas_workflow_kit import events
 from canvas_workflow_kit.constants import CHANGE_TYPE
+from canvas_workflow_kit.fhir import FumageHelper
 from canvas_workflow_kit.protocol import (
     STATUS_DUE,
     STATUS_SATISFIED,
@@ -3,6 +3,7 @@ import requests
 import json
 
 from canvas_workflow_kit.constants import CHANGE_TYPE
+from canvas_workflow_kit.fhir import FumageHelper
 from canvas_workflow_kit.protocol import (
     STATUS_DUE,
     STATUS_SATISFIED,
@@ -0,0 +1,177 @@
+"""
+Diffing of protocol results against the previous evaluation.
+
+Banner and recommendation protocols re-emit the same ProtocolResult on
+every recompute, and a bulk import recomputes them for every patient. A
+ResultDiffer keeps a canonical hash of the last result per protocol and
+patient (status, narrative, recommendations and canvas updates) so the
+caller can skip results that did not change and emit only the deltas:
+
+    differ = ResultDiffer(SQLiteResultSnapshotStore('/var/lib/protocols/results.db'))
+
+    result, delta = differ.evaluate(protocol)
+    if delta.changed:
+        write_result(result)
+        for update in delta.new_updates:
+            apply_update(update)
+
+The hash does not depend on the order of the recommendations. Canvas
+updates are compared one by one: an update already emitted with the
+previous result is not in `new_updates`. When writing a changed result
+fails, `forget` drops the snapshot so the next evaluation emits it again.
+"""
+import json
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from canvas_workflow_kit.protocol import ProtocolResult
+
+from canvas_workflow_helpers.idempotency import fingerprint
+from canvas_workflow_helpers.snapshots import (MemorySnapshotStore,
+                                               SnapshotStore,
+                                               SQLiteSnapshotStore)
+
+
+def recommendation_payload(recommendation: Any) -> Dict[str, Any]:
+    """ The content of a recommendation or intervention, as plain data. """
+    payload = {
+        name: value
+        for name, value in vars(recommendation).items()
+        if not name.startswith('_')
+    }
+    payload['type'] = type(recommendation).__name__
+    # round trip through JSON so the payload compares equal to a stored one
+    return json.loads(json.dumps(payload, sort_keys=True, default=str))
+
+
+def result_payload(result: ProtocolResult,
+                   updates: Optional[List[Dict]] = None) -> Dict[str, Any]:
+    """ The parts of a result (and its canvas updates) that are emitted. """
+    recommendations = sorted(
+        (recommendation_payload(recommendation)
+         for recommendation in result.recommendations),
+        key=fingerprint)
+    return {
+        'status': result.status,
+        'narrative': result.narrative,
+        'due_in': result.due_in,
+        'days_of_notice': result.days_of_notice,
+        'next_review': str(result.next_review) if result.next_review else None,
+        'recommendations': recommendations,
+        'updates': list(updates or []),
+    }
+
+
+def result_hash(result: ProtocolResult,
+                updates: Optional[List[Dict]] = None) -> str:
+    return fingerprint(result_payload(result, updates))
+
+
+class ResultDelta(object):
+    """ How a result differs from the one emitted for the previous evaluation. """
+
+    def __init__(self,
+                 changed: bool,
+                 first: bool = False,
+                 added_recommendations: Optional[List[Dict]] = None,
+                 removed_recommendations: Optional[List[Dict]] = None,
+                 new_updates: Optional[List[Dict]] = None):
+        self.changed = changed
+        self.first = first
+        self.added_recommendations = added_recommendations or []
+        self.removed_recommendations = removed_recommendations or []
+        self.new_updates = new_updates or []
+
+    def __bool__(self) -> bool:
+        return self.changed
+
+    def __repr__(self) -> str:
+        return (f'<ResultDelta changed={self.changed} '
+                f'added={len(self.added_recommendations)} '
+                f'removed={len(self.removed_recommendations)} '
+                f'updates={len(self.new_updates)}>')
+
+
+class ResultSnapshotStore(SnapshotStore):
+    """
+    Keeps the hash and recommendations of the last result per protocol and
+    patient.
+    """
+
+
+class MemoryResultSnapshotStore(MemorySnapshotStore, ResultSnapshotStore):
+    pass
+
+
+class SQLiteResultSnapshotStore(SQLiteSnapshotStore, ResultSnapshotStore):
+    table = 'result_snapshots'
+
+
+class ResultDiffer(object):
+    """
+    Compares each result with the previous one of the same protocol and
+    patient, and remembers it for the next comparison. `unchanged` counts
+    the results that could be skipped.
+    """
+
+    def __init__(self, store: Optional[ResultSnapshotStore] = None):
+        self.store = store if store is not None else MemoryResultSnapshotStore()
+        self.changed = 0
+        self.unchanged = 0
+
+    def diff(self,
+             protocol: str,
+             patient_key: str,
+             result: ProtocolResult,
+             updates: Optional[List[Dict]] = None) -> ResultDelta:
+        payload = result_payload(result, updates)
+        digest = fingerprint(payload)
+        previous = self.store.get(protocol, patient_key)
+
+        if previous is not None and previous.get('hash') == digest:
+            self.unchanged += 1
+            return ResultDelta(changed=False)
+
+        recommendations = {
+            fingerprint(recommendation): recommendation
+            for recommendation in payload['recommendations']
+        }
+        update_hashes = [fingerprint(update) for update in payload['updates']]
+        self.store.put(
+            protocol, patient_key, {
+                'hash': digest,
+                'recommendations': recommendations,
+                'updates': update_hashes,
+            })
+        self.changed += 1
+
+        previous = previous or {}
+        emitted = previous.get('recommendations', {})
+        emitted_updates = set(previous.get('updates', []))
+        return ResultDelta(
+            changed=True,
+            first=not previous,
+            added_recommendations=[
+                recommendation for key, recommendation in recommendations.items()
+                if key not in emitted
+            ],
+            removed_recommendations=[
+                recommendation for key, recommendation in emitted.items()
+                if key not in recommendations
+            ],
+            new_updates=[
+                update
+                for update, key in zip(payload['updates'], update_hashes)
+                if key not in emitted_updates
+            ])
+
+    def evaluate(self, protocol) -> Tuple[ProtocolResult, ResultDelta]:
+        """ Compute the results of a protocol instance and diff them. """
+        result = protocol.compute_results()
+        delta = self.diff(
+            type(protocol).__name__, (protocol.patient.patient or {}).get('key', ''),
+            result, getattr(protocol, 'canvas_updates', None))
+        return result, delta
+
+    def forget(self, protocol: str, patient_key: str) -> None:
+        self.store.delete(protocol, patient_key)
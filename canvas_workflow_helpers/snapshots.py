@@ -0,0 +1,104 @@
+"""
+JSON snapshots kept per protocol and patient.
+
+The stores behind incremental facts and result diffing: a process local
+MemorySnapshotStore, and a SQLiteSnapshotStore shared by every process
+pointing at the same database file. Each use of the SQLite store gets its
+own table (`table` on a subclass), so one file can hold several of them.
+"""
+import abc
+import json
+import sqlite3
+import threading
+import time
+
+from typing import Dict, Optional, Tuple
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    A connection to a SQLite file shared between threads and processes: in
+    autocommit mode, in WAL mode, waiting up to 30s for a lock. Callers
+    serialize their use of it with a lock of their own.
+    """
+    connection = sqlite3.connect(path,
+                                 timeout=30,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+
+class SnapshotStore(abc.ABC):
+    """ A JSON serializable dict per protocol and patient. """
+
+    @abc.abstractmethod
+    def get(self, protocol: str, patient_key: str) -> Optional[dict]:
+        """ The snapshot last put, None if there is none. """
+
+    @abc.abstractmethod
+    def put(self, protocol: str, patient_key: str, snapshot: dict) -> None:
+        """ Replace the snapshot. """
+
+    @abc.abstractmethod
+    def delete(self, protocol: str, patient_key: str) -> None:
+        """ Forget the snapshot, if any. """
+
+
+class MemorySnapshotStore(SnapshotStore):
+
+    def __init__(self):
+        self._snapshots: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, protocol: str, patient_key: str) -> Optional[dict]:
+        with self._lock:
+            snapshot = self._snapshots.get((protocol, patient_key))
+        return json.loads(snapshot) if snapshot is not None else None
+
+    def put(self, protocol: str, patient_key: str, snapshot: dict) -> None:
+        # stored serialized, so later changes to the values are not seen
+        with self._lock:
+            self._snapshots[(protocol, patient_key)] = json.dumps(snapshot)
+
+    def delete(self, protocol: str, patient_key: str) -> None:
+        with self._lock:
+            self._snapshots.pop((protocol, patient_key), None)
+
+
+class SQLiteSnapshotStore(SnapshotStore):
+    """ Snapshots in a SQLite file shared by every process using the path. """
+
+    table = 'snapshots'
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = connect_sqlite(path)
+        self._connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} (protocol TEXT NOT NULL, '
+            'patient_key TEXT NOT NULL, snapshot TEXT NOT NULL, '
+            'updated_at REAL NOT NULL, PRIMARY KEY (protocol, patient_key))')
+
+    def get(self, protocol: str, patient_key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(
+                f'SELECT snapshot FROM {self.table} '
+                'WHERE protocol = ? AND patient_key = ?',
+                (protocol, patient_key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, protocol: str, patient_key: str, snapshot: dict) -> None:
+        with self._lock:
+            self._connection.execute(
+                f'INSERT OR REPLACE INTO {self.table} '
+                '(protocol, patient_key, snapshot, updated_at) VALUES (?, ?, ?, ?)',
+                (protocol, patient_key, json.dumps(snapshot), time.time()))
+
+    def delete(self, protocol: str, patient_key: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                f'DELETE FROM {self.table} '
+                'WHERE protocol = ? AND patient_key = ?', (protocol, patient_key))
+
+    def close(self) -> None:
+        self._connection.close()
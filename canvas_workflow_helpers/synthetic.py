@@ -0,0 +1,459 @@
+"""
+Seeded generator of synthetic patients for load and scale testing.
+
+Patients are written in the same layout as tests/mock_data (one directory
+per patient holding patient.json, conditions.json, lab_reports.json, ...),
+so they load with canvas_workflow_kit.utils.load_local_patient. Coded
+records draw their codes from the v2021 value sets, so protocols built on
+those value sets find their denominators.
+
+    python -m canvas_workflow_helpers.synthetic /tmp/patients --count 100 --size large
+"""
+import argparse
+import json
+import random
+import uuid
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Type
+
+import arrow
+
+from canvas_workflow_helpers.value_sets.v2021 import (
+    AceInhibitorOrArbOrArni, AdultDepressionMedications, BetaBlockerTherapy,
+    ChronicKidneyDiseaseStage5, Diabetes, EssentialHypertension, Glyburide,
+    Hba1CLaboratoryTest, HeartFailure, HighIntensityStatinTherapy,
+    LdlCholesterol, MajorDepression, OverweightOrObese, UrineProteinTests)
+from canvas_workflow_helpers.value_sets.value_set import ValueSet
+
+URL_ICD10 = 'ICD-10'
+URL_RXNORM = 'http://www.nlm.nih.gov/research/umls/rxnorm'
+
+# value set, probability that a patient has it
+CONDITION_VALUE_SETS: List[Tuple[Type[ValueSet], float]] = [
+    (Diabetes, 0.6),
+    (EssentialHypertension, 0.5),
+    (OverweightOrObese, 0.4),
+    (MajorDepression, 0.25),
+    (HeartFailure, 0.1),
+    (ChronicKidneyDiseaseStage5, 0.05),
+]
+
+MEDICATION_VALUE_SETS: List[Type[ValueSet]] = [
+    AceInhibitorOrArbOrArni,
+    AdultDepressionMedications,
+    BetaBlockerTherapy,
+    Glyburide,
+    HighIntensityStatinTherapy,
+]
+
+# value set, units, low, high, reference range
+LAB_VALUE_SETS: List[Tuple[Type[ValueSet], str, float, float, str]] = [
+    (Hba1CLaboratoryTest, '%', 4.8, 11.5, '4.0-5.6'),
+    (LdlCholesterol, 'mg/dL', 50, 210, '0-99'),
+    (UrineProteinTests, 'mg/dL', 0, 300, '0-14'),
+]
+
+# sign, LOINC, units
+VITAL_SIGNS: List[Tuple[str, str, str]] = [
+    ('weight', '29463-7', 'oz'),
+    ('height', '8302-2', 'in'),
+    ('blood_pressure', '85354-9', 'mmHg'),
+    ('pulse', '8867-4', 'bpm'),
+]
+
+EMPTY_FIELDS = [
+    'allergy_intolerances',
+    'billing_line_items',
+    'imaging_reports',
+    'immunizations',
+    'inpatient_stay',
+    'instructions',
+    'messages',
+    'protocol_overrides',
+    'protocols',
+    'reason_for_visits',
+    'referral_reports',
+    'referrals',
+    'suspect_hccs',
+]
+
+SIZES: Dict[str, Dict[str, int]] = {
+    'small': {
+        'history_years': 2,
+        'labs': 20,
+        'vitals': 20,
+        'medications': 4,
+        'interviews': 4,
+        'appointments': 6,
+        'tasks': 2,
+    },
+    'medium': {
+        'history_years': 5,
+        'labs': 500,
+        'vitals': 1000,
+        'medications': 15,
+        'interviews': 40,
+        'appointments': 60,
+        'tasks': 20,
+    },
+    'large': {
+        'history_years': 15,
+        'labs': 20000,
+        'vitals': 40000,
+        'medications': 60,
+        'interviews': 300,
+        'appointments': 500,
+        'tasks': 200,
+    },
+}
+
+
+class SyntheticPatientGenerator(object):
+    """
+    Builds patient dumps deterministically from `seed`: the same seed and
+    settings always produce the same patients.
+
+    `history_years` is how far back records go; `labs`, `vitals`, ... are the
+    number of records of each kind per patient. Use `from_size` for the
+    small / medium / large presets used by the benchmarks.
+    """
+
+    def __init__(self,
+                 seed: int = 0,
+                 history_years: int = 5,
+                 labs: int = 500,
+                 vitals: int = 1000,
+                 medications: int = 15,
+                 interviews: int = 40,
+                 appointments: int = 60,
+                 tasks: int = 20,
+                 now: Optional[arrow.Arrow] = None):
+        self.seed = seed
+        self.history_years = history_years
+        self.labs = labs
+        self.vitals = vitals
+        self.medications = medications
+        self.interviews = interviews
+        self.appointments = appointments
+        self.tasks = tasks
+        self.now = (now or arrow.get('2023-01-01')).to('utc')
+
+    @classmethod
+    def from_size(cls, size: str, **kwargs) -> 'SyntheticPatientGenerator':
+        return cls(**{**SIZES[size], **kwargs})
+
+    def generate(self, index: int = 0) -> Dict[str, object]:
+        """ Return the content of every file of patient number `index`. """
+        rng = random.Random(f'{self.seed}:{index}')
+        self._ids = 0
+
+        patient = self._patient(rng, index)
+        medications = self._medications(rng)
+        data = {
+            'patient': patient,
+            'conditions': self._conditions(rng),
+            'medications': medications,
+            'prescriptions': self._prescriptions(rng, medications),
+            'lab_reports': self._lab_reports(rng),
+            'vital_signs': self._vital_signs(rng),
+            'interviews': self._interviews(rng),
+            'appointments': self._appointments(rng),
+            'upcoming_appointments': self._upcoming_appointments(rng),
+            'upcoming_appointment_notes': [],
+            'tasks': self._tasks(rng),
+        }
+        for field in EMPTY_FIELDS:
+            data[field] = []
+        return data
+
+    def write(self, directory, count: int = 1) -> List[Path]:
+        """ Write `count` patients under `directory`, one sub-directory each. """
+        paths = []
+        for index in range(count):
+            path = Path(directory) / f'patient_{index:05d}'
+            path.mkdir(parents=True, exist_ok=True)
+            for field, content in self.generate(index).items():
+                with (path / f'{field}.json').open('w') as fh:
+                    json.dump(content, fh)
+            paths.append(path)
+        return paths
+
+    def _next_id(self) -> int:
+        self._ids += 1
+        return self._ids
+
+    def _timestamp(self, rng: random.Random, future: bool = False) -> arrow.Arrow:
+        seconds = rng.randint(0, self.history_years * 365 * 24 * 60 * 60)
+        if future:
+            return self.now.shift(seconds=seconds // self.history_years // 4)
+        return self.now.shift(seconds=-seconds)
+
+    @staticmethod
+    def _codes(value_set: Type[ValueSet], system: str) -> List[str]:
+        return sorted(getattr(value_set, system, set()))
+
+    def _patient(self, rng: random.Random, index: int) -> dict:
+        birth_date = self.now.shift(days=-rng.randint(18 * 365, 90 * 365))
+        key = uuid.UUID(int=rng.getrandbits(128)).hex
+        return {
+            'id': index + 1,
+            'key': key,
+            'created': self.now.shift(years=-self.history_years).isoformat(),
+            'firstName': f'Synthetic{index}',
+            'lastName': 'Patient',
+            'birthDate': birth_date.format('YYYY-MM-DD'),
+            'sexAtBirth': rng.choice(['F', 'M']),
+            'active': True,
+            'deceased': False,
+            'deceasedDatetime': None,
+            'age': str(self.now.year - birth_date.year),
+            'timezone': 'America/Los_Angeles',
+            'coverages': [],
+            'telecom': [],
+            'addresses': [],
+            'contacts': [],
+            'externalIdentifiers': [],
+            'careTeamMemberships': [],
+        }
+
+    def _conditions(self, rng: random.Random) -> List[dict]:
+        conditions = []
+        for value_set, probability in CONDITION_VALUE_SETS:
+            codes = self._codes(value_set, 'ICD10CM')
+            if not codes or rng.random() >= probability:
+                continue
+            onset = self._timestamp(rng)
+            conditions.append({
+                'id': self._next_id(),
+                'noteTimestamp': onset.isoformat(),
+                'created': onset.isoformat(),
+                'clinicalStatus': rng.choice(['active'] * 9 + ['resolved']),
+                'committer': 1,
+                'coding': [{
+                    'system': URL_ICD10,
+                    'version': '',
+                    'code': rng.choice(codes),
+                    'display': value_set.VALUE_SET_NAME,
+                }],
+                'lastTimestamps': {
+                    'assessed': onset.isoformat(),
+                    'billed': None,
+                    'assessedAndBilled': None,
+                },
+                'periods': [{
+                    'from': onset.format('YYYY-MM-DD'),
+                    'to': None
+                }],
+            })
+        return conditions
+
+    def _medications(self, rng: random.Random) -> List[dict]:
+        medications = []
+        for _ in range(self.medications):
+            value_set = rng.choice(MEDICATION_VALUE_SETS)
+            start = self._timestamp(rng)
+            stopped = rng.random() < 0.4
+            medications.append({
+                'id': self._next_id(),
+                'created': start.isoformat(),
+                'status': 'inactive' if stopped else 'active',
+                'committer': 1,
+                'coding': [{
+                    'system': URL_RXNORM,
+                    'version': '',
+                    'code': rng.choice(self._codes(value_set, 'RXNORM')),
+                    'display': value_set.VALUE_SET_NAME,
+                }],
+                'periods': [{
+                    'from': start.format('YYYY-MM-DD'),
+                    'to': (start.shift(days=rng.randint(30, 365)).format(
+                        'YYYY-MM-DD') if stopped else None),
+                }],
+            })
+        return medications
+
+    def _prescriptions(self, rng: random.Random,
+                       medications: List[dict]) -> List[dict]:
+        return [{
+            'externallyExposableId': uuid.UUID(int=rng.getrandbits(128)).hex,
+            'medicationId': medication['id'],
+            'status': medication['status'],
+            'coding': medication['coding'],
+        } for medication in medications]
+
+    def _lab_reports(self, rng: random.Random) -> List[dict]:
+        reports = []
+        for _ in range(self.labs):
+            value_set, units, low, high, reference = rng.choice(LAB_VALUE_SETS)
+            value = round(rng.uniform(low, high), 1)
+            # one in a hundred results is not a number, as in real feeds
+            if rng.random() < 0.01:
+                value = rng.choice(['>15', 'see note', ''])
+            date = self._timestamp(rng)
+            reports.append({
+                'id': self._next_id(),
+                'originalDate': date.isoformat(),
+                'loincCodes': [{
+                    'id': self._next_id(),
+                    'code': rng.choice(self._codes(value_set, 'LOINC')),
+                    'name': value_set.VALUE_SET_NAME,
+                    'value': str(value),
+                    'units': units,
+                }],
+                'value': str(value),
+                'units': units,
+                'referenceRange': reference,
+            })
+        return reports
+
+    def _vital_signs(self, rng: random.Random) -> List[dict]:
+        vitals = []
+        for _ in range(self.vitals):
+            sign, loinc, units = rng.choice(VITAL_SIGNS)
+            if sign == 'weight':
+                value = str(rng.randint(1600, 4800))
+            elif sign == 'height':
+                value = str(rng.randint(58, 76))
+            elif sign == 'blood_pressure':
+                value = f'{rng.randint(100, 180)}/{rng.randint(60, 110)}'
+            else:
+                value = str(rng.randint(50, 120))
+            vitals.append({
+                'id': self._next_id(),
+                'dateRecorded': self._timestamp(rng).isoformat(),
+                'loincNum': loinc,
+                'sign': sign,
+                'value': value,
+                'units': units,
+            })
+        return vitals
+
+    def _interviews(self, rng: random.Random) -> List[dict]:
+        interviews = []
+        for _ in range(self.interviews):
+            date = self._timestamp(rng)
+            score = rng.randint(0, 27)
+            interviews.append({
+                'id': self._next_id(),
+                'noteTimestamp': date.isoformat(),
+                'created': date.isoformat(),
+                'name': 'PHQ-9 Questionnaire',
+                'committer': 1,
+                'status': 'AC',
+                'progressStatus': 'F',
+                'results': [{
+                    'id': self._next_id(),
+                    'score': score,
+                    'abnormal': score >= 10,
+                    'codeSystem': 'http://loinc.org',
+                    'code': '44261-6',
+                }],
+                'questionnaires': [{
+                    'id': 1,
+                    'code': '44249-1',
+                    'codeSystem': 'http://loinc.org',
+                }],
+                'questions': [],
+                'responses': [],
+            })
+        return interviews
+
+    def _state_history(self, rng: random.Random, start: arrow.Arrow,
+                       states: List[str]) -> List[dict]:
+        return [{
+            'id': self._next_id(),
+            'state': state,
+            'created': start.shift(minutes=offset - len(states)).isoformat(),
+        } for offset, state in enumerate(states)]
+
+    def _appointments(self, rng: random.Random) -> List[dict]:
+        appointments = []
+        for _ in range(self.appointments):
+            start = self._timestamp(rng)
+            final = rng.choice(['CVD', 'LKD', 'LKD', 'NSW', 'CLD'])
+            states = ['SCH', 'BKD'] + (['CVD', 'LKD'] if final == 'LKD' else
+                                       [final])
+            history = self._state_history(rng, start, states)
+            appointments.append({
+                'id': self._next_id(),
+                'externallyExposableId': uuid.UUID(
+                    int=rng.getrandbits(128)).hex,
+                'startTime': start.isoformat(),
+                'state': {
+                    **history[-1], 'note': self._next_id()
+                },
+                'stateHistory': history,
+            })
+        return appointments
+
+    def _upcoming_appointments(self, rng: random.Random) -> List[dict]:
+        appointments = []
+        for _ in range(rng.randint(0, 2)):
+            start = self._timestamp(rng, future=True)
+            appointments.append({
+                'id': self._next_id(),
+                'state': {
+                    'id': self._next_id(),
+                    'state': 'BKD',
+                    'created': self.now.isoformat(),
+                },
+                'startTime': start.isoformat(),
+                'durationMinutes': 20,
+                'appointmentType': 'office',
+                'status': 'unconfirmed',
+                'externallyExposableId': uuid.UUID(
+                    int=rng.getrandbits(128)).hex,
+            })
+        return appointments
+
+    def _tasks(self, rng: random.Random) -> List[dict]:
+        titles = [
+            'Review New Intake',
+            'New treatment follow up in one month',
+            'Patient has social needs that require follow-up.',
+            'Schedule follow up',
+        ]
+        tasks = []
+        for _ in range(self.tasks):
+            created = self._timestamp(rng)
+            tasks.append({
+                'id': self._next_id(),
+                'externallyExposableId': uuid.UUID(
+                    int=rng.getrandbits(128)).hex,
+                'title': rng.choice(titles),
+                'status': rng.choice(['OPEN', 'COMPLETED', 'CLOSED']),
+                'assignee': '',
+                'team': '',
+                'labels': [],
+                'created': created.isoformat(),
+                'due': created.shift(days=7).isoformat(),
+            })
+        return tasks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write synthetic patients in the mock_data layout.')
+    parser.add_argument('directory')
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', choices=sorted(SIZES), default='medium')
+    for field in SIZES['medium']:
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int)
+    args = parser.parse_args(argv)
+
+    overrides = {
+        field: getattr(args, field)
+        for field in SIZES['medium']
+        if getattr(args, field) is not None
+    }
+    generator = SyntheticPatientGenerator.from_size(args.size,
+                                                    seed=args.seed,
+                                                    **overrides)
+    for path in generator.write(args.directory, args.count):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
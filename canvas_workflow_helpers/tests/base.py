@@ -1,13 +1,172 @@
+import hashlib
 import json
 import os
+import pickle
+import tempfile
+import threading
 
 from unittest import TestCase
 
 from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import requests
 
 from canvas_workflow_kit.patient import Patient
 from canvas_workflow_kit.protocol import ProtocolResult
-from canvas_workflow_kit.utils import load_local_patient
+from canvas_workflow_kit.utils import camelcase
+
+from canvas_workflow_helpers.loader import private_directory
+
+
+def fhir_response(status_code=200, body=None, headers=None) -> requests.Response:
+    """
+    Build a requests.Response the way the FHIR helpers would return it.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body if body is not None else {}).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeClock(object):
+    """
+    A clock for code taking a `clock` callable. Each call advances it by
+    `tick` first; set `now` to jump in time. `sleep` records the delay and
+    advances the clock by it.
+    """
+
+    def __init__(self, now: float = 0.0, tick: float = 0.0):
+        self.now = now
+        self.tick = tick
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        self.now += self.tick
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeFumageHelper(object):
+    """
+    Stands in for FumageHelper: records every call and answers from the
+    `responses` list in order.
+    """
+
+    base_fhir_url = 'https://fumage-test.canvasmedical.com'
+
+    def __init__(self, responses=None):
+        self.token = 'token'
+        self.headers = {'Authorization': 'Bearer token'}
+        self.responses = list(responses or [])
+        self.calls = []
+
+    def _respond(self, *call):
+        self.calls.append(call)
+        if self.responses:
+            return self.responses.pop(0)
+        return fhir_response()
+
+    def read(self, resource_type, resource_id):
+        return self._respond('read', resource_type, resource_id)
+
+    def search(self, resource_type, search_params=None):
+        return self._respond('search', resource_type, search_params)
+
+    def create(self, resource_type, payload):
+        return self._respond('create', resource_type, payload)
+
+    def update(self, resource_type, resource_id, payload):
+        return self._respond('update', resource_type, resource_id, payload)
+
+
+class PatientFixtureCache(object):
+    """
+    Parsed mock patient directories, shared by every test of the process.
+
+    Each directory is parsed once per content: the key is the directory and
+    the name, size and mtime of its JSON files, so editing a mock file is
+    picked up by the next load. The cache keeps a pickled snapshot and every
+    load unpickles a private copy, so a test mutating its patient never
+    leaks into another test.
+
+    With `disk_dir` set (WORKFLOW_HELPERS_FIXTURE_CACHE for the default
+    cache) snapshots are also written there, so pytest-xdist workers and
+    later runs skip parsing as well. Unpickling runs code, so the directory
+    is only used when it belongs to the current user and nobody else can
+    write to it.
+    """
+
+    def __init__(self, disk_dir: Optional[str] = None):
+        self.disk_dir = private_directory(disk_dir) if disk_dir else None
+        self.parses = 0
+        self._snapshots: Dict[Tuple, bytes] = {}
+        self._lock = threading.Lock()
+
+    def data(self, patient_path) -> Dict[str, object]:
+        """ File stem -> parsed content of every JSON file, a fresh copy. """
+        return pickle.loads(self._snapshot(Path(patient_path)))
+
+    def patient(self, patient_path) -> Patient:
+        data = self.data(patient_path)
+        if not data:
+            raise FileNotFoundError(
+                f'No JSON files were found in "{patient_path}"')
+        return Patient({camelcase(stem): value for stem, value in data.items()})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+    def _key(self, patient_path: Path) -> Tuple:
+        files = tuple(
+            sorted((path.name, stat.st_size, stat.st_mtime_ns)
+                   for path, stat in ((path, path.stat())
+                                      for path in patient_path.glob('*.json'))))
+        return (str(patient_path.resolve()), files)
+
+    def _snapshot(self, patient_path: Path) -> bytes:
+        key = self._key(patient_path)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            return snapshot
+
+        disk_path = None
+        if self.disk_dir:
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()
+            disk_path = self.disk_dir / f'{digest}.pickle'
+            if disk_path.exists():
+                snapshot = disk_path.read_bytes()
+
+        if snapshot is None:
+            data = {}
+            for path in patient_path.glob('*.json'):
+                with path.open('r') as fh:
+                    data[path.stem] = json.load(fh)
+            snapshot = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            self.parses += 1
+            if disk_path:
+                self._write(disk_path, snapshot)
+
+        with self._lock:
+            self._snapshots[key] = snapshot
+        return snapshot
+
+    def _write(self, disk_path: Path, snapshot: bytes) -> None:
+        # write then rename, so a concurrent worker never reads half a file
+        fd, tmp_path = tempfile.mkstemp(dir=disk_path.parent)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(snapshot)
+        os.replace(tmp_path, disk_path)
+
+
+PATIENT_FIXTURES = PatientFixtureCache(
+    os.environ.get('WORKFLOW_HELPERS_FIXTURE_CACHE'))
 
 
 class WorkflowHelpersBaseTest(TestCase):
@@ -27,7 +186,7 @@ class WorkflowHelpersBaseTest(TestCase):
         assert patient_path.is_dir(
         ), f'no patient directory exists from {patient_path}'
 
-        patient = load_local_patient(patient_path)
+        patient = PATIENT_FIXTURES.patient(patient_path)
         patient.patient['key'] = patient_key
         return patient
 
@@ -35,17 +194,16 @@ class WorkflowHelpersBaseTest(TestCase):
         """
         Load data from mock data JSON files dumped by the dump_patient command.
         """
-        filename = f'{self.mocks_path}/{patient_key}/{field}.json'
+        data = PATIENT_FIXTURES.data(f'{self.mocks_path}/{patient_key}/')
 
-        if not os.path.exists(filename):
+        if field not in data:
             if field == 'patient':
                 raise Exception(
                     f'Missing mock patient data for {patient_key}!')
 
             return []
 
-        with open(filename, 'r') as fh:
-            return json.load(fh)
+        return data[field]
 
     def assertIsNotApplicable(self, result: ProtocolResult):
         self.assertEqual('not_applicable', result.status)
@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+
+from canvas_workflow_helpers.indexes import AppointmentTimeline
+
+
+def appointment(id, start, states):
+    history = [{
+        'id': id * 10 + position,
+        'state': state,
+        'created': arrow.get(start).shift(minutes=position).isoformat(),
+    } for position, state in enumerate(states)]
+    return {
+        'id': id,
+        'externallyExposableId': f'ext-{id}',
+        'startTime': start,
+        'state': history[-1],
+        'stateHistory': history,
+    }
+
+
+class AppointmentTimelineTest(TestCase):
+
+    def setUp(self):
+        self.patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'appointments': [
+                appointment(3, '2022-03-01T10:00:00Z',
+                            ['BKD', 'CVD', 'LKD']),
+                appointment(1, '2022-01-01T10:00:00Z', ['BKD', 'CLD']),
+                appointment(2, '2022-02-01T10:00:00Z', ['BKD', 'CVD']),
+            ],
+            'upcomingAppointmentNotes': [{
+                'id': 7,
+                'providerDisplay': {
+                    'key': 'provider-1'
+                }
+            }],
+        })
+        self.timeline = AppointmentTimeline.for_patient(self.patient)
+
+    def test_lookups_by_id_and_state_event(self):
+        self.assertIs(self.timeline, AppointmentTimeline.for_patient(self.patient))
+        self.assertEqual(3, len(self.timeline))
+        self.assertEqual(2, self.timeline.get(2)['id'])
+        self.assertEqual(2, self.timeline.get('ext-2')['id'])
+        self.assertEqual(3, self.timeline.by_state_event(32)['id'])
+        self.assertEqual(3, self.timeline.by_state_event('31')['id'])
+        self.assertIsNone(self.timeline.by_state_event(99))
+        self.assertEqual('provider-1',
+                         self.timeline.upcoming_note(7)['providerDisplay']['key'])
+
+    def test_sorted_by_start(self):
+        self.assertEqual([1, 2, 3],
+                         [a['id'] for a in self.timeline.sorted_by_start()])
+        self.assertEqual([2, 3], [
+            a['id'] for a in self.timeline.between(
+                arrow.get('2022-02-01T10:00:00Z'), arrow.get('2022-12-31'))
+        ])
+        self.assertEqual(
+            1,
+            self.timeline.last_before(arrow.get('2022-02-01T10:00:00Z'))['id'])
+        self.assertEqual(
+            3,
+            self.timeline.next_after(arrow.get('2022-02-01T10:00:00Z'))['id'])
+        self.assertIsNone(self.timeline.next_after(arrow.get('2023-01-01')))
+
+    def test_state_transitions(self):
+        checked_in = [
+            self.timeline.transition_time(a, 'CVD')
+            for a in self.timeline.in_states('LKD', 'CVD')
+        ]
+        self.assertEqual([
+            arrow.get('2022-03-01T10:01:00Z'),
+            arrow.get('2022-02-01T10:01:00Z')
+        ], checked_in)
+        self.assertIsNone(
+            self.timeline.transition_time(self.timeline.get(1), 'CVD'))
+        # looked up by id, so a copy of the record or the id itself works
+        self.assertEqual(arrow.get('2022-03-01T10:01:00Z'),
+                         self.timeline.transition_time(
+                             dict(self.timeline.get(3)), 'CVD'))
+        self.assertEqual(arrow.get('2022-03-01T10:01:00Z'),
+                         self.timeline.transition_time(3, 'CVD'))
+        self.assertEqual([2, 3], [
+            a['id'] for _, a in self.timeline.transitions('CVD')
+        ])
@@ -1,7 +1,7 @@
 from pathlib import Path
 
 from canvas_workflow_kit.constants import CHANGE_TYPE
-from canvas_workflow_kit.utils import parse_class_from_python_source
+from canvas_workflow_helpers.loader import load_protocol_class
 from .base import WorkflowHelpersBaseTest
 from canvas_workflow_kit import events
 from canvas_workflow_kit.protocol import (ProtocolResult,
@@ -30,7 +30,7 @@ class AppointmentUpdaterTest(WorkflowHelpersBaseTest):
             __file__).parent.parent / 'protocols/appointment_updater.py'
         template = template_path.open('r').read()
 
-        return parse_class_from_python_source(template)
+        return load_protocol_class(template)
 
     def test_fields(self):
         Protocol = self.appointment_class
@@ -0,0 +1,181 @@
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+import requests
+
+from canvas_workflow_kit.constants import CHANGE_TYPE
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure, ProtocolResult
+
+from canvas_workflow_helpers.benchmarks import (BENCHMARK_SETTINGS,
+                                                DEFAULT_BASELINE, PROTOCOLS_DIR,
+                                                change_events,
+                                                discover_protocols,
+                                                find_regressions,
+                                                load_baseline, measure,
+                                                protocol_name, run_benchmarks,
+                                                save_baseline,
+                                                synthetic_patient)
+
+
+class Webhook(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Webhook'
+        version = '1.0.0'
+
+    def compute_results(self):
+        requests.post('https://hooks.example.invalid/patient', json={})
+        return ProtocolResult()
+
+
+class AppointmentWebhook(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Appointment Webhook'
+        version = '1.0.0'
+        compute_on_change_types = [CHANGE_TYPE.APPOINTMENT, CHANGE_TYPE.MESSAGE]
+
+    seen = []
+
+    def compute_results(self):
+        self.seen.append((self.settings.INSTANCE_NAME,
+                          self.field_changes['model_name'],
+                          self.field_changes['external_id']))
+        requests.post(f'https://{self.settings.INSTANCE_NAME}.example.invalid',
+                      json=self.field_changes['fields'])
+        return ProtocolResult()
+
+
+class BenchmarkTest(TestCase):
+
+    def test_run_benchmarks_records_metrics_and_errors(self):
+        good = PROTOCOLS_DIR / 'collective/HemoglobinA1cMonitoringInDiabetics.py'
+        with tempfile.TemporaryDirectory() as directory:
+            broken = Path(directory) / 'broken.py'
+            broken.write_text('this is not python')
+            results = run_benchmarks([good, broken], sizes=['small'], repeat=1)
+
+        metrics = results['collective/HemoglobinA1cMonitoringInDiabetics.py'][
+            'small']
+        self.assertEqual({'wall_time', 'allocations', 'peak_memory', 'requests'},
+                         set(metrics))
+        self.assertGreater(metrics['wall_time'], 0)
+        self.assertIn('error', results[broken.as_posix()]['small'])
+
+    def test_measure_does_not_send_requests(self):
+        metrics = measure(Webhook, synthetic_patient('small'), repeat=2)
+
+        self.assertEqual(1, metrics['requests'])
+        self.assertGreater(metrics['peak_memory'], 0)
+
+    def test_measure_runs_every_change_type_with_settings(self):
+        patient = synthetic_patient('small')
+        appointment = patient.appointments.records[0]
+        AppointmentWebhook.seen = []
+
+        metrics = measure(AppointmentWebhook, patient, repeat=1)
+
+        self.assertEqual(2, metrics['requests'])
+        self.assertEqual([
+            ('benchmark', 'appointment', appointment['externallyExposableId']),
+            ('benchmark', 'message', '1'),
+        ] * 2, AppointmentWebhook.seen)
+
+    def test_change_events(self):
+        patient = synthetic_patient('small')
+        appointment = patient.appointments.records[0]
+
+        (change_type, field_changes), _ = change_events(AppointmentWebhook,
+                                                        patient)
+
+        self.assertEqual('appointment', change_type)
+        self.assertTrue(field_changes['created'])
+        self.assertEqual(appointment['id'], field_changes['canvas_id'])
+        self.assertEqual([None, appointment['startTime']],
+                         field_changes['fields']['start_time'])
+        self.assertEqual([(None, {})], change_events(Webhook, patient))
+        self.assertEqual({'CLIENT_ID', 'CLIENT_SECRET', 'INSTANCE_NAME'},
+                         set(BENCHMARK_SETTINGS))
+
+    def test_committed_baseline_covers_every_protocol(self):
+        baseline = load_baseline(DEFAULT_BASELINE)
+
+        self.assertEqual(
+            {protocol_name(path) for path in discover_protocols()},
+            set(baseline))
+
+    def test_find_regressions(self):
+        baseline = {
+            'a.py': {
+                'small': {
+                    'wall_time': 0.1,
+                    'allocations': 1000,
+                    'peak_memory': 1000000
+                }
+            },
+            'b.py': {
+                'small': {
+                    'error': 'KeyError'
+                }
+            },
+        }
+        results = {
+            'a.py': {
+                'small': {
+                    'wall_time': 0.2,
+                    'allocations': 1050,
+                    'peak_memory': 1100000
+                }
+            },
+            'b.py': {
+                'small': {
+                    'wall_time': 5,
+                    'allocations': 0,
+                    'peak_memory': 0
+                }
+            },
+            'c.py': {
+                'small': {
+                    'wall_time': 5,
+                    'allocations': 0,
+                    'peak_memory': 0
+                }
+            },
+        }
+
+        self.assertEqual([
+            ('a.py', 'small', 'wall_time', 0.1, 0.2),
+            ('c.py', 'small', 'baseline', 'missing', 'ok'),
+        ], find_regressions(results, baseline, threshold=0.25))
+        self.assertEqual([('c.py', 'small', 'baseline', 'missing', 'ok')],
+                         find_regressions(results, baseline, threshold=1.5))
+
+    def test_errors_where_the_baseline_ran_are_regressions(self):
+        baseline = {'a.py': {'small': {'wall_time': 0.1}}}
+        results = {
+            'a.py': {
+                'small': {
+                    'error': "KeyError('created')"
+                }
+            },
+            'b.py': {
+                'small': {
+                    'error': 'load: SyntaxError()'
+                }
+            },
+        }
+
+        self.assertEqual([
+            ('a.py', 'small', 'error', 'ok', "KeyError('created')"),
+            ('b.py', 'small', 'baseline', 'missing', 'load: SyntaxError()'),
+        ], find_regressions(results, baseline))
+
+    def test_baseline_round_trip(self):
+        results = {'a.py': {'small': {'wall_time': 0.1}}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'baseline.json'
+            self.assertEqual({}, load_baseline(path))
+            save_baseline(results, path)
+            self.assertEqual(results, load_baseline(path))
@@ -0,0 +1,76 @@
+from pathlib import Path
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure
+
+from canvas_workflow_helpers.benchmarks import synthetic_patient
+from canvas_workflow_helpers.clock import EvaluationClock, EvaluationClockMixin
+from canvas_workflow_helpers.loader import load_protocol_class
+
+PROTOCOL = (Path(__file__).parent.parent /
+            'protocols/collective/TitrateGLP1AgonistDose.py')
+NOW = arrow.get('2023-01-01T12:00:00Z')
+
+
+class ClockProtocol(EvaluationClockMixin, ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Clock'
+        version = '1.0.0'
+
+
+class EvaluationClockTest(TestCase):
+
+    def test_windows_are_built_once(self):
+        clock = EvaluationClock(NOW)
+        self.assertIs(clock.last_month, clock.last_month)
+        self.assertIs(clock.last_six_months, clock.window(months=6))
+        self.assertEqual(NOW.shift(weeks=-2), clock.last_two_weeks.start)
+        self.assertEqual(NOW.shift(years=-1), clock.last_year.start)
+        self.assertEqual(NOW, clock.last_year.end)
+        self.assertIs(clock.ago(months=6), clock.last_six_months.start)
+        self.assertEqual((NOW.shift(weeks=-3), NOW.shift(weeks=-2)),
+                         (clock.week(2).start, clock.week(2).end))
+
+    def test_cached_queries(self):
+        clock = EvaluationClock(NOW)
+        calls = []
+        self.assertEqual(1, clock.cached('a', lambda: calls.append(1) or 1))
+        self.assertEqual(1, clock.cached('a', lambda: calls.append(1) or 2))
+        self.assertEqual([1], calls)
+
+        patient = synthetic_patient('small')
+        vitals = clock.within(patient.vital_signs, clock.last_year)
+        self.assertIs(vitals, clock.within(patient.vital_signs, clock.last_year))
+        self.assertEqual(list(patient.vital_signs.within(clock.last_year)),
+                         list(vitals))
+
+    def test_frozen(self):
+        clock = EvaluationClock(NOW)
+        with clock.frozen():
+            self.assertEqual(NOW, arrow.now())
+            self.assertEqual(NOW, arrow.utcnow())
+            self.assertEqual('UTC', arrow.utcnow().tzinfo.tzname(None))
+            with self.assertRaises(RuntimeError):
+                with EvaluationClock(NOW).frozen():
+                    pass
+        self.assertNotEqual(NOW, arrow.utcnow())
+
+    def test_mixin_uses_the_protocol_now(self):
+        protocol = ClockProtocol(patient=synthetic_patient('small'), now=NOW)
+        self.assertIs(protocol.clock, protocol.clock)
+        self.assertEqual(NOW.shift(months=-1), protocol.clock.last_month.start)
+
+    def test_protocol_windows_match_under_a_frozen_clock(self):
+        Protocol = load_protocol_class(PROTOCOL)
+        clock = EvaluationClock(arrow.get('2022-06-01'))
+        protocol = Protocol(patient=synthetic_patient('small'), now=clock.now)
+        with clock.frozen():
+            self.assertEqual(
+                protocol.weight_loss_ratio_over_time(clock.last_month),
+                protocol.weight_loss_ratio_over_last_month())
+            self.assertEqual(
+                protocol.weight_loss_ratio_over_time(clock.last_two_weeks),
+                protocol.weight_loss_ratio_over_last_two_weeks())
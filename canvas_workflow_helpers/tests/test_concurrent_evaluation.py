@@ -0,0 +1,140 @@
+import threading
+
+from pathlib import Path
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.constants import CHANGE_TYPE
+from canvas_workflow_kit.protocol import (STATUS_DUE, STATUS_NOT_RELEVANT,
+                                          ClinicalQualityMeasure,
+                                          ProtocolResult)
+
+from canvas_workflow_helpers.benchmarks import synthetic_patient
+from canvas_workflow_helpers.concurrent_evaluation import (ConcurrentEvaluator,
+                                                           current_context,
+                                                           thread_cache)
+from canvas_workflow_helpers.loader import load_protocol_class
+
+PROTOCOLS = Path(__file__).parent.parent / 'protocols/collective'
+NOW = arrow.get('2023-01-01')
+
+# makes the stateful protocols overlap
+BARRIER = threading.Barrier(3, timeout=5)
+
+
+class StatefulProtocol(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Stateful'
+        version = '1.0.0'
+
+    def compute_results(self):
+        self.base_payload = {'protocol': current_context().name}
+        BARRIER.wait()
+        cache = thread_cache()
+        cache['calls'] = cache.get('calls', 0) + 1
+        result = ProtocolResult()
+        result.status = STATUS_DUE
+        result.due_in = cache['calls']
+        result.add_narrative(f"{self.base_payload['protocol']} {self.now}")
+        self.set_updates([self.base_payload])
+        return result
+
+
+class FailingProtocol(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Failing'
+        version = '1.0.0'
+        compute_on_change_types = [CHANGE_TYPE.CONDITION]
+
+    def compute_results(self):
+        raise KeyError('broken')
+
+
+class MutatingProtocol(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Mutating'
+        version = '1.0.0'
+
+    def compute_results(self):
+        self.patient.patient['firstName'] = 'changed'
+        return ProtocolResult()
+
+
+class ConcurrentEvaluatorTest(TestCase):
+
+    def setUp(self):
+        self.patient = synthetic_patient('small')
+        self.evaluator = ConcurrentEvaluator(max_workers=4)
+
+    def tearDown(self):
+        self.evaluator.shutdown()
+
+    def test_instances_are_isolated_and_order_is_kept(self):
+        report = self.evaluator.evaluate(self.patient, {
+            'c': StatefulProtocol,
+            'a': StatefulProtocol,
+            'b': StatefulProtocol,
+        }, now=NOW)
+
+        self.assertEqual(['c', 'a', 'b'], [o.name for o in report.outcomes])
+        self.assertEqual([f'{name} {NOW}' for name in 'cab'],
+                         [o.result.narrative for o in report.outcomes])
+        self.assertEqual([{'protocol': name} for name in 'cab'], report.updates)
+        self.assertEqual(3, len({o.thread for o in report.outcomes}))
+        self.assertEqual({}, report.errors)
+
+    def test_errors_and_change_types(self):
+        report = self.evaluator.evaluate(self.patient,
+                                         {'failing': FailingProtocol},
+                                         now=NOW)
+        self.assertIsInstance(report.errors['failing'], KeyError)
+        self.assertFalse(report.outcomes[0].ok)
+
+        report = self.evaluator.evaluate(self.patient,
+                                         {'failing': FailingProtocol},
+                                         change_types=[CHANGE_TYPE.APPOINTMENT])
+        self.assertEqual(STATUS_NOT_RELEVANT,
+                         report.results['failing'].status)
+
+    def test_patient_copy(self):
+        first_name = self.patient.patient['firstName']
+        self.evaluator.evaluate(self.patient, {'mutating': MutatingProtocol},
+                                copy_patient_for=['mutating'])
+        self.assertEqual(first_name, self.patient.patient['firstName'])
+
+    def test_thread_cache_is_per_evaluation(self):
+        thread_cache()['outside'] = True
+        self.assertTrue(thread_cache()['outside'])
+        for _ in range(2):
+            report = self.evaluator.evaluate(self.patient, {
+                'a': StatefulProtocol,
+                'b': StatefulProtocol,
+                'c': StatefulProtocol,
+            })
+            self.assertEqual([1, 1, 1],
+                             [r.due_in for r in report.results.values()])
+        self.assertIsNone(current_context())
+
+    def test_matches_sequential_evaluation(self):
+        names = [
+            'VisitFrequencyForDiabetes.py', 'HemoglobinA1cMonitoringInDiabetics.py',
+            'ScreeningForDiabetes.py', 'TitrateGLP1AgonistDose.py'
+        ]
+        protocols = {name: load_protocol_class(PROTOCOLS / name) for name in names}
+
+        sequential = {}
+        for name, protocol_class in protocols.items():
+            result = protocol_class(patient=self.patient, now=NOW).compute_results()
+            sequential[name] = (result.status, result.narrative)
+
+        report = self.evaluator.evaluate(self.patient, protocols, now=NOW)
+        self.assertEqual({}, report.errors)
+        self.assertEqual(sequential, {
+            name: (result.status, result.narrative)
+            for name, result in report.results.items()
+        })
+        self.assertEqual(names, list(report.results))
@@ -0,0 +1,133 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.patient_recordset import ConditionRecordSet
+from canvas_workflow_kit.timeframe import Timeframe
+
+from canvas_workflow_helpers.criteria import Criteria
+from canvas_workflow_helpers.value_sets.v2021 import (BetaBlockerTherapy,
+                                                      Diabetes,
+                                                      Hba1CLaboratoryTest,
+                                                      HeartFailure)
+
+RXNORM = 'http://www.nlm.nih.gov/research/umls/rxnorm'
+
+
+def condition(code, status='active', onset='2021-01-01'):
+    return {
+        'id': code,
+        'clinicalStatus': status,
+        'coding': [{
+            'system': 'ICD-10',
+            'code': code
+        }],
+        'periods': [{
+            'from': onset,
+            'to': None
+        }],
+    }
+
+
+def patient():
+    diabetes = sorted(Diabetes.ICD10CM)[0]
+    heart_failure = sorted(HeartFailure.ICD10CM)[0]
+    beta_blocker = sorted(BetaBlockerTherapy.RXNORM)[0]
+    a1c = sorted(Hba1CLaboratoryTest.LOINC)[0]
+    return Patient({
+        'patient': {
+            'key': 'p1'
+        },
+        'conditions': [
+            condition(diabetes),
+            condition(heart_failure, status='resolved'),
+            condition('Z000'),
+        ],
+        'medications': [{
+            'id': 1,
+            'status': 'active',
+            'coding': [{
+                'system': RXNORM,
+                'code': beta_blocker
+            }],
+            'periods': [{
+                'from': '2020-01-01',
+                'to': None
+            }],
+        }],
+        'labReports': [{
+            'id': 1,
+            'originalDate': '2022-06-01T00:00:00Z',
+            'loincCodes': [{
+                'code': a1c,
+                'value': '7.1'
+            }],
+        }, {
+            'id': 2,
+            'originalDate': '2019-06-01T00:00:00Z',
+            'loincCodes': [{
+                'code': a1c,
+                'value': '8.0'
+            }],
+        }],
+    })
+
+
+class CriteriaTest(TestCase):
+
+    def setUp(self):
+        self.patient = patient()
+        self.timeframe = Timeframe(start=arrow.get('2022-01-01'),
+                                   end=arrow.get('2022-12-31'))
+        self.criteria = Criteria()
+        self.criteria.add('has_diabetes',
+                          'conditions',
+                          Diabetes,
+                          clinicalStatus='active')
+        self.criteria.add('has_heart_failure',
+                          'conditions',
+                          HeartFailure,
+                          clinicalStatus='active')
+        self.criteria.add('had_heart_failure', 'conditions', HeartFailure)
+        self.criteria.add('on_beta_blocker',
+                          'medications',
+                          BetaBlockerTherapy,
+                          timeframe=True,
+                          status='active')
+        self.criteria.add('recent_a1c',
+                          'lab_reports',
+                          Hba1CLaboratoryTest,
+                          timeframe=True)
+
+    def test_matches_chained_queries(self):
+        results = self.criteria.evaluate(self.patient, self.timeframe)
+
+        conditions = self.patient.conditions
+        self.assertEqual(
+            conditions.find(Diabetes).filter(clinicalStatus='active').records,
+            results['has_diabetes'].records)
+        self.assertFalse(results.has('has_heart_failure'))
+        self.assertTrue(results.has('had_heart_failure'))
+        self.assertTrue(results.has('on_beta_blocker'))
+        self.assertEqual(
+            self.patient.lab_reports.find(Hba1CLaboratoryTest).within(
+                self.timeframe).records, results['recent_a1c'].records)
+        self.assertIsInstance(results['has_diabetes'], ConditionRecordSet)
+
+    def test_each_record_is_scanned_once(self):
+        with patch.object(ConditionRecordSet,
+                          'item_to_codes',
+                          wraps=ConditionRecordSet.item_to_codes) as codes:
+            self.criteria.evaluate(self.patient, self.timeframe)
+
+        self.assertEqual(3, codes.call_count)
+
+    def test_timeframe_is_required_when_requested(self):
+        with self.assertRaises(ValueError):
+            self.criteria.evaluate(self.patient)
+
+    def test_names_are_unique(self):
+        with self.assertRaises(ValueError):
+            self.criteria.add('has_diabetes', 'conditions', Diabetes)
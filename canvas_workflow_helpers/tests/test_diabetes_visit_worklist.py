@@ -0,0 +1,115 @@
+import csv
+import json
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.protocol import STATUS_DUE
+from canvas_workflow_kit.utils import load_local_patient
+
+from canvas_workflow_helpers.loader import load_protocol_class
+from canvas_workflow_helpers.population import (build_worklist, control_level,
+                                                patient_directories,
+                                                write_worklist)
+from canvas_workflow_helpers.population.diabetes_visits import (DIABETES_CODES,
+                                                                patient_facts)
+from canvas_workflow_helpers.synthetic import SyntheticPatientGenerator
+
+PROTOCOL = (Path(__file__).parent.parent /
+            'protocols/collective/VisitFrequencyForDiabetes.py')
+
+
+class DiabetesVisitWorklistTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        SyntheticPatientGenerator.from_size(
+            'small', seed=3, now=arrow.utcnow()).write(cls.directory.name, 40)
+        cls.directories = patient_directories(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_matches_the_protocol(self):
+        Protocol = load_protocol_class(PROTOCOL)
+        due = set()
+        for directory in self.directories:
+            patient = load_local_patient(directory)
+            if Protocol(patient=patient).compute_results().status == STATUS_DUE:
+                due.add(patient.patient['key'])
+
+        rows = build_worklist(self.directories)
+        self.assertTrue(due)
+        self.assertEqual(due, {row['patient_key'] for row in rows})
+        self.assertEqual(sorted(row['due_date'] for row in rows),
+                         [row['due_date'] for row in rows])
+
+    def test_workers_give_the_same_worklist(self):
+        now = arrow.utcnow()
+        self.assertEqual(build_worklist(self.directories, now),
+                         build_worklist(self.directories, now, workers=2))
+
+    def test_write_worklist(self):
+        rows = build_worklist(self.directories)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'worklist.csv'
+            write_worklist(rows, path)
+            with path.open() as fh:
+                written = list(csv.DictReader(fh))
+
+        self.assertEqual([row['patient_key'] for row in rows],
+                         [row['patient_key'] for row in written])
+
+    def test_control_level(self):
+        self.assertEqual('very_poorly_controlled', control_level(9.5, False, 3))
+        self.assertEqual('poorly_controlled', control_level(9.5, True, 3))
+        self.assertEqual('poorly_controlled', control_level(7.5, False, 1))
+        self.assertEqual('well_controlled', control_level(7.5, True, 0))
+        self.assertEqual('unknown', control_level(None, False, 0))
+
+    def test_last_a1c_is_the_latest_instant(self):
+        with tempfile.TemporaryDirectory() as directory:
+            files = {
+                'conditions': [{
+                    'clinicalStatus': 'active',
+                    'coding': [{
+                        'system': 'ICD-10',
+                        'code': sorted(DIABETES_CODES)[0]
+                    }]
+                }],
+                'appointments': [{
+                    'state': {
+                        'state': 'CVD'
+                    },
+                    'stateHistory': [{
+                        'state': 'CVD',
+                        'created': '2023-01-02T10:00:00Z'
+                    }]
+                }],
+                # 04:00 UTC on the 6th, later than the second report even
+                # though its text sorts first
+                'lab_reports': [{
+                    'originalDate': '2023-01-05T23:00:00-05:00',
+                    'loincCodes': [{
+                        'code': '4548-4'
+                    }],
+                    'value': '9.5'
+                }, {
+                    'originalDate': '2023-01-06T02:00:00+00:00',
+                    'loincCodes': [{
+                        'code': '4548-4'
+                    }],
+                    'value': '7.0'
+                }],
+            }
+            for name, records in files.items():
+                (Path(directory) / f'{name}.json').write_text(json.dumps(records))
+
+            facts = patient_facts(Path(directory), arrow.get('2023-02-01'))
+
+        self.assertEqual(9.5, facts['last_a1c'])
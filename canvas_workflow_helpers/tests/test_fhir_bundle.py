@@ -0,0 +1,118 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from requests import RequestException
+
+from canvas_workflow_helpers.fhir import (BATCH, BundleError,
+                                          CachedFumageHelper, FhirUnitOfWork)
+from .base import FakeFumageHelper, fhir_response
+
+
+def bundle_response(*statuses):
+    return fhir_response(
+        body={
+            'resourceType': 'Bundle',
+            'type': 'transaction-response',
+            'entry': [{
+                'response': {
+                    'status': status,
+                    'location': location,
+                }
+            } for status, location in statuses]
+        })
+
+
+@patch('canvas_workflow_helpers.fhir.bundle.requests.post')
+class FhirUnitOfWorkTest(TestCase):
+
+    def setUp(self):
+        self.fhir = FakeFumageHelper()
+
+    def test_writes_are_sent_as_one_transaction(self, post):
+        post.return_value = bundle_response(
+            ('200 OK', 'CareTeam/p1/_history/2'),
+            ('201 Created', 'Task/t1/_history/1'))
+
+        with FhirUnitOfWork(self.fhir) as work:
+            care_team = work.update('CareTeam', 'p1', {'id': 'p1'})
+            task = work.create('Task', {'description': 'Review New Intake'})
+            self.assertEqual(0, post.call_count)
+
+        self.assertEqual(1, post.call_count)
+        bundle = post.call_args[1]['json']
+        self.assertEqual('transaction', bundle['type'])
+        self.assertEqual([('PUT', 'CareTeam/p1'), ('POST', 'Task')],
+                         [(e['request']['method'], e['request']['url'])
+                          for e in bundle['entry']])
+        self.assertEqual(task.full_url, bundle['entry'][1]['fullUrl'])
+
+        self.assertTrue(care_team.ok)
+        self.assertEqual(201, task.status_code)
+        self.assertEqual('Task/t1/_history/1', task.location)
+        self.assertEqual(0, len(work))
+
+    def test_batch_reports_per_entry_failures(self, post):
+        post.return_value = bundle_response(('201 Created', 'Task/t1'),
+                                            ('400 Bad Request', None))
+        work = FhirUnitOfWork(self.fhir, bundle_type=BATCH)
+        first = work.create('Task', {})
+        second = work.create('Task', {})
+
+        self.assertEqual([first, second], work.flush())
+        self.assertTrue(first.ok)
+        self.assertFalse(second.ok)
+
+    def test_failed_transaction_raises(self, post):
+        post.return_value = fhir_response(status_code=400)
+        work = FhirUnitOfWork(self.fhir)
+        task = work.create('Task', {})
+
+        with self.assertRaises(RequestException):
+            work.flush()
+        self.assertIsNone(task.status)
+
+    def test_failed_bundle_is_not_sent_again(self, post):
+        post.return_value = fhir_response(status_code=500)
+        work = FhirUnitOfWork(self.fhir)
+        task = work.create('Task', {})
+
+        with self.assertRaises(BundleError) as raised:
+            work.flush()
+        self.assertEqual([task], raised.exception.entries)
+        self.assertEqual(0, len(work))
+        self.assertEqual([], work.flush())
+        self.assertEqual(1, post.call_count)
+
+        # retrying is up to the caller
+        post.return_value = bundle_response(('201 Created', 'Task/t1'))
+        work.requeue(raised.exception.entries)
+        self.assertEqual([task], work.flush())
+        self.assertEqual('Task/t1', task.location)
+        self.assertEqual(2, post.call_count)
+
+    def test_nothing_is_sent_when_an_exception_escapes(self, post):
+        with self.assertRaises(KeyError):
+            with FhirUnitOfWork(self.fhir) as work:
+                work.create('Task', {})
+                raise KeyError('boom')
+
+        self.assertEqual(0, post.call_count)
+
+    def test_empty_unit_of_work_sends_nothing(self, post):
+        self.assertEqual([], FhirUnitOfWork(self.fhir).flush())
+        self.assertEqual(0, post.call_count)
+
+    def test_flush_invalidates_a_cached_helper(self, post):
+        post.return_value = bundle_response(('201 Created', 'Task/t1'))
+        cached = CachedFumageHelper(self.fhir)
+        cached.search('Task', {'patient': 'Patient/p1'})
+
+        work = FhirUnitOfWork(cached)
+        work.create('Task', {})
+        work.flush()
+
+        self.assertEqual(1, cached.stats.invalidations)
+
+    def test_unknown_bundle_type(self, post):
+        with self.assertRaises(ValueError):
+            FhirUnitOfWork(self.fhir, bundle_type='history')
@@ -0,0 +1,144 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from canvas_workflow_helpers.fhir import CachedFumageHelper, FhirResponseCache
+from .base import FakeClock, FakeFumageHelper, fhir_response
+
+
+class CachedFumageHelperTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.fhir = FakeFumageHelper()
+        self.cache = FhirResponseCache(max_entries=2,
+                                       default_ttl=10,
+                                       ttls={'Appointment': 100},
+                                       clock=self.clock)
+        self.cached = CachedFumageHelper(self.fhir, cache=self.cache)
+
+    def test_read_is_served_from_cache_while_fresh(self):
+        self.fhir.responses = [fhir_response(body={'id': 'a'})]
+
+        first = self.cached.read('CareTeam', 'a')
+        second = self.cached.read('CareTeam', 'a')
+
+        self.assertIs(first, second)
+        self.assertEqual(1, len(self.fhir.calls))
+        self.assertEqual(1, self.cached.stats.hits)
+        self.assertEqual(1, self.cached.stats.misses)
+
+    def test_search_key_ignores_parameter_order(self):
+        self.cached.search('Task', {'status': 'requested', 'patient': 'p'})
+        self.cached.search('Task', {'patient': 'p', 'status': 'requested'})
+
+        self.assertEqual(1, len(self.fhir.calls))
+
+    def test_errors_are_not_cached(self):
+        self.fhir.responses = [fhir_response(status_code=500)]
+
+        self.assertEqual(500, self.cached.read('CareTeam', 'a').status_code)
+        self.assertEqual(200, self.cached.read('CareTeam', 'a').status_code)
+        self.assertEqual(2, len(self.fhir.calls))
+
+    def test_per_resource_ttl(self):
+        self.cached.read('CareTeam', 'a')
+        self.cached.read('Appointment', 'b')
+        self.clock.now = 50
+
+        self.cached.read('CareTeam', 'a')
+        self.cached.read('Appointment', 'b')
+
+        self.assertEqual([('read', 'CareTeam', 'a'), ('read', 'Appointment', 'b'),
+                          ('read', 'CareTeam', 'a')], self.fhir.calls)
+
+    @patch('canvas_workflow_helpers.fhir.cache.requests.get')
+    def test_expired_entry_is_revalidated_with_etag(self, get):
+        original = fhir_response(body={'id': 'a'}, headers={'ETag': 'W/"1"'})
+        self.fhir.responses = [original]
+        get.return_value = fhir_response(status_code=304)
+
+        self.cached.read('CareTeam', 'a')
+        self.clock.now = 20
+        revalidated = self.cached.read('CareTeam', 'a')
+
+        self.assertIs(original, revalidated)
+        self.assertEqual('W/"1"', get.call_args[1]['headers']['If-None-Match'])
+        self.assertEqual(1, self.cached.stats.revalidations)
+
+        # the entry is fresh again, so no further requests are made
+        self.cached.read('CareTeam', 'a')
+        self.assertEqual(1, get.call_count)
+
+    @patch('canvas_workflow_helpers.fhir.cache.requests.get')
+    def test_revalidation_uses_the_helper_session(self, get):
+        self.fhir.session = Mock()
+        self.fhir.session.get.return_value = fhir_response(status_code=304)
+        self.fhir.headers = {'Authorization': 'Bearer refreshed'}
+        self.fhir.responses = [fhir_response(headers={'ETag': 'W/"1"'})]
+
+        self.cached.read('CareTeam', 'a')
+        self.clock.now = 20
+        self.cached.read('CareTeam', 'a')
+
+        get.assert_not_called()
+        url, = self.fhir.session.get.call_args[0]
+        self.assertEqual(f'{self.fhir.base_fhir_url}/CareTeam/a', url)
+        self.assertEqual(
+            {
+                'Authorization': 'Bearer refreshed',
+                'If-None-Match': 'W/"1"'
+            }, self.fhir.session.get.call_args[1]['headers'])
+
+    @patch('canvas_workflow_helpers.fhir.cache.requests.get')
+    def test_changed_resource_replaces_entry(self, get):
+        self.fhir.responses = [fhir_response(headers={'ETag': 'W/"1"'})]
+        changed = fhir_response(body={'v': 2}, headers={'ETag': 'W/"2"'})
+        get.return_value = changed
+
+        self.cached.read('CareTeam', 'a')
+        self.clock.now = 20
+
+        self.assertIs(changed, self.cached.read('CareTeam', 'a'))
+        self.assertIs(changed, self.cached.read('CareTeam', 'a'))
+        self.assertEqual(2, self.cached.stats.misses)
+
+    def test_lru_eviction(self):
+        self.cached.read('Patient', 'a')
+        self.cached.read('Patient', 'b')
+        self.cached.read('Patient', 'a')
+        self.cached.read('Patient', 'c')
+
+        self.assertEqual(1, self.cached.stats.evictions)
+        self.cached.read('Patient', 'a')
+        self.assertEqual(3, len(self.fhir.calls))
+
+    def test_writes_invalidate_cached_entries(self):
+        self.cache.max_entries = 10
+        self.cached.read('CareTeam', 'a')
+        self.cached.search('CareTeam', {'patient': 'p'})
+        self.cached.read('Task', 't')
+
+        self.cached.update('CareTeam', 'a', {})
+        self.cached.read('CareTeam', 'a')
+        self.cached.search('CareTeam', {'patient': 'p'})
+        self.cached.create('Task', {})
+        self.cached.read('Task', 't')
+
+        # a created Task only invalidates Task searches, not reads
+        self.assertEqual(1, self.cached.stats.hits)
+        self.assertEqual(5, self.cached.stats.misses)
+        self.assertEqual(2, self.cached.stats.invalidations)
+
+    def test_instances_sharing_a_cache_are_kept_apart(self):
+        other_fhir = FakeFumageHelper()
+        other_fhir.base_fhir_url = 'https://fumage-other.canvasmedical.com'
+        other = CachedFumageHelper(other_fhir, cache=self.cache)
+
+        self.cached.read('CareTeam', 'a')
+        other.read('CareTeam', 'a')
+        self.assertEqual(1, len(self.fhir.calls))
+        self.assertEqual(1, len(other_fhir.calls))
+
+        other.update('CareTeam', 'a', {})
+        self.cached.read('CareTeam', 'a')
+        self.assertEqual(1, len(self.fhir.calls))
@@ -0,0 +1,135 @@
+from unittest import TestCase
+
+from canvas_workflow_helpers.fhir import FhirRequestCoalescer, date_filter
+from .base import FakeFumageHelper, fhir_response
+
+APPROVAL = 'Questionnaire/12f68f8a-ed40-4482-a010-8207df8a5e5c'
+INTAKE = 'Questionnaire/9e984119-558e-415e-a19a-44205dcdaa1b'
+
+
+def questionnaire_response(_id, questionnaire, authored):
+    return {
+        'resource': {
+            'resourceType': 'QuestionnaireResponse',
+            'id': _id,
+            'questionnaire': questionnaire,
+            'authored': authored,
+        }
+    }
+
+
+class FhirRequestCoalescerTest(TestCase):
+
+    def setUp(self):
+        self.fhir = FakeFumageHelper([
+            fhir_response(
+                body={
+                    'resourceType': 'Bundle',
+                    'entry': [
+                        questionnaire_response('a', APPROVAL,
+                                               '2023-01-05T10:00:00+00:00'),
+                        questionnaire_response('b', INTAKE,
+                                               '2023-01-05T11:00:00+00:00'),
+                        questionnaire_response('c', INTAKE,
+                                               '2023-01-02T18:00:00-08:00'),
+                    ]
+                })
+        ])
+        self.coalescer = FhirRequestCoalescer(self.fhir)
+
+    def search(self, questionnaire, authored):
+        response = self.coalescer.search(
+            'QuestionnaireResponse', {
+                'patient': 'Patient/p1',
+                'questionnaire': questionnaire,
+                'authored': authored,
+            })
+        return [e['resource']['id'] for e in response.json()['entry']]
+
+    def test_searches_differing_in_local_params_share_one_call(self):
+        self.assertEqual(['a'], self.search(APPROVAL, 'eq2023-01-05'))
+        self.assertEqual(['b'], self.search(INTAKE, 'eq2023-01-05'))
+        # a date is compared with the resource's own day, 18:00 on the 2nd
+        # in -08:00 is on the 2nd even though it is the 3rd in UTC
+        self.assertEqual(['c'], self.search(INTAKE, 'eq2023-01-02'))
+        self.assertEqual(['b', 'c'], self.search(INTAKE, 'ge2023-01'))
+
+        self.assertEqual([('search', 'QuestionnaireResponse', {
+            'patient': 'Patient/p1'
+        })], self.fhir.calls)
+        self.assertEqual(4, self.coalescer.stats.requests)
+        self.assertEqual(3, self.coalescer.stats.saved)
+
+    def test_identical_reads_are_sent_once(self):
+        self.coalescer.read('CareTeam', 'p1')
+        self.coalescer.read('CareTeam', 'p1')
+
+        self.assertEqual(1, len(self.fhir.calls))
+        self.assertEqual(1, self.coalescer.stats.saved)
+
+    def test_paginated_bundle_falls_back_to_exact_search(self):
+        self.fhir.responses = [
+            fhir_response(body={
+                'link': [{
+                    'relation': 'next',
+                    'url': 'https://next'
+                }],
+                'entry': []
+            }),
+            fhir_response(body={
+                'entry': [questionnaire_response('z', INTAKE, '2023-01-05')]
+            }),
+        ]
+
+        self.assertEqual(['z'], self.search(INTAKE, 'eq2023-01-05'))
+        self.assertEqual(2, len(self.fhir.calls))
+        self.assertEqual('eq2023-01-05', self.fhir.calls[1][2]['authored'])
+
+        # the incomplete wide search is not tried again
+        for authored in ('eq2023-01-05', 'eq2023-01-06'):
+            self.coalescer.search('QuestionnaireResponse', {
+                'patient': 'Patient/p1',
+                'questionnaire': APPROVAL,
+                'authored': authored,
+            })
+        self.assertEqual(4, len(self.fhir.calls))
+        self.assertEqual([{'patient': 'Patient/p1'}] + [{
+            'patient': 'Patient/p1',
+            'questionnaire': questionnaire,
+            'authored': authored
+        } for questionnaire, authored in (
+            (INTAKE, 'eq2023-01-05'), (APPROVAL, 'eq2023-01-05'),
+            (APPROVAL, 'eq2023-01-06'))], [call[2] for call in self.fhir.calls])
+        self.assertEqual(0, self.coalescer.stats.saved)
+        self.assertEqual(1, self.coalescer.stats.fallbacks)
+
+    def test_unknown_params_are_sent_to_the_server(self):
+        self.coalescer.search('Task', {'status': 'requested'})
+        self.coalescer.search('Task', {'status': 'completed'})
+
+        self.assertEqual(2, len(self.fhir.calls))
+
+    def test_writes_invalidate_coalesced_responses(self):
+        self.coalescer.read('CareTeam', 'p1')
+        self.coalescer.update('CareTeam', 'p1', {})
+        self.coalescer.read('CareTeam', 'p1')
+
+        self.assertEqual(['read', 'update', 'read'],
+                         [call[0] for call in self.fhir.calls])
+
+
+class DateFilterTest(TestCase):
+
+    def test_searched_values_are_compared_as_instants(self):
+        authored = date_filter('authored')
+        resource = {'authored': '2023-01-05T21:00:00-05:00'}
+
+        self.assertTrue(authored(resource, 'le2023-01-05T22:00:00-05:00'))
+        self.assertFalse(authored(resource, 'lt2023-01-05T21:00:00-05:00'))
+        self.assertTrue(authored(resource, 'eq2023-01-06T02:00:00+00:00'))
+        self.assertTrue(authored(resource, 'eq2023-01-05'))
+        self.assertFalse(authored(resource, 'eq2023-01-06'))
+        self.assertTrue(authored(resource, 'ge2023-01'))
+        self.assertTrue(authored(resource, 'lt2024'))
+        self.assertTrue(authored(resource, 'ne2023-01-04'))
+        self.assertFalse(authored({}, 'eq2023-01-05'))
@@ -0,0 +1,91 @@
+import threading
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from requests import RequestException
+
+from canvas_workflow_helpers.fhir import iter_pages, iter_search, search_first
+from .base import FakeFumageHelper, fhir_response
+
+
+def page(ids, next_url=None):
+    return fhir_response(
+        body={
+            'resourceType': 'Bundle',
+            'link': [{
+                'relation': 'next',
+                'url': next_url
+            }] if next_url else [],
+            'entry': [{
+                'resource': {
+                    'id': _id
+                }
+            } for _id in ids],
+        })
+
+
+PAGES = {
+    'https://next/2': page(['c', 'd'], 'https://next/3'),
+    'https://next/3': page(['e']),
+}
+
+
+@patch('canvas_workflow_helpers.fhir.pagination.requests.get',
+       side_effect=lambda url, headers: PAGES[url])
+class FhirPaginationTest(TestCase):
+
+    def setUp(self):
+        self.fhir = FakeFumageHelper([page(['a', 'b'], 'https://next/2')])
+
+    def test_iter_search_follows_next_links(self, get):
+        ids = [r['id'] for r in iter_search(self.fhir, 'Appointment')]
+
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], ids)
+        self.assertEqual(2, get.call_count)
+
+    def test_pages_are_fetched_lazily(self, get):
+        pages = iter_pages(self.fhir, 'Appointment', {'patient': 'Patient/p'})
+
+        next(pages)
+        self.assertEqual(0, get.call_count)
+        next(pages)
+        self.assertEqual(1, get.call_count)
+
+    def test_search_first_stops_early(self, get):
+        found = search_first(self.fhir,
+                             'Task',
+                             predicate=lambda r: r['id'] == 'c')
+
+        self.assertEqual({'id': 'c'}, found)
+        self.assertEqual(['https://next/2'],
+                         [call[0][0] for call in get.call_args_list])
+
+    def test_search_first_without_match(self, get):
+        self.assertIsNone(
+            search_first(self.fhir, 'Task', predicate=lambda r: False))
+
+    def test_prefetch_returns_the_same_resources(self, get):
+        ids = [
+            r['id'] for r in iter_search(self.fhir, 'Appointment',
+                                         prefetch=True)
+        ]
+
+        self.assertEqual(['a', 'b', 'c', 'd', 'e'], ids)
+
+    def test_prefetch_requests_the_next_page_ahead(self, get):
+        fetched = threading.Event()
+        get.side_effect = lambda url, headers: fetched.set() or PAGES[url]
+
+        pages = iter_pages(self.fhir, 'Appointment', prefetch=True)
+        next(pages)
+
+        # page two is requested before the caller asks for it
+        self.assertTrue(fetched.wait(5))
+        pages.close()
+
+    def test_failed_page_raises(self, get):
+        self.fhir.responses = [fhir_response(status_code=500)]
+
+        with self.assertRaises(RequestException):
+            list(iter_search(self.fhir, 'Task'))
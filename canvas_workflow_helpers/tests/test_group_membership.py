@@ -0,0 +1,154 @@
+import json
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+from canvas_workflow_kit.patient import Patient
+
+from canvas_workflow_helpers.loader import load_protocol_class
+from canvas_workflow_helpers.population import (CareTeamMemberRule,
+                                                MembershipRule,
+                                                OptOutConsentRule,
+                                                desired_membership,
+                                                group_updates,
+                                                patient_directories, reconcile,
+                                                rules_from_config)
+
+PROTOCOLS = Path(__file__).parent.parent / 'protocols'
+OPT_OUT_GROUP = '00000000-0000-0000-0000-000000000000'
+CARE_TEAM_GROUP = '173e8abd-7de1-4324-b5c3-4a02089213a1'
+STAFF_KEY = 'e766816672f34a5b866771c773e38f3c'
+
+
+def write_patient(root, key, consent_state=None, care_team_role=None):
+    directory = Path(root) / key
+    directory.mkdir()
+    memberships = []
+    if care_team_role:
+        memberships.append({
+            'staff': {
+                'key': STAFF_KEY
+            },
+            'role': {
+                'code': care_team_role
+            }
+        })
+    consents = []
+    if consent_state:
+        consents.append({
+            'category': {
+                'code': 'A0001'
+            },
+            'state': consent_state
+        })
+    data = {
+        'patient': {
+            'key': key,
+            'careTeamMemberships': memberships
+        },
+        'consents': consents,
+    }
+    for name, content in data.items():
+        (directory / f'{name}.json').write_text(json.dumps(content))
+    return data
+
+
+def group_entries(update):
+    return update['integration_payload']['members']['entries']
+
+
+class GroupMembershipTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = self.directory.name
+        self.data = [
+            write_patient(root, 'p1'),
+            write_patient(root, 'p2', consent_state='rejected'),
+            write_patient(root, 'p3', consent_state='accepted',
+                          care_team_role='Psycho'),
+            write_patient(root, 'p4', care_team_role='Nurse'),
+        ]
+        self.rules = [
+            OptOutConsentRule(OPT_OUT_GROUP, 'A0001'),
+            CareTeamMemberRule(CARE_TEAM_GROUP, STAFF_KEY, 'Psycho'),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_desired_membership_matches_the_protocols(self):
+        desired, evaluated = desired_membership(
+            patient_directories(self.directory.name), self.rules)
+        self.assertEqual({'p1', 'p2', 'p3', 'p4'}, evaluated)
+
+        for path, group in (('patient_grouping.py', OPT_OUT_GROUP),
+                            ('patient_grouping_based_on_care_team.py',
+                             CARE_TEAM_GROUP)):
+            Protocol = load_protocol_class(PROTOCOLS / path)
+            members = set()
+            for data in self.data:
+                protocol = Protocol(patient=Patient(data))
+                protocol.compute_results()
+                for entry in group_entries(protocol.updates()[0]):
+                    if not entry.get('inactive'):
+                        members.add(entry['uuid'])
+            self.assertEqual(members, desired[group])
+
+    def test_workers_give_the_same_membership(self):
+        directories = patient_directories(self.directory.name)
+        self.assertEqual(desired_membership(directories, self.rules),
+                         desired_membership(directories, self.rules, workers=2))
+
+    def test_reconcile_emits_only_the_changes(self):
+        desired, evaluated = desired_membership(
+            patient_directories(self.directory.name), self.rules)
+        changes = reconcile(
+            desired, {
+                OPT_OUT_GROUP: ['p1', 'p2', 'p3', 'p4'],
+                CARE_TEAM_GROUP: ['p3', 'p4', 'not-evaluated'],
+            }, evaluated)
+        self.assertEqual(
+            {
+                OPT_OUT_GROUP: ([], ['p2']),
+                CARE_TEAM_GROUP: ([], ['p4']),
+            }, changes)
+        self.assertEqual({}, reconcile(desired, desired, evaluated))
+
+    def test_group_updates_are_batched(self):
+        updates = group_updates({OPT_OUT_GROUP: (['p1', 'p3', 'p4'], ['p2'])},
+                                batch_size=3)
+        self.assertEqual(2, len(updates))
+        self.assertEqual(
+            OPT_OUT_GROUP,
+            updates[0]['integration_payload']['externally_exposable_id'])
+        self.assertEqual([{
+            'uuid': 'p1'
+        }, {
+            'uuid': 'p3'
+        }, {
+            'uuid': 'p4'
+        }], group_entries(updates[0]))
+        self.assertEqual([{
+            'uuid': 'p2',
+            'inactive': True
+        }], group_entries(updates[1]))
+
+    def test_rules_from_config(self):
+        rules = rules_from_config([{
+            'type': 'opt_out_consent',
+            'group': OPT_OUT_GROUP,
+            'consent_code': 'A0001'
+        }])
+        self.assertIsInstance(rules[0], OptOutConsentRule)
+        with self.assertRaises(ValueError):
+            rules_from_config([{'type': 'unknown', 'group': OPT_OUT_GROUP}])
+
+    def test_rules_must_implement_is_member(self):
+
+        class Incomplete(MembershipRule):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(OPT_OUT_GROUP)
@@ -0,0 +1,104 @@
+import csv
+import json
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.utils import load_local_patient
+
+from canvas_workflow_helpers.loader import load_protocol_class
+from canvas_workflow_helpers.population import (gaps_by_hcc, hcc_index,
+                                                iter_hcc_gaps,
+                                                patient_directories,
+                                                write_gap_report)
+from canvas_workflow_helpers.synthetic import SyntheticPatientGenerator
+
+PROTOCOL = (Path(__file__).parent.parent /
+            'protocols/assessment_care_modeling/hcc_reassessment.py')
+
+
+class HCCGapsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.now = arrow.get('2023-01-01')
+        cls.directory = tempfile.TemporaryDirectory()
+        SyntheticPatientGenerator.from_size(
+            'small', seed=5, now=cls.now).write(cls.directory.name, 30)
+        cls.directories = patient_directories(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_matches_the_protocol(self):
+        Protocol = load_protocol_class(PROTOCOL)
+        expected = set()
+        for directory in self.directories:
+            patient = load_local_patient(directory)
+            protocol = Protocol(patient=patient, now=self.now)
+            if protocol.too_old_hccs and protocol.in_numerator():
+                expected |= {(patient.patient['key'], hcc['id'])
+                             for hcc in protocol.too_old_hccs}
+
+        rows = list(iter_hcc_gaps(self.directories, self.now))
+        self.assertTrue(expected)
+        self.assertEqual(expected,
+                         {(row['patient_key'], row['condition_id']) for row in rows})
+        self.assertTrue(all(row['days_overdue'] >= 0 for row in rows))
+
+    def test_reassessment_questionnaire_closes_the_gap(self):
+        rows = list(iter_hcc_gaps(self.directories, self.now))
+        patient_key = rows[0]['patient_key']
+        directory = next(d for d in self.directories
+                         if json.loads((d / 'patient.json').read_text())['key'] ==
+                         patient_key)
+
+        with tempfile.TemporaryDirectory() as root:
+            copy = Path(root) / directory.name
+            copy.mkdir()
+            for path in directory.glob('*.json'):
+                (copy / path.name).write_text(path.read_text())
+            interviews = json.loads((copy / 'interviews.json').read_text())
+            interviews.append({
+                'id': 1,
+                'noteTimestamp': self.now.shift(days=-1).isoformat(),
+                'created': self.now.shift(days=-1).isoformat(),
+                'results': [],
+                'questionnaires': [{
+                    'code': 'Patient Re-Assessment',
+                    'codeSystem': 'INTERNAL'
+                }],
+                'questions': [],
+                'responses': [],
+            })
+            (copy / 'interviews.json').write_text(json.dumps(interviews))
+            self.assertEqual([], list(iter_hcc_gaps([copy], self.now)))
+
+    def test_workers_give_the_same_rows(self):
+        self.assertEqual(list(iter_hcc_gaps(self.directories, self.now)),
+                         list(iter_hcc_gaps(self.directories, self.now, workers=2)))
+
+    def test_reports(self):
+        rows = list(iter_hcc_gaps(self.directories, self.now))
+        by_hcc = gaps_by_hcc(rows)
+        self.assertEqual(len(rows), sum(e['condition_count'] for e in by_hcc))
+        self.assertEqual(sorted(by_hcc, key=lambda e: -e['patient_count']), by_hcc)
+
+        with tempfile.TemporaryDirectory() as directory:
+            patients = Path(directory) / 'patients.csv'
+            hccs = Path(directory) / 'hccs.csv'
+            self.assertEqual(len(rows), write_gap_report(iter(rows), patients, hccs))
+            with patients.open() as fh:
+                self.assertEqual(len(rows), len(list(csv.DictReader(fh))))
+            with hccs.open() as fh:
+                self.assertEqual([e['hcc'] for e in by_hcc],
+                                 [e['hcc'] for e in csv.DictReader(fh)])
+
+    def test_hcc_index(self):
+        self.assertIs(hcc_index(), hcc_index())
+        self.assertEqual('Disorders of Immunity', hcc_index()['D816']['hcc'])
+        self.assertEqual(0.521, hcc_index()['D816']['raf'])
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+
+from unittest import TestCase
+
+from canvas_workflow_helpers.idempotency import (MemoryIdempotencyStore,
+                                                 SQLiteIdempotencyStore,
+                                                 fingerprint)
+from .base import FakeClock, fhir_response
+
+
+class FingerprintTest(TestCase):
+
+    def test_key_order_and_json_encoding_do_not_matter(self):
+        self.assertEqual(fingerprint({'a': 1, 'b': [1, 2]}),
+                         fingerprint(json.dumps({'b': [1, 2], 'a': 1})))
+        self.assertNotEqual(fingerprint({'a': 1}), fingerprint({'a': 2}))
+
+
+class IdempotencyStoreTests(object):
+
+    def store(self, **kwargs):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.clock = FakeClock(now=1000.0)
+        self.tested = self.store(default_ttl=60, clock=self.clock)
+
+    def test_claim_only_succeeds_once(self):
+        payload = {'patient': 'p1', 'event': 'serotonin syndrome'}
+
+        self.assertTrue(self.tested.claim('Monitor', 'p1', payload))
+        self.assertFalse(self.tested.claim('Monitor', 'p1', dict(payload)))
+        self.assertTrue(self.tested.claim('Monitor', 'p2', payload))
+        self.assertTrue(self.tested.claim('Other', 'p1', payload))
+
+    def test_claims_expire(self):
+        self.tested.claim('Monitor', 'p1', {})
+        self.clock.now += 61
+
+        self.assertTrue(self.tested.claim('Monitor', 'p1', {}))
+        self.assertFalse(self.tested.claim('Monitor', 'p1', {}))
+
+    def test_once_releases_the_claim_when_the_action_fails(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise ValueError('webhook down')
+
+        with self.assertRaises(ValueError):
+            self.tested.once('Monitor', 'p1', {}, fail)
+
+        self.assertEqual((True, 'sent'),
+                         self.tested.once('Monitor', 'p1', {}, lambda: 'sent'))
+        self.assertEqual((False, None),
+                         self.tested.once('Monitor', 'p1', {}, lambda: 'sent'))
+
+    def test_once_releases_the_claim_on_an_error_response(self):
+        ran, response = self.tested.once('Monitor', 'p1', {},
+                                         lambda: fhir_response(status_code=503))
+
+        self.assertTrue(ran)
+        self.assertEqual(503, response.status_code)
+        ran, response = self.tested.once('Monitor', 'p1', {}, fhir_response)
+        self.assertTrue(ran)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((False, None),
+                         self.tested.once('Monitor', 'p1', {}, fhir_response))
+
+    def test_purge_expired(self):
+        self.tested.claim('Monitor', 'p1', {}, ttl=10)
+        self.tested.claim('Monitor', 'p2', {}, ttl=100)
+        self.clock.now += 50
+
+        self.assertEqual(1, self.tested.purge_expired())
+
+
+class MemoryIdempotencyStoreTest(IdempotencyStoreTests, TestCase):
+
+    def store(self, **kwargs):
+        return MemoryIdempotencyStore(**kwargs)
+
+
+class SQLiteIdempotencyStoreTest(IdempotencyStoreTests, TestCase):
+
+    def store(self, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = SQLiteIdempotencyStore(
+            os.path.join(directory.name, 'idempotency.db'), **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_claims_are_shared_through_the_database_file(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'idempotency.db')
+
+        first = SQLiteIdempotencyStore(path, clock=self.clock)
+        second = SQLiteIdempotencyStore(path, clock=self.clock)
+
+        self.assertTrue(first.claim('NoShowHandler', 'p1', {'title': 'No show'}))
+        self.assertFalse(second.claim('NoShowHandler', 'p1', {'title': 'No show'}))
+        first.close()
+        second.close()
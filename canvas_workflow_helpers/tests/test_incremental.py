@@ -0,0 +1,193 @@
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure, ProtocolResult
+
+from canvas_workflow_helpers.incremental import (IncrementalFactsMixin,
+                                                 MemoryFactSnapshotStore,
+                                                 SQLiteFactSnapshotStore,
+                                                 depends_on_change, fact)
+
+CALLS = []
+NOW = arrow.get('2023-01-05T10:30:00+00:00')
+
+
+class VisitFacts(IncrementalFactsMixin, ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Visit facts'
+        version = '1.0.0'
+
+    fact_store = MemoryFactSnapshotStore()
+
+    @fact('condition')
+    def condition_count(self):
+        CALLS.append('condition_count')
+        return len(self.patient.conditions)
+
+    @fact('appointment.state')
+    def appointment_count(self):
+        CALLS.append('appointment_count')
+        return len(self.patient.appointments)
+
+    @fact('patient', max_age=60 * 60)
+    def evaluated_on(self):
+        CALLS.append('evaluated_on')
+        return self.now.format('YYYY-MM-DD HH')
+
+    def compute_results(self):
+        result = ProtocolResult()
+        result.add_narrative(
+            f'{self.condition_count()} {self.appointment_count()} '
+            f'{self.evaluated_on()}')
+        self.save_facts()
+        return result
+
+
+def patient():
+    return Patient({
+        'patient': {
+            'key': 'p1'
+        },
+        'conditions': [],
+        'appointments': [],
+    })
+
+
+def appointment_change(**fields):
+    return {
+        'model_name': 'appointment',
+        'created': False,
+        'fields': {name: [None, value] for name, value in fields.items()},
+    }
+
+
+class DependsOnChangeTest(TestCase):
+
+    def test_matching(self):
+        self.assertTrue(depends_on_change(('condition', ), None))
+        self.assertTrue(depends_on_change(('condition', ), {}))
+        self.assertFalse(
+            depends_on_change(('condition', ), appointment_change(state='CVD')))
+        self.assertTrue(
+            depends_on_change(('appointment.state', ),
+                              appointment_change(state='CVD')))
+        self.assertFalse(
+            depends_on_change(('appointment.state', ),
+                              appointment_change(note_id=3)))
+        self.assertTrue(
+            depends_on_change(('appointment.state', ), {
+                **appointment_change(note_id=3), 'created': True
+            }))
+        self.assertTrue(
+            depends_on_change(('*', ), appointment_change(note_id=3)))
+
+
+class IncrementalFactsTest(TestCase):
+
+    def setUp(self):
+        VisitFacts.fact_store = MemoryFactSnapshotStore()
+        CALLS.clear()
+
+    def evaluate(self, field_changes=None, now=NOW):
+        protocol = VisitFacts(patient=patient(), now=now)
+        protocol.field_changes = field_changes or {}
+        return protocol, protocol.compute_results()
+
+    def test_first_evaluation_computes_everything(self):
+        protocol, result = self.evaluate(appointment_change(note_id=3))
+
+        self.assertEqual('0 0 2023-01-05 10', result.narrative)
+        self.assertEqual({'condition_count', 'appointment_count', 'evaluated_on'},
+                         protocol.recomputed_facts)
+        self.assertEqual(set(), protocol.reused_facts)
+
+    def test_unrelated_change_reuses_the_snapshot(self):
+        self.evaluate()
+        CALLS.clear()
+
+        protocol, result = self.evaluate(appointment_change(note_id=3))
+        self.assertEqual('0 0 2023-01-05 10', result.narrative)
+        self.assertEqual([], CALLS)
+        self.assertEqual({'condition_count', 'appointment_count', 'evaluated_on'},
+                         protocol.reused_facts)
+
+        protocol, _ = self.evaluate(appointment_change(state='CVD'))
+        self.assertEqual(['appointment_count'], CALLS)
+        self.assertEqual({'condition_count', 'evaluated_on'},
+                         protocol.reused_facts)
+
+    def test_new_version_recomputes(self):
+        self.evaluate()
+        VisitFacts.fact_store.put('VisitFacts', 'p1', {
+            'version': '0.9.0',
+            'facts': {
+                'condition_count': 5,
+                'appointment_count': 5
+            }
+        })
+        CALLS.clear()
+
+        _, result = self.evaluate(appointment_change(note_id=3))
+        self.assertEqual('0 0 2023-01-05 10', result.narrative)
+        self.assertEqual(3, len(CALLS))
+
+    def test_time_relative_facts_expire(self):
+        self.evaluate()
+        CALLS.clear()
+
+        protocol, _ = self.evaluate({'model_name': 'condition', 'created': True},
+                                    now=NOW.shift(minutes=30))
+        self.assertEqual(['condition_count'], CALLS)
+        self.assertIn('evaluated_on', protocol.reused_facts)
+
+        CALLS.clear()
+        _, result = self.evaluate({'model_name': 'condition', 'created': True},
+                                  now=NOW.shift(hours=2))
+        self.assertEqual(['condition_count', 'evaluated_on'], CALLS)
+        self.assertEqual('0 0 2023-01-05 12', result.narrative)
+
+        # evaluating as of an earlier time does not reuse later facts
+        CALLS.clear()
+        self.evaluate({'model_name': 'condition', 'created': True},
+                      now=NOW.shift(hours=-3))
+        self.assertEqual(['condition_count', 'evaluated_on'], CALLS)
+
+    def test_reuse_does_not_refresh_the_age_of_a_fact(self):
+        self.evaluate()
+
+        # every evaluation is less than max_age after the previous one
+        recomputed = []
+        for minutes in (40, 80, 100, 130):
+            CALLS.clear()
+            protocol, result = self.evaluate(appointment_change(note_id=3),
+                                             now=NOW.shift(minutes=minutes))
+            recomputed.append(CALLS[:])
+
+        self.assertEqual([[], ['evaluated_on'], [], []], recomputed)
+        self.assertEqual('0 0 2023-01-05 11', result.narrative)
+        self.assertEqual({'condition_count', 'appointment_count', 'evaluated_on'},
+                         protocol.reused_facts)
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'facts.db')
+            store = SQLiteFactSnapshotStore(path)
+            self.assertIsNone(store.get('VisitFacts', 'p1'))
+            store.put('VisitFacts', 'p1', {'version': '1', 'facts': {'a': 1}})
+            store.put('VisitFacts', 'p1', {'version': '1', 'facts': {'a': 2}})
+            store.close()
+
+            store = SQLiteFactSnapshotStore(path)
+            self.assertEqual({
+                'version': '1',
+                'facts': {
+                    'a': 2
+                }
+            }, store.get('VisitFacts', 'p1'))
+            store.close()
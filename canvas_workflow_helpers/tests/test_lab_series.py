@@ -0,0 +1,246 @@
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.timeframe import Timeframe
+from canvas_workflow_kit.value_set.value_set import ValueSet
+
+from canvas_workflow_helpers.benchmarks import synthetic_patient
+from canvas_workflow_helpers.indexes import (LabResultClassifier,
+                                             parse_reference_range, parse_value)
+from canvas_workflow_helpers.value_sets.v2021 import (Hba1CLaboratoryTest,
+                                                      LdlCholesterol)
+
+LOINC = 'http://loinc.org'
+
+
+class GlucoseTest(ValueSet):
+    VALUE_SET_NAME = 'Glucose [Mass/volume] in Serum or Plasma'
+    LOINC = {'2345-7'}
+
+
+def lab(id, code, date, value, units='%', reference='4.0-5.6'):
+    return {
+        'id': id,
+        'originalDate': date,
+        'loincCodes': [{
+            'code': code,
+            'name': 'lab'
+        }],
+        'value': value,
+        'units': units,
+        'referenceRange': reference,
+    }
+
+
+class ParsingTest(TestCase):
+
+    def test_parse_value(self):
+        self.assertEqual(6.5, parse_value('6.5'))
+        self.assertEqual(6.5, parse_value(' 6.5% '))
+        self.assertEqual(1200.0, parse_value('1,200'))
+        self.assertEqual(7.0, parse_value(7))
+        for value in ('>15', 'see note', '', None, 'nan', True):
+            self.assertIsNone(parse_value(value))
+
+    def test_parse_reference_range(self):
+        self.assertEqual((4.0, 5.6), parse_reference_range('4.0-5.6'))
+        self.assertEqual((0.0, 99.0), parse_reference_range('0 to 99'))
+        self.assertEqual((None, 100.0), parse_reference_range('<100'))
+        self.assertEqual((60.0, None), parse_reference_range('>=60'))
+        self.assertEqual((None, None), parse_reference_range('negative'))
+
+
+class LabResultIndexTest(TestCase):
+
+    def setUp(self):
+        a1c = sorted(Hba1CLaboratoryTest.LOINC)[0]
+        ldl = sorted(LdlCholesterol.LOINC)[0]
+        self.patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'labReports': [
+                lab(1, a1c, '2022-01-01', '7.5'),
+                lab(2, a1c, '2022-02-01', '>15'),
+                lab(3, a1c, '2022-03-01', '58', units='mmol/mol',
+                    reference='20-38'),
+                lab(4, a1c, '2022-04-01', '6.1', units='mg/dL'),
+                lab(5, ldl, '2022-02-15', '1.3', units='g/L', reference='<1'),
+                lab(6, ldl, '2022-03-15', '90', units='MG/DL', reference='<100'),
+            ],
+        })
+        self.classifier = LabResultClassifier(
+            {
+                'a1c': Hba1CLaboratoryTest,
+                'ldl': LdlCholesterol
+            },
+            units={
+                'a1c': '%',
+                'ldl': 'mg/dL'
+            })
+        self.labs = self.classifier.for_patient(self.patient)
+
+    def test_series_are_typed_and_converted(self):
+        self.assertIs(self.labs, self.classifier.for_patient(self.patient))
+        a1c = self.labs.series('a1c')
+        self.assertEqual(2, len(a1c))
+        self.assertEqual(7.5, a1c.values[0])
+        self.assertAlmostEqual(7.46, a1c.last_value(), places=2)
+        self.assertEqual(arrow.get('2022-03-01'), a1c.last_date())
+        self.assertEqual(['%', '%'], a1c.units)
+        self.assertEqual([130.0, 90.0], list(self.labs.series('ldl').values))
+        self.assertIsNone(self.labs.last_value('unknown'))
+
+    def test_unparseable_values_are_reported(self):
+        self.assertEqual({'a1c': [(2, 'value'), (4, 'unit')]}, {
+            name: [(report['id'], reason) for report, reason in reports]
+            for name, reports in self.labs.unparseable().items()
+        })
+
+    def test_thresholds(self):
+        a1c = self.labs.series('a1c')
+        self.assertEqual(1, a1c.count(at_least=7.5))
+        self.assertEqual(2, a1c.count(above=7))
+        self.assertEqual(
+            1,
+            a1c.count(Timeframe(arrow.get('2022-02-01'), arrow.get('2022-12-31')),
+                      above=7))
+        self.assertEqual([3],
+                         [r['id'] for r in a1c.matching(below=7.5).records])
+        self.assertEqual([0, 1], a1c.out_of_range())
+        self.assertEqual([0], self.labs.series('ldl').out_of_range())
+
+    def test_series_are_ordered_by_instant(self):
+        a1c = sorted(Hba1CLaboratoryTest.LOINC)[0]
+        patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'labReports': [
+                lab(1, a1c, '2022-01-05T23:00:00-05:00', '8.0'),
+                lab(2, a1c, '2022-01-06T02:00:00+00:00', '7.0'),
+                lab(3, a1c, 'not a date', '7.0'),
+            ],
+        })
+        series = LabResultClassifier({
+            'a1c': Hba1CLaboratoryTest
+        }).for_patient(patient).series('a1c')
+
+        self.assertEqual([7.0, 8.0], list(series.values))
+        self.assertEqual(8.0, series.last_value())
+        self.assertEqual([(3, 'date')],
+                         [(r['id'], reason) for r, reason in series.unparseable])
+
+    def test_series_without_a_unit_keep_the_first_one(self):
+        ldl = sorted(LdlCholesterol.LOINC)[0]
+        patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'labReports': [
+                lab(1, ldl, '2022-01-01', '95', units='mg/dL'),
+                lab(2, ldl, '2022-02-01', '1.2', units='g/L'),
+                lab(3, ldl, '2022-03-01', '2.5', units='mmol/L'),
+            ],
+        })
+        series = LabResultClassifier({
+            'ldl': LdlCholesterol
+        }).for_patient(patient).series('ldl')
+
+        self.assertEqual('mg/dL', series.unit)
+        self.assertEqual([95.0, 120.0], list(series.values))
+        self.assertEqual([(3, 'unit')],
+                         [(r['id'], reason) for r, reason in series.unparseable])
+
+    def test_conversions_work_both_ways(self):
+        ldl = sorted(LdlCholesterol.LOINC)[0]
+        patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'labReports': [
+                lab(1, ldl, '2022-01-01', '1.2', units='g/L'),
+                lab(2, ldl, '2022-02-01', '95', units='mg/dL',
+                    reference='<100'),
+            ],
+        })
+        series = LabResultClassifier({
+            'ldl': LdlCholesterol
+        }).for_patient(patient).series('ldl')
+
+        self.assertEqual('g/L', series.unit)
+        self.assertEqual(1.2, series.values[0])
+        self.assertAlmostEqual(0.95, series.values[1])
+        self.assertAlmostEqual(1.0, series.reference_ranges[1][1])
+        self.assertEqual([], series.unparseable)
+
+    def test_glucose_in_mmol_per_liter(self):
+        glucose = '2345-7'
+        patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'labReports': [
+                lab(1, glucose, '2022-01-01', '3.0', units='mmol/l',
+                    reference='3.9-5.6'),
+                lab(2, glucose, '2022-01-02', '54', units='mg/dL'),
+            ],
+        })
+        series = LabResultClassifier({
+            'glucose': GlucoseTest
+        }, units={
+            'glucose': 'mg/dL'
+        }).for_patient(patient).series('glucose')
+
+        self.assertAlmostEqual(54.05, series.values[0], places=2)
+        self.assertEqual(2, series.count(at_most=55))
+        self.assertEqual([0, 1], series.out_of_range())
+
+    def test_matches_the_recordset(self):
+        patient = synthetic_patient('small')
+        labs = LabResultClassifier({'a1c': Hba1CLaboratoryTest}).for_patient(patient)
+        reports = patient.lab_reports.find(Hba1CLaboratoryTest)
+        a1c = labs.series('a1c')
+
+        self.assertEqual(len(reports), len(a1c) + len(a1c.unparseable))
+        expected = [float(r['value']) for r in reports.records
+                    if parse_value(r['value']) is not None]
+        self.assertEqual(expected, list(a1c.values))
+        self.assertEqual(
+            len([v for v in expected if v <= 6]), a1c.count(at_most=6))
+
+    def test_threshold_queries_match_a_scan(self):
+        patient = synthetic_patient('large')
+        a1c = LabResultClassifier({
+            'a1c': Hba1CLaboratoryTest
+        }).for_patient(patient).series('a1c')
+        middle = arrow.get(a1c.timestamps[len(a1c) // 2])
+        timeframes = [
+            None,
+            Timeframe(middle, arrow.get(a1c.timestamps[-1])),
+            Timeframe(middle.shift(years=-100), middle.shift(years=-99)),
+        ]
+        bounds = [{}, {
+            'at_most': 6.5
+        }, {
+            'at_least': 6.5,
+            'below': 9
+        }, {
+            'above': 7,
+            'at_most': 7
+        }]
+
+        for timeframe in timeframes:
+            start, end = a1c._span(timeframe)
+            for bound in bounds:
+                expected = [
+                    p for p in range(start, end)
+                    if bound.get('at_most', 1e9) >= a1c.values[p] >= bound.get(
+                        'at_least', -1e9) and bound.get('below', 1e9) >
+                    a1c.values[p] > bound.get('above', -1e9)
+                ]
+                self.assertEqual(expected,
+                                 list(a1c.positions(timeframe, **bound)))
+                self.assertEqual(len(expected), a1c.count(timeframe, **bound))
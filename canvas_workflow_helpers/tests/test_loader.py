@@ -0,0 +1,75 @@
+import os
+import stat
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+from canvas_workflow_helpers.loader import ProtocolClassCache, source_hash
+
+SOURCE = '''
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure
+
+
+class Example(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Example'
+'''
+
+
+class ProtocolClassCacheTest(TestCase):
+
+    def test_class_is_reused_within_a_process(self):
+        cache = ProtocolClassCache(cache_dir=None)
+
+        first = cache.load(SOURCE)
+        self.assertEqual('Example', first.__name__)
+        self.assertIs(first, cache.load(SOURCE))
+        self.assertEqual((1, 1), (cache.compiles, cache.hits))
+
+        changed = cache.load(SOURCE + '\n# changed\n')
+        self.assertIsNot(first, changed)
+        self.assertEqual(2, cache.compiles)
+
+    def test_bytecode_is_shared_through_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ProtocolClassCache(directory).load(SOURCE)
+            self.assertTrue(
+                (Path(directory) / f'{source_hash(SOURCE)}.bytecode').exists())
+
+            other = ProtocolClassCache(directory)
+            self.assertEqual('Example', other.load(SOURCE).__name__)
+            self.assertEqual((0, 1), (other.compiles, other.disk_hits))
+
+    def test_corrupt_bytecode_is_recompiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            (Path(directory) /
+             f'{source_hash(SOURCE)}.bytecode').write_bytes(b'garbage')
+            cache = ProtocolClassCache(directory)
+
+            self.assertEqual('Example', cache.load(SOURCE).__name__)
+            self.assertEqual(1, cache.compiles)
+
+    def test_disk_cache_is_opt_in(self):
+        self.assertIsNone(ProtocolClassCache().cache_dir)
+
+    def test_only_private_directories_are_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            created = Path(directory) / 'bytecode'
+            cache = ProtocolClassCache(created)
+            self.assertEqual(created, cache.cache_dir)
+            self.assertEqual(0o700, stat.S_IMODE(created.stat().st_mode))
+
+            os.chmod(created, 0o777)
+            cache = ProtocolClassCache(created)
+            self.assertIsNone(cache.cache_dir)
+            cache.load(SOURCE)
+            self.assertEqual([], list(created.iterdir()))
+
+    def test_requires_exactly_one_protocol(self):
+        cache = ProtocolClassCache(cache_dir=None)
+        with self.assertRaises(SyntaxError):
+            cache.load('x = 1')
+        with self.assertRaises(SyntaxError):
+            cache.load(SOURCE + SOURCE.replace('Example', 'Other'))
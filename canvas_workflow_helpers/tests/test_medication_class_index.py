@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+import arrow
+
+from canvas_workflow_kit.patient import Patient
+
+from canvas_workflow_helpers.indexes import MedicationClassifier
+from canvas_workflow_helpers.value_sets.v2021 import (
+    AdultDepressionMedications, BetaBlockerTherapy, HighIntensityStatinTherapy)
+
+RXNORM = 'http://www.nlm.nih.gov/research/umls/rxnorm'
+FDB = 'http://www.fdbhealth.com/'
+
+
+def medication(id, code, status, start, end=None, system=RXNORM):
+    return {
+        'id': id,
+        'status': status,
+        'coding': [{
+            'system': system,
+            'code': code
+        }],
+        'periods': [{
+            'from': start,
+            'to': end
+        }],
+    }
+
+
+class MedicationClassifierTest(TestCase):
+
+    def setUp(self):
+        self.statin = sorted(HighIntensityStatinTherapy.RXNORM)[0]
+        self.beta_blocker = sorted(BetaBlockerTherapy.RXNORM)[0]
+        self.patient = Patient({
+            'patient': {
+                'key': 'p1'
+            },
+            'medications': [
+                medication(1, self.statin, 'active', '2021-03-01'),
+                medication(2, self.beta_blocker, 'inactive', '2019-01-01',
+                           '2019-06-30'),
+                medication(3, self.beta_blocker, 'inactive', '2020-01-01',
+                           '2020-02-01'),
+                medication(4, '123', 'active', '2022-01-01', system=FDB),
+            ],
+        })
+        self.classifier = MedicationClassifier({
+            'statin': HighIntensityStatinTherapy,
+            'beta_blocker': BetaBlockerTherapy,
+            'antidepressant': AdultDepressionMedications,
+        })
+
+    def test_index_is_built_once_per_patient(self):
+        index = self.classifier.for_patient(self.patient)
+        self.assertIs(index, self.classifier.for_patient(self.patient))
+
+        self.classifier.discard(self.patient)
+        self.assertIsNot(index, self.classifier.for_patient(self.patient))
+
+    def test_matches_find_and_filter(self):
+        index = self.classifier.for_patient(self.patient)
+        medications = self.patient.medications
+
+        for name, value_set in self.classifier.classes.items():
+            self.assertEqual(
+                medications.find(value_set).records,
+                index.medications(name).records)
+            self.assertEqual(
+                medications.find(value_set).filter(status='active').records,
+                index.medications(name, active_only=True).records)
+
+        self.assertTrue(index.has('statin'))
+        self.assertFalse(index.has('beta_blocker'))
+        self.assertTrue(index.has('beta_blocker', active_only=False))
+        self.assertFalse(index.has('antidepressant', active_only=False))
+        self.assertEqual({'statin'},
+                         index.classes_of(medications.records[0]))
+        self.assertEqual(set(), index.classes_of(medications.records[3]))
+
+    def test_start_and_end_dates(self):
+        index = self.classifier.for_patient(self.patient)
+
+        self.assertEqual(arrow.get('2019-01-01'), index.start('beta_blocker'))
+        self.assertEqual(arrow.get('2020-02-01'), index.end('beta_blocker'))
+        self.assertEqual(arrow.get('2021-03-01'), index.start('statin'))
+        self.assertIsNone(index.end('statin'))
+        self.assertIsNone(index.start('antidepressant'))
+        self.assertEqual(2, len(index.periods('beta_blocker')))
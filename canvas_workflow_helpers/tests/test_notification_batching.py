@@ -0,0 +1,133 @@
+import json
+
+from unittest import TestCase
+
+import requests
+
+from canvas_workflow_helpers.notifications import (BatchingNotificationSender,
+                                                   decode_batch)
+from .base import fhir_response
+
+URL = 'https://example.com/hook'
+HEADERS = {'Content-Type': 'application/json'}
+
+
+class BatchingNotificationSenderTest(TestCase):
+
+    def sender(self, statuses=None, **kwargs):
+        self.posts = []
+        statuses = list(statuses or [])
+
+        def post(url, data, headers, timeout):
+            self.posts.append((url, data, headers))
+            status = statuses.pop(0) if statuses else 200
+            if status is None:
+                raise requests.ConnectionError('refused')
+            if isinstance(status, Exception):
+                raise status
+            return fhir_response(status_code=status)
+
+        sender = BatchingNotificationSender(post=post, backoff=0, **kwargs)
+        self.addCleanup(sender.close)
+        return sender
+
+    def test_payloads_are_batched_per_url_as_gzipped_ndjson(self):
+        sender = self.sender(max_wait=60)
+        for index in range(3):
+            sender.send(URL, json.dumps({'patient': 'p1', 'index': index}),
+                        HEADERS)
+        sender.send('https://other.com', json.dumps({'patient': 'p2'}),
+                    HEADERS)
+        sender.flush()
+
+        self.assertEqual(2, len(self.posts))
+        url, body, headers = self.posts[0]
+        self.assertEqual(URL, url)
+        self.assertEqual('gzip', headers['Content-Encoding'])
+        self.assertEqual('application/x-ndjson', headers['Content-Type'])
+        self.assertEqual([0, 1, 2], [p['index'] for p in decode_batch(body)])
+        self.assertEqual(4, sender.payloads_sent)
+
+    def test_full_batch_is_sent_without_waiting(self):
+        sender = self.sender(max_batch_size=2, max_wait=60)
+        for index in range(5):
+            sender.send(URL, {'index': index})
+        sender.flush()
+
+        self.assertEqual([[0, 1], [2, 3], [4]], [[
+            p['index'] for p in decode_batch(body)
+        ] for _, body, _ in self.posts])
+
+    def test_time_window_closes_batches(self):
+        sender = self.sender(max_wait=0.05)
+        sender.send(URL, {'index': 0})
+
+        for _ in range(200):
+            if self.posts:
+                break
+            sender._thread.join(0.01)
+        self.assertEqual(1, len(self.posts))
+
+    def test_uncompressed_mode(self):
+        sender = self.sender(compress=False, max_wait=60)
+        sender.send(URL, {'a': 1})
+        sender.flush()
+
+        _, body, headers = self.posts[0]
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual([{'a': 1}], decode_batch(body, compressed=False))
+
+    def test_different_auth_headers_are_not_mixed(self):
+        sender = self.sender(max_wait=60)
+        sender.send(URL, {}, {'Authorization': 'a'})
+        sender.send(URL, {}, {'Authorization': 'b'})
+        sender.flush()
+
+        self.assertEqual(['a', 'b'],
+                         [headers['Authorization'] for _, _, headers in self.posts])
+
+    def test_failed_batches_are_kept(self):
+        sender = self.sender([500, 500], max_wait=60, max_retries=1)
+        sender.send(URL, {'a': 1})
+        sender.flush()
+
+        self.assertEqual(2, len(self.posts))
+        self.assertEqual(1, len(sender.failed_batches))
+        self.assertEqual(0, sender.batches_sent)
+
+    def test_client_errors_are_not_retried(self):
+        sender = self.sender([400], max_wait=60)
+        sender.send(URL, {'a': 1})
+        sender.flush()
+
+        self.assertEqual(1, len(self.posts))
+        self.assertEqual(1, len(sender.failed_batches))
+
+    def test_unexpected_errors_fail_the_batch_and_keep_sending(self):
+        sender = self.sender([TypeError('bad body')],
+                             max_batch_size=1,
+                             max_wait=60)
+        sender.send(URL, {'index': 0})
+        sender.send(URL, {'index': 1})
+        sender.flush()
+
+        self.assertEqual(2, len(self.posts))
+        [(batch, error)] = sender.failed_batches
+        self.assertEqual([{'index': 0}], decode_batch(batch.body(True)))
+        self.assertIsInstance(error, TypeError)
+        self.assertEqual(1, sender.batches_sent)
+        self.assertTrue(sender._thread.is_alive())
+
+    def test_failed_batch_is_retried_before_later_batches(self):
+        sender = self.sender([None, 503], max_batch_size=1, max_wait=60)
+        sender.send(URL, {'patient': 'p1', 'index': 0})
+        sender.send(URL, {'patient': 'p1', 'index': 1})
+        sender.flush()
+
+        self.assertEqual([0, 0, 0, 1], [
+            payload['index'] for _, body, _ in self.posts
+            for payload in decode_batch(body)
+        ])
+        self.assertEqual(2, sender.retries)
+        self.assertEqual([], sender.failed_batches)
+        self.assertEqual(2, sender.batches_sent)
@@ -0,0 +1,142 @@
+import threading
+
+from unittest import TestCase
+
+import requests
+
+from canvas_workflow_helpers.notifications import NotificationDispatcher
+from .base import fhir_response
+
+
+class FakeSession(object):
+    """
+    Answers posts from `statuses` in order; None raises a ConnectionError,
+    an exception is raised as is.
+    """
+
+    def __init__(self, statuses, posts, gate=None):
+        self.statuses = statuses
+        self.posts = posts
+        self.gate = gate
+
+    def post(self, url, data, headers, timeout):
+        if self.gate:
+            self.gate.wait(5)
+        self.posts.append((url, data, headers))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise requests.ConnectionError('refused')
+        if isinstance(status, Exception):
+            raise status
+        return fhir_response(status_code=status)
+
+    def close(self):
+        pass
+
+
+class NotificationDispatcherTest(TestCase):
+
+    def dispatcher(self, statuses=None, gate=None, **kwargs):
+        self.posts = []
+        self.sessions = 0
+
+        def session_factory():
+            self.sessions += 1
+            return FakeSession(statuses if statuses is not None else [],
+                               self.posts, gate)
+
+        dispatcher = NotificationDispatcher(session_factory=session_factory,
+                                            backoff=0,
+                                            **kwargs)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    def test_send_queues_and_delivers_in_the_background(self):
+        gate = threading.Event()
+        dispatcher = self.dispatcher(gate=gate, workers=1)
+
+        self.assertTrue(
+            dispatcher.send('https://example.com', '{"a": 1}',
+                            {'Content-Type': 'application/json'}))
+        self.assertEqual([], self.posts)
+
+        gate.set()
+        dispatcher.flush()
+        self.assertEqual([('https://example.com', '{"a": 1}', {
+            'Content-Type': 'application/json'
+        })], self.posts)
+        self.assertEqual(1, dispatcher.stats.delivered)
+
+    def test_each_worker_keeps_one_session(self):
+        dispatcher = self.dispatcher(workers=2)
+        for _ in range(10):
+            dispatcher.send('https://example.com')
+        dispatcher.flush()
+
+        self.assertEqual(2, self.sessions)
+        self.assertEqual(10, dispatcher.stats.delivered)
+
+    def test_retries_connection_errors_and_retryable_statuses(self):
+        dispatcher = self.dispatcher([None, 503, 200], workers=1)
+        dispatcher.send('https://example.com')
+        dispatcher.flush()
+
+        self.assertEqual(3, len(self.posts))
+        self.assertEqual(2, dispatcher.stats.retries)
+        self.assertEqual(1, dispatcher.stats.delivered)
+
+    def test_gives_up_after_max_retries(self):
+        failures = []
+        dispatcher = self.dispatcher([500, 500, 500],
+                                     workers=1,
+                                     max_retries=2,
+                                     on_failure=failures.append)
+        dispatcher.send('https://example.com')
+        dispatcher.flush()
+
+        self.assertEqual(1, dispatcher.stats.failed)
+        self.assertEqual(3, failures[0].attempts)
+
+    def test_client_errors_are_not_retried(self):
+        dispatcher = self.dispatcher([400], workers=1)
+        dispatcher.send('https://example.com')
+        dispatcher.flush()
+
+        self.assertEqual(1, len(self.posts))
+        self.assertEqual(1, dispatcher.stats.failed)
+
+    def test_full_queue_rejects_notifications(self):
+        gate = threading.Event()
+        dispatcher = self.dispatcher(gate=gate, workers=1, max_queue_size=2)
+
+        results = [dispatcher.send('https://example.com') for _ in range(5)]
+        gate.set()
+        dispatcher.flush()
+
+        # one notification is held by the worker, two wait in the queue
+        self.assertLessEqual(2, results.count(True))
+        self.assertEqual(results.count(False), dispatcher.stats.rejected)
+        self.assertEqual(2, dispatcher.stats.max_queue_depth)
+
+    def test_errors_outside_delivery_do_not_stop_the_worker(self):
+
+        def on_failure(notification):
+            raise ValueError('callback failed')
+
+        dispatcher = self.dispatcher([400, TypeError('bad payload'), 200],
+                                     workers=1,
+                                     on_failure=on_failure)
+        for _ in range(3):
+            dispatcher.send('https://example.com')
+        dispatcher.flush()
+
+        self.assertEqual(3, len(self.posts))
+        self.assertEqual(2, dispatcher.stats.failed)
+        self.assertEqual(1, dispatcher.stats.delivered)
+
+    def test_send_after_close_raises(self):
+        dispatcher = self.dispatcher(workers=1)
+        dispatcher.close()
+
+        with self.assertRaises(RuntimeError):
+            dispatcher.send('https://example.com')
@@ -0,0 +1,146 @@
+import threading
+import time
+
+from unittest import TestCase
+
+from canvas_workflow_kit.internal.integration_messages import \
+    create_task_payload
+from canvas_workflow_kit.patient import Patient
+
+from canvas_workflow_helpers.indexes import OpenTaskIndex
+
+
+def patient_with_tasks():
+    return Patient({
+        'patient': {
+            'key': 'p1',
+            'careTeamMemberships': [{
+                'staff': {
+                    'key': 'lw1',
+                    'firstName': 'Larry',
+                    'lastName': 'Weed'
+                },
+                'role': {
+                    'code': 'PCP'
+                }
+            }],
+        },
+        'tasks': [{
+            'id': 1,
+            'externallyExposableId': 'e1',
+            'title': 'Review New Intake',
+            'status': 'OPEN',
+            'assignee': 'Larry Weed',
+            'labels': ['Cove'],
+        }, {
+            'id': 2,
+            'externallyExposableId': 'e2',
+            'title': 'Review New Intake',
+            'status': 'COMPLETED',
+            'assignee': '',
+            'labels': [],
+        }],
+    })
+
+
+class OpenTaskIndexTest(TestCase):
+
+    def setUp(self):
+        self.patient = patient_with_tasks()
+        self.tasks = OpenTaskIndex.for_patient(self.patient)
+
+    def test_index_is_built_once_per_patient(self):
+        self.assertIs(self.tasks, OpenTaskIndex.for_patient(self.patient))
+        self.assertIsNot(self.tasks,
+                         OpenTaskIndex.for_patient(patient_with_tasks()))
+
+    def test_exists_by_title_label_assignee_and_status(self):
+        self.assertTrue(self.tasks.exists('Review New Intake'))
+        self.assertTrue(self.tasks.exists('Review New Intake', label='Cove'))
+        self.assertFalse(self.tasks.exists('Review New Intake', label='Urgent'))
+        self.assertFalse(
+            self.tasks.exists('Review New Intake', assignee='Someone Else'))
+        self.assertTrue(self.tasks.exists('Review New Intake', 'COMPLETED'))
+        self.assertFalse(self.tasks.exists('New treatment follow up'))
+
+    def test_record_update_moves_the_task(self):
+        self.tasks.record_update('e1', status='COMPLETED')
+
+        self.assertFalse(self.tasks.exists('Review New Intake'))
+        self.assertEqual(2, len(self.tasks.find('Review New Intake',
+                                                'COMPLETED')))
+        self.assertIsNone(self.tasks.record_update('unknown', status='OPEN'))
+
+    def test_upsert_creates_only_missing_tasks(self):
+        created = []
+        payload = create_task_payload(patient_key='p1',
+                                      created_by_key='bot',
+                                      title='Patient has social needs',
+                                      labels=['Social'])
+
+        self.assertTrue(self.tasks.upsert(payload, created.append))
+        self.assertFalse(self.tasks.upsert(payload, created.append))
+        self.assertEqual([payload], created)
+        self.assertTrue(
+            self.tasks.exists('Patient has social needs', label='Social'))
+
+    def test_fhir_task_creates_are_recorded(self):
+        self.tasks.record_create({
+            'resourceType': 'Task',
+            'status': 'requested',
+            'description': 'New treatment follow up in one month',
+            'owner': {
+                'reference': 'Practitioner/abc'
+            },
+            'input': [{
+                'type': {
+                    'text': 'label'
+                },
+                'valueString': 'Cove'
+            }],
+        })
+
+        self.assertTrue(
+            self.tasks.exists('New treatment follow up in one month',
+                              label='Cove',
+                              assignee='Practitioner/abc'))
+        self.assertTrue(
+            self.tasks.exists('New treatment follow up in one month',
+                              assignee='abc'))
+
+    def test_assignees_are_compared_by_staff_key(self):
+        for assignee in ('lw1', 'Practitioner/lw1', 'Larry Weed'):
+            self.assertTrue(
+                self.tasks.exists('Review New Intake', assignee=assignee))
+
+        payload = create_task_payload(patient_key='p1',
+                                      created_by_key='bot',
+                                      title='Call patient',
+                                      assignee_identifier='ab2')
+        self.tasks.record_create(payload)
+        self.assertTrue(self.tasks.exists('Call patient', assignee='ab2'))
+        self.assertFalse(self.tasks.exists('Call patient', assignee='Ann Bo'))
+
+        self.tasks.register_staff({'Ann Bo': 'ab2'})
+        self.assertTrue(self.tasks.exists('Call patient', assignee='Ann Bo'))
+
+    def test_concurrent_upserts_create_once(self):
+        created = []
+
+        def create(payload):
+            time.sleep(0.01)
+            created.append(payload)
+
+        payload = create_task_payload(patient_key='p1',
+                                      created_by_key='bot',
+                                      title='Patient has social needs')
+        threads = [
+            threading.Thread(target=self.tasks.upsert, args=(payload, create))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([payload], created)
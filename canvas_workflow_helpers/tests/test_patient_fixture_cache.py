@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+from .base import PatientFixtureCache, WorkflowHelpersBaseTest
+
+
+class PatientFixtureCacheTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.patient_path = Path(self.directory.name) / 'patient_1'
+        self.patient_path.mkdir()
+        self.write('patient', {'key': 'p1', 'firstName': 'Ada'})
+        self.write('conditions', [])
+        self.cache = PatientFixtureCache()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, field, content, mtime_ns=None):
+        path = self.patient_path / f'{field}.json'
+        path.write_text(json.dumps(content))
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_parses_once_and_hands_out_copies(self):
+        first = self.cache.patient(self.patient_path)
+        first.patient['firstName'] = 'Changed'
+        second = self.cache.patient(self.patient_path)
+
+        self.assertEqual(1, self.cache.parses)
+        self.assertEqual('Ada', second.patient['firstName'])
+        self.assertIsNot(first.patient, second.patient)
+
+    def test_changed_file_is_parsed_again(self):
+        self.cache.data(self.patient_path)
+        self.write('patient', {'key': 'p1', 'firstName': 'Grace'}, mtime_ns=1)
+
+        self.assertEqual('Grace',
+                         self.cache.data(self.patient_path)['patient']
+                         ['firstName'])
+        self.assertEqual(2, self.cache.parses)
+
+    def test_disk_cache_is_shared(self):
+        with tempfile.TemporaryDirectory() as disk_dir:
+            PatientFixtureCache(disk_dir).data(self.patient_path)
+            other = PatientFixtureCache(disk_dir)
+
+            self.assertEqual('Ada',
+                             other.patient(self.patient_path).patient
+                             ['firstName'])
+            self.assertEqual(0, other.parses)
+
+    def test_shared_disk_directory_is_not_used(self):
+        with tempfile.TemporaryDirectory() as parent:
+            disk_dir = Path(parent) / 'fixtures'
+            disk_dir.mkdir()
+            os.chmod(disk_dir, 0o777)
+            cache = PatientFixtureCache(str(disk_dir))
+            cache.data(self.patient_path)
+
+            self.assertIsNone(cache.disk_dir)
+            self.assertEqual([], list(disk_dir.iterdir()))
+
+    def test_empty_directory(self):
+        with tempfile.TemporaryDirectory() as empty:
+            self.assertEqual({}, self.cache.data(empty))
+            with self.assertRaises(FileNotFoundError):
+                self.cache.patient(empty)
+
+
+class WorkflowHelpersBaseTestLoadTest(WorkflowHelpersBaseTest):
+
+    def test_load_patient_and_data(self):
+        patient = self.load_patient('full_detailed_patient')
+        patient.patient['firstName'] = 'Changed'
+
+        self.assertEqual('full_detailed_patient', patient.patient['key'])
+        self.assertNotEqual(
+            'Changed',
+            self.load_patient('full_detailed_patient').patient['firstName'])
+        self.assertEqual(
+            self.load_patient_data('full_detailed_patient',
+                                   'patient')['firstName'],
+            self.load_patient('full_detailed_patient').patient['firstName'])
+        self.assertEqual([],
+                         self.load_patient_data('full_detailed_patient',
+                                                'not_a_field'))
@@ -1,6 +1,6 @@
 from pathlib import Path
 
-from canvas_workflow_kit.utils import parse_class_from_python_source
+from canvas_workflow_helpers.loader import load_protocol_class
 from .base import WorkflowHelpersBaseTest
 from canvas_workflow_kit import events
 from canvas_workflow_kit.constants import CHANGE_TYPE
@@ -34,7 +34,7 @@ class PrescribeButtonTest(WorkflowHelpersBaseTest):
         ).parent.parent / 'protocols/prescribe_command_recommendation.py'
         template = template_path.open('r').read()
 
-        return parse_class_from_python_source(template)
+        return load_protocol_class(template)
 
     def test_fields(self):
         Protocol = self.in_numerator_class
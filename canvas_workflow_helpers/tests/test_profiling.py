@@ -0,0 +1,123 @@
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+import requests
+
+from canvas_workflow_kit.patient_recordset import PatientRecordSet
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure, ProtocolResult
+
+from canvas_workflow_helpers.benchmarks import synthetic_patient
+from canvas_workflow_helpers.profiling import (Profiler,
+                                               ProfiledProtocolMixin,
+                                               active_profiler,
+                                               profile_evaluation, profiled,
+                                               request_span_name)
+from canvas_workflow_helpers.value_sets.v2021 import Hba1CLaboratoryTest
+from .base import FakeClock
+
+
+class A1cProtocol(ProfiledProtocolMixin, ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'A1c'
+        version = '1.0.0'
+
+    def in_denominator(self):
+        return bool(self.patient.lab_reports.find(Hba1CLaboratoryTest))
+
+    def compute_results(self):
+        result = ProtocolResult()
+        self.in_denominator()
+        return result
+
+
+class ProfilerTest(TestCase):
+
+    def test_spans_nest_and_export_folded_stacks(self):
+        profiler = Profiler(clock=FakeClock(tick=1.0))
+        with profiler:
+            with profiler.span('outer'):
+                with profiler.span('inner'):
+                    pass
+                with profiler.span('inner'):
+                    pass
+
+        # each span reads the clock twice; outer lasts 5 ticks, inners 1
+        self.assertEqual(['outer 3000000', 'outer;inner 2000000'],
+                         profiler.folded())
+        self.assertEqual([('outer', 1, 5.0, 3.0), ('inner', 2, 2.0, 2.0)],
+                         profiler.rows())
+        self.assertIn('inner', profiler.summary())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'out.folded'
+            profiler.write_folded(path)
+            self.assertEqual('outer 3000000\nouter;inner 2000000\n',
+                             path.read_text())
+
+    def test_profiled_is_a_pass_through_when_inactive(self):
+
+        @profiled
+        def add(a, b):
+            return a + b
+
+        self.assertIsNone(active_profiler())
+        self.assertEqual(3, add(1, 2))
+        self.assertIs(PatientRecordSet.find,
+                      vars(PatientRecordSet)['find'])
+
+        with Profiler() as profiler:
+            self.assertEqual(5, add(2, 3))
+        self.assertEqual(1, profiler.rows()[0][1])
+
+    def test_only_one_active_profiler(self):
+        with Profiler():
+            with self.assertRaises(RuntimeError):
+                Profiler().__enter__()
+
+    def test_patches_are_removed(self):
+        find = PatientRecordSet.find
+        with Profiler():
+            self.assertIsNot(find, PatientRecordSet.find)
+        self.assertIs(find, PatientRecordSet.find)
+
+    @patch('requests.adapters.HTTPAdapter.send')
+    def test_http_requests_are_spans(self, send):
+        send.return_value = requests.Response()
+        with Profiler() as profiler:
+            requests.post('https://example.com/hook?x=1', data='{}')
+
+        self.assertEqual(['HTTP POST example.com/hook'],
+                         [row[0] for row in profiler.rows()])
+
+    def test_request_span_names_do_not_contain_ids(self):
+        fumage = 'https://fumage-example.canvasmedical.com'
+        self.assertEqual(
+            'HTTP GET Patient',
+            request_span_name(
+                'get', f'{fumage}/Patient/5350cd20de8a470aa570a852859ac87e'))
+        self.assertEqual(
+            'HTTP GET QuestionnaireResponse',
+            request_span_name(
+                'GET', f'{fumage}/QuestionnaireResponse?patient=Patient/p1'))
+        self.assertEqual(
+            'HTTP POST example.com/patients/{id}/events',
+            request_span_name('post', 'https://example.com/patients/12345/events'))
+
+
+class ProfiledProtocolTest(TestCase):
+
+    def test_protocol_methods_and_queries_are_nested(self):
+        patient = synthetic_patient('small')
+        protocol = A1cProtocol(patient=patient)
+
+        result, profiler = profile_evaluation(protocol)
+
+        self.assertIsInstance(result, ProtocolResult)
+        stacks = [line.rsplit(' ', 1)[0] for line in profiler.folded()]
+        self.assertIn(
+            'A1cProtocol.evaluation;A1cProtocol.compute_results;'
+            'A1cProtocol.in_denominator;LabReportRecordSet.find', stacks)
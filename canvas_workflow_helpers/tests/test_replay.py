@@ -0,0 +1,102 @@
+import json
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+import requests
+
+from canvas_workflow_kit.constants import CHANGE_TYPE
+from canvas_workflow_kit.protocol import ClinicalQualityMeasure, ProtocolResult
+
+from canvas_workflow_helpers.benchmarks import (PROTOCOLS_DIR, load_protocols,
+                                                percentile, read_events,
+                                                replay_events)
+from canvas_workflow_helpers.synthetic import SyntheticPatientGenerator
+from .base import FakeClock
+
+
+class WebhookProtocol(ClinicalQualityMeasure):
+
+    class Meta:
+        title = 'Webhook'
+        version = '1.0.0'
+        compute_on_change_types = [CHANGE_TYPE.APPOINTMENT]
+
+    def compute_results(self):
+        requests.post('https://example.invalid/webhook',
+                      json=self.field_changes)
+        return ProtocolResult()
+
+
+class ReplayTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        root = Path(cls.directory.name)
+        SyntheticPatientGenerator.from_size('small', seed=1).write(
+            root / 'patients', 2)
+        events = [{
+            'change_type': CHANGE_TYPE.CONSENT,
+            'patient': 'patients/patient_00000'
+        }, {
+            'change_type': CHANGE_TYPE.APPOINTMENT,
+            'field_changes': {
+                'model_name': 'appointment',
+                'fields': {
+                    'state': ['BKD', 'CVD']
+                }
+            },
+            'patient': 'patients/patient_00001'
+        }, {
+            'change_type': CHANGE_TYPE.CONSENT,
+            'patient': 'patients/patient_00001'
+        }]
+        cls.events_path = root / 'events.ndjson'
+        cls.events_path.write_text(
+            '\n'.join(json.dumps(event) for event in events) + '\n\n')
+
+        cls.protocols, errors = load_protocols(
+            [PROTOCOLS_DIR / 'patient_grouping.py'])
+        assert not errors, errors
+        cls.protocols['webhook'] = WebhookProtocol
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_dispatch_and_side_effects(self):
+        events = list(read_events(self.events_path))
+        self.assertEqual(3, len(events))
+        self.assertTrue(Path(events[0]['patient']).is_dir())
+
+        report = replay_events(events, self.protocols)
+        self.assertEqual(3, report['events'])
+        self.assertGreater(report['events_per_second'], 0)
+
+        grouping = report['protocols']['patient_grouping.py']
+        self.assertEqual((2, 0, 2), (grouping['evaluations'],
+                                     grouping['errors'], grouping['updates']))
+        webhook = report['protocols']['webhook']
+        self.assertEqual((1, 0, 1), (webhook['evaluations'], webhook['errors'],
+                                     webhook['requests']))
+        self.assertLessEqual(grouping['p50'], grouping['p99'])
+
+    def test_rate(self):
+        clock = FakeClock(tick=0.001)
+        report = replay_events(read_events(self.events_path),
+                               self.protocols,
+                               rate=10,
+                               clock=clock,
+                               sleep=clock.sleep)
+        self.assertEqual(2, len(clock.sleeps))
+        self.assertGreaterEqual(report['elapsed'], 0.2)
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(50.0, percentile(values, 50))
+        self.assertEqual(95.0, percentile(values, 95))
+        self.assertEqual(99.0, percentile(values, 99))
+        self.assertEqual(7.0, percentile([7.0], 99))
+        self.assertIsNone(percentile([], 50))
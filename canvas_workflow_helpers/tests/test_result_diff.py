@@ -0,0 +1,132 @@
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+from canvas_workflow_kit.constants import AlertIntent, AlertPlacement
+from canvas_workflow_kit.intervention import BannerAlertIntervention
+from canvas_workflow_kit.patient import Patient
+from canvas_workflow_kit.protocol import STATUS_DUE, ProtocolResult
+
+from canvas_workflow_helpers.loader import load_protocol_class
+from canvas_workflow_helpers.result_diff import (ResultDiffer,
+                                                 SQLiteResultSnapshotStore,
+                                                 result_hash)
+
+PROTOCOL = (Path(__file__).parent.parent /
+            'protocols/example_protocols/pronoun_banner_alert.py')
+
+
+def banner(narrative):
+    return BannerAlertIntervention(
+        narrative=narrative,
+        placement=[AlertPlacement.ALERT_PLACEMENT_CHART.value],
+        intent=AlertIntent.ALERT_INTENT_INFO.value)
+
+
+def result(*narratives):
+    result = ProtocolResult()
+    result.status = STATUS_DUE
+    for narrative in narratives:
+        result.add_recommendation(banner(narrative))
+    return result
+
+
+def pronoun_patient(pronoun):
+    return Patient({
+        'patient': {
+            'key': 'p1'
+        },
+        'interviews': [{
+            'id': 1,
+            'created': '2022-01-01T10:00:00Z',
+            'noteTimestamp': '2022-01-01T10:00:00Z',
+            'status': 'AC',
+            'committer': 1,
+            'enteredInError': None,
+            'questionnaires': [{
+                'code': 'PRONOUNS',
+                'codeSystem': 'INTERNAL'
+            }],
+            'questions': [{
+                'code': '90778-2',
+                'codeSystem': 'LOINC',
+                'questionResponseId': 11
+            }],
+            'responses': [{
+                'code': 'LA29518-0',
+                'codeSystem': 'LOINC',
+                'questionResponseId': 11,
+                'value': pronoun
+            }],
+            'results': [],
+        }],
+    })
+
+
+class ResultDiffTest(TestCase):
+
+    def test_hash_ignores_recommendation_order(self):
+        self.assertEqual(result_hash(result('a', 'b')),
+                         result_hash(result('b', 'a')))
+        self.assertNotEqual(result_hash(result('a')), result_hash(result('b')))
+        self.assertNotEqual(result_hash(result('a')),
+                            result_hash(result('a'), [{'type': 'x'}]))
+
+    def test_deltas(self):
+        differ = ResultDiffer()
+        delta = differ.diff('Banner', 'p1', result('a', 'b'))
+        self.assertTrue(delta.changed)
+        self.assertTrue(delta.first)
+        self.assertEqual(2, len(delta.added_recommendations))
+
+        self.assertFalse(differ.diff('Banner', 'p1', result('b', 'a')))
+        self.assertTrue(differ.diff('Banner', 'p2', result('a', 'b')))
+
+        delta = differ.diff('Banner', 'p1', result('a', 'c'))
+        self.assertFalse(delta.first)
+        self.assertEqual(['c'],
+                         [r['narrative'] for r in delta.added_recommendations])
+        self.assertEqual(['b'],
+                         [r['narrative'] for r in delta.removed_recommendations])
+        self.assertEqual((3, 1), (differ.changed, differ.unchanged))
+
+        differ.forget('Banner', 'p1')
+        self.assertTrue(differ.diff('Banner', 'p1', result('a', 'c')).first)
+
+    def test_only_new_updates_are_emitted(self):
+        differ = ResultDiffer()
+        add = {'type': 'ADD_PATIENT_TO_GROUP', 'group': 'g1'}
+        remove = {'type': 'REMOVE_PATIENT_FROM_GROUP', 'group': 'g2'}
+        differ.diff('Grouping', 'p1', result(), [add])
+        delta = differ.diff('Grouping', 'p1', result(), [add, remove])
+        self.assertEqual([remove], delta.new_updates)
+
+    def test_evaluate_protocol(self):
+        Protocol = load_protocol_class(PROTOCOL)
+        differ = ResultDiffer()
+
+        _, delta = differ.evaluate(Protocol(patient=pronoun_patient('she/her')))
+        self.assertEqual(['she/her'],
+                         [r['narrative'] for r in delta.added_recommendations])
+        _, delta = differ.evaluate(Protocol(patient=pronoun_patient('she/her')))
+        self.assertFalse(delta.changed)
+        _, delta = differ.evaluate(Protocol(patient=pronoun_patient('they/them')))
+        self.assertEqual(['they/them'],
+                         [r['narrative'] for r in delta.added_recommendations])
+        self.assertEqual(['she/her'],
+                         [r['narrative'] for r in delta.removed_recommendations])
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'results.db')
+            store = SQLiteResultSnapshotStore(path)
+            ResultDiffer(store).diff('Banner', 'p1', result('a'))
+            store.close()
+
+            store = SQLiteResultSnapshotStore(path)
+            self.assertFalse(
+                ResultDiffer(store).diff('Banner', 'p1', result('a')).changed)
+            store.delete('Banner', 'p1')
+            self.assertIsNone(store.get('Banner', 'p1'))
+            store.close()
@@ -0,0 +1,43 @@
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+from canvas_workflow_helpers.result_diff import SQLiteResultSnapshotStore
+from canvas_workflow_helpers.snapshots import (MemorySnapshotStore,
+                                               SnapshotStore,
+                                               SQLiteSnapshotStore)
+
+
+class SQLiteFactStore(SQLiteSnapshotStore):
+    table = 'facts'
+
+
+class SnapshotStoreTest(TestCase):
+
+    def test_base_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            SnapshotStore()
+
+    def test_memory_store(self):
+        store = MemorySnapshotStore()
+        snapshot = {'facts': {'a': 1}}
+        store.put('Protocol', 'p1', snapshot)
+        snapshot['facts']['a'] = 2
+
+        self.assertEqual({'facts': {'a': 1}}, store.get('Protocol', 'p1'))
+        store.delete('Protocol', 'p1')
+        self.assertIsNone(store.get('Protocol', 'p1'))
+
+    def test_stores_sharing_a_file_keep_their_own_table(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'protocols.db')
+            facts = SQLiteFactStore(path)
+            results = SQLiteResultSnapshotStore(path)
+
+            facts.put('Protocol', 'p1', {'facts': {}})
+            self.assertIsNone(results.get('Protocol', 'p1'))
+            results.put('Protocol', 'p1', {'hash': 'abc'})
+            self.assertEqual({'facts': {}}, facts.get('Protocol', 'p1'))
+            facts.close()
+            results.close()
@@ -0,0 +1,39 @@
+import tempfile
+
+from unittest import TestCase
+
+from canvas_workflow_kit.utils import load_local_patient
+
+from canvas_workflow_helpers.synthetic import SyntheticPatientGenerator
+from canvas_workflow_helpers.value_sets.v2021 import (Diabetes,
+                                                      Hba1CLaboratoryTest)
+
+
+class SyntheticPatientGeneratorTest(TestCase):
+
+    def test_same_seed_same_patient(self):
+        first = SyntheticPatientGenerator.from_size('small', seed=7)
+        second = SyntheticPatientGenerator.from_size('small', seed=7)
+        other = SyntheticPatientGenerator.from_size('small', seed=8)
+
+        self.assertEqual(first.generate(3), second.generate(3))
+        self.assertNotEqual(first.generate(3), first.generate(4))
+        self.assertNotEqual(first.generate(3), other.generate(3))
+
+    def test_written_patients_load(self):
+        generator = SyntheticPatientGenerator(seed=1,
+                                              labs=50,
+                                              vitals=30,
+                                              medications=5)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = generator.write(directory, count=20)
+            patients = [load_local_patient(str(path)) for path in paths]
+
+        self.assertEqual(20, len(patients))
+        for patient in patients:
+            self.assertEqual(50, len(patient.lab_reports))
+            self.assertEqual(30, len(patient.vital_signs))
+            self.assertEqual(5, len(patient.medications))
+            self.assertTrue(patient.lab_reports.find(Hba1CLaboratoryTest))
+        self.assertTrue(
+            any(patient.conditions.find(Diabetes) for patient in patients))